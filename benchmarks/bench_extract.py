@@ -0,0 +1,76 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+Compares the streaming head extractor with the old BeautifulSoup path.
+
+Usage::
+
+    python benchmarks/bench_extract.py DIR [--repeat N]
+
+DIR is a directory of saved .html files.  For each parser the total
+time, the time per page and the number of bytes each one had to look at
+are printed.
+"""
+
+import argparse
+import glob
+import os
+import sys
+import time
+
+from bs4 import BeautifulSoup
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from linkpile import extract
+
+
+def soup_title(raw):
+    """What Link.scrape used to do: decode everything, build a full tree.
+    """
+    soup = BeautifulSoup(raw.decode('utf-8', 'replace'), 'html.parser')
+    if soup.find('title') and soup.find('title').contents:
+        return soup.find('title').contents[0]
+    return None
+
+def stream_title(raw):
+    chunks = (
+        raw[n:n+extract.CHUNK_SIZE]
+        for n in range(0, len(raw), extract.CHUNK_SIZE)
+    )
+    data = extract.extract_head(chunks, 'text/html')
+    return data.get('title'), data['bytes_read']
+
+def run(func, corpus, repeat):
+    start = time.perf_counter()
+    for n in range(repeat):
+        for raw in corpus:
+            func(raw)
+    return time.perf_counter() - start
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('directory')
+    parser.add_argument('--repeat', type=int, default=5)
+    args = parser.parse_args()
+    paths = sorted(glob.glob(os.path.join(args.directory, '*.htm*')))
+    if not paths:
+        parser.error('no .html files in %s' % args.directory)
+    corpus = []
+    for path in paths:
+        with open(path, 'rb') as f:
+            corpus.append(f.read())
+    total = sum(len(raw) for raw in corpus)
+    streamed = sum(stream_title(raw)[1] for raw in corpus)
+    pages = len(corpus) * args.repeat
+    print('%s pages, %s bytes' % (len(corpus), total))
+    for name,func,read in [
+            ('beautifulsoup', soup_title, total),
+            ('extract_head', stream_title, streamed)]:
+        elapsed = run(func, corpus, args.repeat)
+        print('%-14s %8.3fs  %8.3fms/page  %10s bytes read' % (
+            name, elapsed, 1000 * elapsed / pages, read
+        ))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,58 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+Compares search backends with the old icontains chain.
+
+Usage::
+
+    python benchmarks/bench_search.py [--links 100000] [--repeat 3]
+
+Fills a temporary SQLite database with synthetic links, builds each
+index and prints the mean time per query for one- to three-word
+queries.
+"""
+
+import argparse
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from benchmarks import django_setup
+
+QUERIES = ['python', 'cache query', 'pyth', 'kaloban', 'feed json', 'zzz']
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--links', type=int, default=100000)
+    parser.add_argument('--repeat', type=int, default=3)
+    parser.add_argument('--backends', default='icontains,sqlite,python')
+    args = parser.parse_args()
+    db_path = django_setup.setup()
+    try:
+        from benchmarks import corpus
+        from linkpile import search
+        start = time.perf_counter()
+        corpus.fill(args.links)
+        print('%s links inserted in %.1fs' % (args.links, time.perf_counter() - start))
+        for name in args.backends.split(','):
+            backend = search.get_backend(name)
+            start = time.perf_counter()
+            backend.rebuild()
+            built = time.perf_counter() - start
+            timings = []
+            for query in QUERIES:
+                start = time.perf_counter()
+                for n in range(args.repeat):
+                    hits = len(backend.search(query))
+                timings.append((query, hits, (time.perf_counter() - start) / args.repeat))
+            print('%-10s index %.2fs' % (name, built))
+            for query,hits,elapsed in timings:
+                print('    %-20s %5s hits  %8.2fms' % (query, hits, elapsed * 1000))
+    finally:
+        os.remove(db_path)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,267 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+Latency, query count and peak memory of linkpile views and model methods.
+
+Usage::
+
+    python runtests.py --bench [--sizes 1k,100k,1m] [--repeat 5] [-o FILE]
+    python benchmarks/bench_suite.py [same options]
+
+Grows one synthetic corpus through each size in turn and runs every case
+(--cases narrows them down by name prefix) against it.  Each case is
+timed once with empty caches ("cold") and --repeat times after that
+("warm"); queries and peak traced memory come from one more untimed run
+of each kind.  Results are printed as JSON (or written to FILE) together
+with the git commit, so runs can be compared across commits.
+"""
+
+import argparse
+from collections import OrderedDict
+import json
+import os
+import platform
+import subprocess
+import sys
+import time
+import tracemalloc
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from benchmarks import django_setup
+
+SIZES = OrderedDict([('1k', 1000), ('100k', 100000), ('1m', 1000000)])
+SCRAPE_URLS = 20
+
+
+def parse_size(text):
+    if text.lower() in SIZES:
+        return SIZES[text.lower()]
+    return int(text)
+
+def percentile(values, p):
+    values = sorted(values)
+    return values[min(int(round(p / 100.0 * (len(values) - 1))), len(values) - 1)]
+
+def git_commit():
+    try:
+        return subprocess.check_output(
+            ['git', 'rev-parse', 'HEAD'], cwd=django_setup.ROOT,
+            stderr=subprocess.DEVNULL,
+        ).decode('ascii').strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+class Case(object):
+    """A named benchmark: func() is the measured call.
+
+    reset() runs before each cold run; the default clears Django's cache.
+    """
+
+    def __init__(self, name, func, reset=None):
+        self.name = name
+        self.func = func
+        self.reset = reset or clear_cache
+
+def clear_cache():
+    from django.core.cache import cache
+    cache.clear()
+
+
+def _timed(func):
+    start = time.perf_counter()
+    func()
+    return time.perf_counter() - start
+
+def _traced(func):
+    """(queries, peak bytes) of one call.
+    """
+    from django.db import connection
+    from django.test.utils import CaptureQueriesContext
+    tracemalloc.start()
+    try:
+        with CaptureQueriesContext(connection) as queries:
+            func()
+        peak = tracemalloc.get_traced_memory()[1]
+    finally:
+        tracemalloc.stop()
+    return len(queries),peak
+
+def measure(case, repeat):
+    """Results of one case, as a dict ready for JSON.
+    """
+    case.reset()
+    cold_seconds = _timed(case.func)
+    case.reset()
+    cold_queries,cold_peak = _traced(case.func)
+    warm = [_timed(case.func) for n in range(repeat)]
+    warm_queries,warm_peak = _traced(case.func)
+    ms = lambda seconds: round(seconds * 1000, 3)
+    return OrderedDict([
+        ('name', case.name),
+        ('cold', OrderedDict([
+            ('ms', ms(cold_seconds)),
+            ('queries', cold_queries),
+            ('peak_bytes', cold_peak),
+        ])),
+        ('warm', OrderedDict([
+            ('min_ms', ms(min(warm))),
+            ('median_ms', ms(percentile(warm, 50))),
+            ('p95_ms', ms(percentile(warm, 95))),
+            ('mean_ms', ms(sum(warm) / len(warm))),
+            ('queries', warm_queries),
+            ('peak_bytes', warm_peak),
+        ])),
+    ])
+
+
+def view_cases():
+    from django.contrib.auth.models import User
+    from django.core.urlresolvers import reverse
+    from django.test import Client
+    from benchmarks.corpus import DOMAINS, TAGS
+    from linkpile.models import Link
+
+    anonymous = Client()
+    staff = Client()
+    staff.force_login(User.objects.get(username='bench'))
+    public = Link.objects.visible_to(None).order_by('id')
+    middle = public.filter(id__gte=Link.objects.count() // 2).first() or public.first()
+
+    def get(client, url, **extra):
+        def func():
+            response = client.get(url, **extra)
+            assert response.status_code in (200, 302), (url, response.status_code)
+            if response.streaming:
+                for chunk in response.streaming_content:
+                    pass
+        return func
+
+    index = reverse('linkpile-index')
+    return [
+        Case('view:index', get(anonymous, index)),
+        Case('view:index:staff', get(staff, index)),
+        Case('view:index:page10', get(anonymous, index + '?page=10')),
+        Case('view:search', get(anonymous, index + '?keywords=python+cache')),
+        Case('view:tags', get(anonymous, reverse('linkpile-tags', args=[TAGS[0]]))),
+        Case('view:tags:pair', get(anonymous, reverse('linkpile-tags', args=['%s+%s' % tuple(TAGS[:2])]))),
+        Case('view:tagcloud', get(anonymous, reverse('linkpile-tagcloud'))),
+        Case('view:related', get(anonymous, reverse('linkpile-related', args=[TAGS[0]]))),
+        Case('view:detail', get(anonymous, middle.absolute_url())),
+        Case('view:domain', get(anonymous, reverse('linkpile-domain', args=[DOMAINS[1]]))),
+        Case('view:random', get(anonymous, reverse('linkpile-random'))),
+        Case('view:feed', get(anonymous, reverse('linkpile-feed'))),
+        Case('view:feed:atom', get(anonymous, reverse('linkpile-feed-atom'))),
+        Case('view:feed:json', get(anonymous, reverse('linkpile-feed-json'))),
+        Case('view:export', get(staff, reverse('linkpile-export') + '?format=ndjson')),
+    ]
+
+def model_cases(server):
+    from linkpile import scrapecache
+    from linkpile.models import Link, ScrapeCache
+
+    links = list(Link.objects.select_related('user').order_by('id')[:1000])
+    middle = links[len(links) // 2]
+    records = [link.to_dict() for link in links]
+    urls = [server.url('/page/%s' % n) for n in range(SCRAPE_URLS)]
+
+    def from_dict():
+        users = {}
+        for record in records:
+            Link.from_dict(record, users)
+
+    def scrape():
+        for url in urls:
+            Link.scrape(url)
+
+    def reset_scrape():
+        ScrapeCache.objects.all().delete()
+        scrapecache.reset()
+
+    return [
+        Case('model:get_random', lambda: Link.get_random()),
+        Case('model:get_random:staff', lambda: Link.get_random(middle.user)),
+        Case('model:others_in_domain', lambda: middle.others_in_domain()),
+        Case('model:from_dict:x1000', from_dict),
+        Case('model:to_dict:x1000', lambda: [link.to_dict() for link in links]),
+        Case('model:scrape:x%s' % SCRAPE_URLS, scrape, reset=reset_scrape),
+    ]
+
+def run_size(count, repeat=5, cases=None, start=0, batch_size=2000):
+    """Grows the corpus to count links and runs the cases against it.
+
+    start is the number of links already in the database.
+    """
+    from django.db import connection
+    from benchmarks import corpus
+    from tests.httpserver import LocalHTTPServer
+
+    begin = time.perf_counter()
+    if count > start:
+        corpus.fill(count - start, batch_size=batch_size, start=start)
+    fill_seconds = time.perf_counter() - begin
+    page = (
+        '<html><head><title>Benchmark page</title>'
+        '<meta name="description" content="A page to scrape."></head>'
+        '<body>%s</body></html>' % ('text ' * 2000)
+    )
+    server = LocalHTTPServer({
+        '/page/%s' % n: (200, {}, page) for n in range(SCRAPE_URLS)
+    }).start()
+    try:
+        results = []
+        for case in view_cases() + model_cases(server):
+            if cases and not any(case.name.startswith(prefix) for prefix in cases):
+                continue
+            results.append(measure(case, repeat))
+    finally:
+        server.stop()
+    return OrderedDict([
+        ('links', count),
+        ('database', connection.vendor),
+        ('fill_seconds', round(fill_seconds, 3)),
+        ('results', results),
+    ])
+
+def run(sizes, repeat=5, cases=None, batch_size=2000):
+    """Results for each corpus size, smallest first, with run metadata.
+    """
+    import django
+    report = OrderedDict([
+        ('commit', git_commit()),
+        ('python', platform.python_version()),
+        ('django', django.get_version()),
+        ('repeat', repeat),
+        ('sizes', []),
+    ])
+    start = 0
+    for count in sorted(sizes):
+        report['sizes'].append(run_size(count, repeat, cases, start, batch_size))
+        start = max(start, count)
+    return report
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--sizes', default='1k', help='Comma-separated: 1k, 100k, 1m or a number.')
+    parser.add_argument('--repeat', type=int, default=5)
+    parser.add_argument('--cases', default='', help='Comma-separated case name prefixes.')
+    parser.add_argument('--batch-size', type=int, default=2000)
+    parser.add_argument('-o', '--output', default=None, help='Write JSON here instead of stdout.')
+    args = parser.parse_args(argv)
+    sizes = [parse_size(size) for size in args.sizes.split(',')]
+    cases = [prefix for prefix in args.cases.split(',') if prefix]
+    db_path = django_setup.setup()
+    try:
+        report = run(sizes, args.repeat, cases, args.batch_size)
+    finally:
+        os.remove(db_path)
+    text = json.dumps(report, indent=2)
+    if args.output:
+        with open(args.output, 'w') as f:
+            f.write(text + '\n')
+    else:
+        print(text)
+
+
+if __name__ == '__main__':
+    main()
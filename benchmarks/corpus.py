@@ -0,0 +1,63 @@
+# -*- coding: utf-8 -*-
+"""
+Synthetic Link corpora for benchmarks.
+"""
+
+from datetime import datetime, timedelta
+import random
+
+from django.utils.timezone import utc
+
+WORDS = (
+    'python django web link pile archive search index cache query fast slow '
+    'database table column row tag cloud feed atom rss json export import '
+    'random domain user public private friends family title description '
+    'scrape fetch http https server client browser mirror article blog news '
+    'science history music film book review recipe travel photo video code'
+).split()
+SYLLABLES = 'ka lo mi nu pe ra si to vu xe ban cor dil fen gor'.split()
+# a long tail of rarer made-up words after the common ones
+VOCABULARY = WORDS + sorted(set(
+    a + b + c for a in SYLLABLES for b in SYLLABLES for c in SYLLABLES
+))
+TAGS = WORDS[:40]
+DOMAINS = ['example%s.com' % n for n in range(200)] + ['news.site', 'blog.site']
+
+
+def make_links(user, count, seed=0, start=0):
+    """Unsaved Links with words, tags and domains drawn from small pools.
+
+    Domains and tags follow a skewed distribution, as real piles do.
+    Links are numbered from start, so a corpus can be grown in steps.
+    """
+    from linkpile.models import Link
+    rng = random.Random(seed + start)
+    word = lambda: VOCABULARY[int(rng.paretovariate(0.8)) % len(VOCABULARY)]
+    epoch = datetime(2010, 1, 1, tzinfo=utc)
+    for n in range(start, start + count):
+        domain = DOMAINS[int(rng.paretovariate(1.2)) % len(DOMAINS)]
+        tags = sorted(set(
+            TAGS[int(rng.paretovariate(1.0)) % len(TAGS)]
+            for i in range(rng.randint(0, 4))
+        ))
+        link = Link(
+            user=user,
+            title=' '.join(word() for i in range(rng.randint(2, 8))),
+            description=' '.join(word() for i in range(rng.randint(0, 40))),
+            url='https://%s/%s/%s' % (domain, word(), n),
+            date=epoch + timedelta(minutes=n * 7),
+            public=rng.random() < 0.7,
+            friends=rng.random() < 0.1,
+            family=rng.random() < 0.1,
+            tags=' '.join(tags),
+        )
+        yield link
+
+def fill(count, batch_size=2000, seed=0, start=0):
+    """Inserts count synthetic Links (with tags) through the importer.
+    """
+    from django.contrib.auth.models import User
+    from linkpile import importer
+    user,created = User.objects.get_or_create(username='bench', defaults={'is_staff': True})
+    records = (link.to_dict() for link in make_links(user, count, seed, start))
+    return importer.Importer(batch_size=batch_size).run(records)
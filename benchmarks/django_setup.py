@@ -0,0 +1,30 @@
+# -*- coding: utf-8 -*-
+"""
+Django settings for benchmarks: the test settings from runtests.py with
+a throwaway on-disk SQLite database, migrated and ready to fill.
+"""
+
+import os
+import sys
+import tempfile
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def setup(db_path=None):
+    """Configures Django and migrates; returns the database path.
+    """
+    if ROOT not in sys.path:
+        sys.path.insert(0, ROOT)
+    if db_path is None:
+        fd,db_path = tempfile.mkstemp(prefix='linkpile-bench-', suffix='.sqlite3')
+        os.close(fd)
+    from django.conf import settings
+    if not settings.configured:
+        import runtests  # configures settings
+    settings.DATABASES['default']['NAME'] = db_path
+    settings.DEBUG = False
+    settings.ALLOWED_HOSTS = ['testserver']  # django.test.Client's host
+    from django.core.management import call_command
+    call_command('migrate', verbosity=0)
+    return db_path
@@ -1,6 +1,7 @@
-from django.contrib import admin
+from django.contrib import admin, messages
 
 from linkpile.models import Link
+from linkpile.urlnorm import url_hash
 
 class LinkAdmin( admin.ModelAdmin ):
     list_display = ['date', 'shared', 'public', 'friends', 'family', 'title',]
@@ -9,4 +10,23 @@ class LinkAdmin( admin.ModelAdmin ):
     list_filter = ['public',]
     search_fields = ['title', 'description', 'url', 'tags',]
 
+    def get_search_results( self, request, queryset, search_term ):
+        """Searching for a URL finds every spelling of it via url_hash.
+        """
+        if search_term.strip().startswith(('http://', 'https://')):
+            return queryset.filter(url_hash=url_hash(search_term)),False
+        return super(LinkAdmin, self).get_search_results(request, queryset, search_term)
+
+    def save_model( self, request, obj, form, change ):
+        super(LinkAdmin, self).save_model(request, obj, form, change)
+        others = Link.objects.filter(url_hash=obj.url_hash).exclude(id=obj.id)
+        if others.exists():
+            messages.warning(
+                request,
+                'Other links point to the same page: %s' % ', '.join(
+                    str(pk) for pk in others.values_list('id', flat=True)
+                ),
+                fail_silently=True,
+            )
+
 admin.site.register(Link, LinkAdmin)
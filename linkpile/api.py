@@ -0,0 +1,289 @@
+# -*- coding: utf-8 -*-
+"""Bulk JSON API for creating, updating and deleting links.
+
+POST /api/links/ with an `Authorization: Token <key>` header (see
+ApiToken and `manage.py linkpile_token`) and a body like::
+
+    {"atomic": false, "operations": [
+        {"op": "create", "link": {"url": "https://example.com/", "tags": "a b"}},
+        {"op": "update", "id": 12, "link": {"public": true}, "add_tags": "c"},
+        {"op": "delete", "id": 13}
+    ]}
+
+"link" holds fields in the Link.to_dict() format, checked with
+LinkApiForm.  An update changes only the fields it names, plus
+add_tags/remove_tags; a create whose URL is already in the pile (see
+Link.find_duplicate) is refused with the existing link's id.
+
+Valid operations are applied in one transaction: creates with one
+bulk_create and the importer's bulk tagging, updates as one UPDATE per
+distinct set of changed columns and values (so "make these 200 links
+public" is one query), deletes as one DELETE.  With "atomic":
+true nothing is written unless every operation is valid.  The response
+has one result per operation, in order.
+"""
+
+from collections import Counter, defaultdict
+import json
+
+from django.conf import settings
+from django.contrib.contenttypes.models import ContentType
+from django.db import transaction
+from django.utils import timezone
+
+from tagging.models import Tag, TaggedItem
+from tagging.utils import edit_string_for_tags, parse_tag_input
+
+from linkpile.forms import LinkApiForm
+from linkpile.importer import Importer
+from linkpile.models import Link, parse_date
+from linkpile.signals import links_bulk_saved, saving_link
+from linkpile.tagstats import tag_names
+
+FIELDS = ['url', 'title', 'description', 'tags', 'date', 'family', 'friends', 'public', 'shared']
+DEFAULTS = {
+    'title': '', 'description': '', 'tags': '', 'date': None,
+    'family': False, 'friends': False, 'public': False, 'shared': True,
+}
+# set by Link.fill_computed_fields
+COMPUTED_FIELDS = ['domain', 'url_hash', 'visibility', 'simhash', 'scrape_status']
+OPERATIONS = ['create', 'update', 'delete']
+
+
+class BadRequest(Exception):
+    """The request as a whole cannot be used.
+    """
+
+class OperationError(Exception):
+    """One operation is invalid; errors is {field: [messages]}.
+    """
+
+    def __init__(self, errors, status='error'):
+        super(OperationError, self).__init__(errors)
+        self.errors = errors
+        self.status = status
+
+
+def token_key(request):
+    """The key from an `Authorization: Token <key>` (or Bearer) header.
+    """
+    scheme,_,key = request.META.get('HTTP_AUTHORIZATION', '').partition(' ')
+    if scheme.lower() in ['token', 'bearer']:
+        return key.strip()
+    return None
+
+def parse_body(body):
+    """(operations, atomic) from a request body.
+    """
+    try:
+        data = json.loads(body.decode('utf-8'))
+    except (UnicodeDecodeError, ValueError):
+        raise BadRequest('Body is not JSON.')
+    if isinstance(data, list):
+        data = {'operations': data}
+    if not (isinstance(data, dict) and isinstance(data.get('operations'), list)):
+        raise BadRequest('Expected {"operations": [...]}.')
+    limit = getattr(settings, 'LINKPILE_API_MAX_OPERATIONS', 1000)
+    if len(data['operations']) > limit:
+        raise BadRequest('At most %s operations per request.' % limit)
+    return data['operations'],bool(data.get('atomic', False))
+
+def form_data(fields, user):
+    """Form data from the "link" of an operation.
+    """
+    if not isinstance(fields, dict):
+        raise OperationError({'link': ['Expected an object.']})
+    unknown = set(fields.keys()) - set(FIELDS) - set(['user'])
+    if unknown:
+        raise OperationError({'link': ['Unknown fields: %s' % ', '.join(sorted(unknown))]})
+    if fields.get('user', user.username) != user.username:
+        raise OperationError({'user': ['Links can only be written as %s.' % user.username]})
+    data = {name: fields[name] for name in FIELDS if name in fields}
+    if isinstance(data.get('date'), str):
+        try:
+            data['date'] = parse_date(data['date'])
+        except (ValueError, OverflowError):
+            raise OperationError({'date': ['Enter a valid date/time.']})
+    return data
+
+def validate(data):
+    form = LinkApiForm(data)
+    if not form.is_valid():
+        raise OperationError({
+            field: [str(error) for error in errors]
+            for field,errors in form.errors.items()
+        })
+    return form.cleaned_data
+
+def retag(tags, add='', remove=''):
+    """tags with the tags in add added and those in remove taken away.
+    """
+    names = parse_tag_input(tags or '')
+    names += [name for name in parse_tag_input(add or '') if name not in names]
+    removed = set(parse_tag_input(remove or ''))
+    return edit_string_for_tags([Tag(name=name) for name in names if name not in removed])
+
+def link_result(link):
+    result = link.to_dict()
+    result['id'] = link.id
+    return result
+
+
+class Batch(object):
+    """The operations of one request, checked and then written together.
+    """
+
+    def __init__(self, user):
+        self.user = user
+        self.creates = []
+        self.updates = []
+        self.deletes = []
+        self.results = []
+        self.now = timezone.now()
+
+    def run(self, operations, atomic=False):
+        """Returns a result dict per operation.
+
+        Call inside a transaction.
+        """
+        ids = [
+            op.get('id') for op in operations
+            if isinstance(op, dict) and isinstance(op.get('id'), int)
+        ]
+        self.links = Link.objects.select_for_update().select_related('user').in_bulk(ids)
+        self.claimed = set()
+        for index,op in enumerate(operations):
+            result = {'index': index, 'op': op.get('op') if isinstance(op, dict) else None}
+            try:
+                self.prepare(op, result)
+            except OperationError as err:
+                result['status'] = err.status
+                result['errors'] = err.errors
+            self.results.append(result)
+        self.check_duplicates()
+        failed = any('errors' in result for result in self.results)
+        if atomic and failed:
+            for result in self.results:
+                if 'errors' not in result:
+                    result['status'] = 'skipped'
+                    result.pop('link', None)
+        else:
+            self.write()
+        return self.results
+
+    def prepare(self, op, result):
+        if not isinstance(op, dict) or op.get('op') not in OPERATIONS:
+            raise OperationError({'op': ['Expected one of: %s' % ', '.join(OPERATIONS)]})
+        if op['op'] == 'create':
+            data = dict(DEFAULTS)
+            data.update(form_data(op.get('link', {}), self.user))
+            cleaned = validate(data)
+            link = Link(user=self.user, **{name: cleaned[name] for name in FIELDS})
+            link.fill_computed_fields()
+            self.creates.append((result, link))
+            result['status'] = 'created'
+            return
+        link = self.claim(op.get('id'))
+        result['id'] = link.id
+        if op['op'] == 'delete':
+            self.deletes.append(link)
+            result['status'] = 'deleted'
+            return
+        current = {name: getattr(link, name) for name in FIELDS}
+        data = dict(current)
+        data.update(form_data(op.get('link', {}), self.user))
+        if op.get('add_tags') or op.get('remove_tags'):
+            data['tags'] = retag(data['tags'], op.get('add_tags'), op.get('remove_tags'))
+        cleaned = validate(data)
+        changed = [name for name in FIELDS if not self.same(name, current[name], cleaned[name])]
+        for name in changed:
+            setattr(link, name, cleaned[name])
+        if changed:
+            computed = {name: getattr(link, name) for name in COMPUTED_FIELDS}
+            link.fill_computed_fields()
+            changed += [name for name in COMPUTED_FIELDS if getattr(link, name) != computed[name]]
+            link.modified = self.now
+            self.updates.append((link, changed + ['modified']))
+        result['status'] = 'updated' if changed else 'unchanged'
+        result['link'] = link_result(link)
+
+    def claim(self, link_id):
+        if link_id not in self.links:
+            raise OperationError({'id': ['No link with this id.']}, status='not_found')
+        if link_id in self.claimed:
+            raise OperationError({'id': ['Link already changed in this request.']})
+        link = self.links[link_id]
+        if not link.can_edit(self.user):
+            raise OperationError({'id': ['Not allowed to change this link.']}, status='forbidden')
+        self.claimed.add(link_id)
+        # TagField would query tagging for the string already in the row
+        link.tags = link.__dict__.get('tags') or ''
+        return link
+
+    @staticmethod
+    def same(name, old, new):
+        if name == 'tags':
+            return tag_names(old) == tag_names(new)
+        if name in ['title', 'description']:
+            return (old or '') == (new or '')
+        return old == new
+
+    def check_duplicates(self):
+        """Refuses creates whose URL is in the pile or earlier in the batch.
+        """
+        if not self.creates:
+            return
+        existing = dict(Link.objects.filter(
+            url_hash__in=set(link.url_hash for result,link in self.creates)
+        ).order_by('-id').values_list('url_hash', 'id'))
+        creates = []
+        for result,link in self.creates:
+            if link.url_hash in existing:
+                result['status'] = 'duplicate'
+                result['id'] = existing[link.url_hash]
+                result['errors'] = {'url': ['This page is already in the pile.']}
+                continue
+            existing[link.url_hash] = None  # id unknown until written
+            creates.append((result, link))
+        self.creates = creates
+
+    def write(self):
+        ctype = ContentType.objects.get_for_model(Link)
+        importer = Importer()
+        if self.deletes:
+            ids = [link.id for link in self.deletes]
+            Link.objects.filter(id__in=ids).delete()
+            with saving_link():
+                TaggedItem.objects.filter(content_type=ctype, object_id__in=ids).delete()
+        created = [link for result,link in self.creates]
+        if created:
+            importer.bulk_create(created)
+            with saving_link():
+                importer.bulk_tag(created)
+            for result,link in self.creates:
+                result['id'] = link.id
+                result['link'] = link_result(link)
+        ids_by_values = defaultdict(list)
+        for link,changed in self.updates:
+            values = tuple(sorted((name, link.__dict__[name]) for name in changed))
+            ids_by_values[values].append(link.id)
+        for values,ids in ids_by_values.items():
+            Link.objects.filter(id__in=ids).update(**dict(values))
+        retagged = [link for link,changed in self.updates if 'tags' in changed]
+        if retagged:
+            with saving_link():
+                TaggedItem.objects.filter(
+                    content_type=ctype, object_id__in=[link.id for link in retagged]
+                ).delete()
+                importer.bulk_tag(retagged)
+        written = created + [link for link,changed in self.updates]
+        if written:
+            links_bulk_saved.send(sender=Link, links=written)
+
+
+def apply(user, operations, atomic=False):
+    """Runs the operations as user; returns (results, counts by status).
+    """
+    with transaction.atomic():
+        results = Batch(user).run(operations, atomic)
+    return results,dict(Counter(result['status'] for result in results))
@@ -0,0 +1,12 @@
+from django.apps import AppConfig
+
+
+class LinkpileConfig(AppConfig):
+    name = 'linkpile'
+
+    def ready(self):
+        # connect signal receivers
+        from linkpile import (
+            autocomplete, conditional, domains, duplicates, feeds, fragments, randomlinks,
+            related, search, snapshots, tagstats,
+        )
@@ -0,0 +1,227 @@
+# -*- coding: utf-8 -*-
+"""Prefix suggestions for tags and title words.
+
+Each process keeps two indexes, one of tag names and one of the words in
+link titles, each a sorted list of terms with a count per viewer class:
+how many links that class may see use the tag or have the word in their
+title.  A prefix's terms are one slice of the list, found by bisection,
+and the most used come first.  The best terms for prefixes of up to
+TOP_PREFIX characters, which match the most terms, are remembered until
+a term under them changes.
+
+The indexes are built from TagStat and the link titles on first use and
+updated as links are saved or deleted in this process.  Bulk writes and
+tags changed on their own drop them, to be rebuilt on the next query.
+Like the 'python' search backend, each process only sees its own writes,
+so the indexes are also rebuilt after LINKPILE_AUTOCOMPLETE_TTL seconds
+(default 300).
+"""
+
+from bisect import bisect_left, insort
+import heapq
+import threading
+import time
+
+from django.conf import settings
+from django.contrib.contenttypes.models import ContentType
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+
+from tagging.models import TaggedItem
+
+from linkpile.models import Link, SCRAPE_FAILED_TITLE, TagStat, VIEWER_CLASSES, viewer_class
+from linkpile.search import tokenize
+from linkpile.signals import in_link_save, links_bulk_saved
+from linkpile.tagstats import tag_names, visible_classes
+
+KINDS = ['tags', 'words']
+TOP_PREFIX = 2
+MAX_LIMIT = 50
+# sorts after every term starting with a prefix
+LAST_CHAR = '\U0010ffff'
+
+
+class PrefixIndex(object):
+    """Sorted terms, each with a count per viewer class.
+    """
+
+    def __init__(self, counts=None, labels=None):
+        self.counts = dict(counts or {})  # term: (public, member, staff)
+        self.labels = dict(labels or {})  # term: suggestion, if not the term
+        self.terms = sorted(self.counts)
+        self._top = {}  # short prefix: {column: best terms}
+
+    def add(self, term, deltas, label=None):
+        """Adds deltas (one per viewer class) to the counts of term.
+        """
+        old = self.counts.get(term)
+        counts = tuple(a + b for a,b in zip(old or (0,) * len(deltas), deltas))
+        if max(counts) <= 0:
+            if old is not None:
+                del self.counts[term]
+                self.labels.pop(term, None)
+                del self.terms[bisect_left(self.terms, term)]
+        else:
+            if old is None:
+                insort(self.terms, term)
+                if label and (label != term):
+                    self.labels[term] = label
+            self.counts[term] = counts
+        for n in range(1, TOP_PREFIX + 1):
+            self._top.pop(term[:n], None)
+
+    def complete(self, prefix, column, limit):
+        """[(suggestion, count)] for terms starting with prefix, most used first.
+        """
+        if len(prefix) > TOP_PREFIX:
+            return self._best(prefix, column, limit)
+        top = self._top.setdefault(prefix, {})
+        if column not in top:
+            top[column] = self._best(prefix, column, MAX_LIMIT)
+        return top[column][:limit]
+
+    def _best(self, prefix, column, limit):
+        lo = bisect_left(self.terms, prefix)
+        hi = bisect_left(self.terms, prefix + LAST_CHAR, lo)
+        counts = self.counts
+        best = heapq.nsmallest(limit, (
+            (-counts[term][column], term) for term in self.terms[lo:hi]
+            if counts[term][column] > 0
+        ))
+        return [(self.labels.get(term, term), -count) for count,term in best]
+
+
+def title_words(title):
+    if (not title) or (title == SCRAPE_FAILED_TITLE):
+        return []
+    return sorted(set(word for word in tokenize(title) if len(word) > 1))
+
+def _deltas(visibility, sign):
+    classes = visible_classes(visibility)
+    return tuple(sign if vclass in classes else 0 for vclass in VIEWER_CLASSES)
+
+
+class Autocomplete(object):
+    """The tag and word indexes of this process.
+    """
+
+    def __init__(self):
+        self._lock = threading.RLock()
+        self.indexes = None
+        self._built = 0
+
+    def _ttl(self):
+        return getattr(settings, 'LINKPILE_AUTOCOMPLETE_TTL', 300)
+
+    def _ensure(self):
+        if (self.indexes is None) or (time.time() - self._built > self._ttl()):
+            self.rebuild()
+
+    def rebuild(self):
+        tags = {}
+        labels = {}
+        for name,public,member,staff in TagStat.objects.values_list(
+            'name', 'public_count', 'member_count', 'staff_count'
+        ).iterator():
+            term = name.lower()
+            counts = tags.get(term, (0, 0, 0))
+            tags[term] = (counts[0] + public, counts[1] + member, counts[2] + staff)
+            if term != name:
+                labels.setdefault(term, name)
+        words = {}
+        for title,visibility in Link.objects.values_list('title', 'visibility').iterator():
+            deltas = _deltas(visibility, 1)
+            for word in title_words(title):
+                counts = words.get(word, (0, 0, 0))
+                words[word] = tuple(a + b for a,b in zip(counts, deltas))
+        with self._lock:
+            self.indexes = {
+                'tags': PrefixIndex(
+                    ((term, counts) for term,counts in tags.items() if max(counts) > 0), labels
+                ),
+                'words': PrefixIndex(
+                    (word, counts) for word,counts in words.items() if max(counts) > 0
+                ),
+            }
+            self._built = time.time()
+
+    def invalidate(self):
+        with self._lock:
+            self.indexes = None
+
+    def change(self, old, new):
+        """Moves one link's counts from old to new (title, tags, visibility).
+
+        Either may be None, for a link created or deleted.
+        """
+        with self._lock:
+            if self.indexes is None:
+                return  # built from the database on first query
+            for state,sign in [(old, -1), (new, 1)]:
+                if state is None:
+                    continue
+                title,tags,visibility = state
+                deltas = _deltas(visibility, sign)
+                for name in tag_names(tags):
+                    self.indexes['tags'].add(name.lower(), deltas, label=name)
+                for word in title_words(title):
+                    self.indexes['words'].add(word, deltas)
+
+    def complete(self, prefix, viewer=None, kinds=KINDS, limit=10):
+        """{kind: [(suggestion, count)]} for prefix, as viewer may see them.
+        """
+        prefix = prefix.strip().lower()
+        if not prefix:
+            return {kind: [] for kind in kinds}
+        column = VIEWER_CLASSES.index(viewer if viewer in VIEWER_CLASSES else viewer_class(viewer))
+        limit = min(limit, MAX_LIMIT)
+        with self._lock:
+            self._ensure()
+            return {
+                kind: self.indexes[kind].complete(prefix, column, limit)
+                for kind in kinds
+            }
+
+completer = Autocomplete()
+
+
+def complete(prefix, viewer=None, kinds=KINDS, limit=10):
+    """Tags and title words starting with prefix, most used first.
+
+    See Autocomplete.complete.
+    """
+    return completer.complete(prefix, viewer, kinds, limit)
+
+
+def _db_state(link):
+    """(title, tags, visibility) as stored before the current write, or None.
+    """
+    if not hasattr(link, '_db_title'):
+        return None  # created
+    tags = getattr(link, '_db_tags', None)
+    if tags is None:
+        tags = link.__dict__.get('tags')
+    return link._db_title,tags,getattr(link, '_db_visibility', link.visibility)
+
+@receiver(post_save, sender=Link)
+def link_saved(sender, instance, created=False, **kwargs):
+    old = None if created else _db_state(instance)
+    completer.change(old, (instance.title, instance.tags, instance.visibility))
+
+@receiver(post_delete, sender=Link)
+def link_deleted(sender, instance, **kwargs):
+    completer.change(
+        _db_state(instance) or (instance.title, instance.tags, instance.visibility), None
+    )
+
+@receiver(links_bulk_saved, sender=Link)
+def links_bulk_written(sender, links, **kwargs):
+    completer.invalidate()
+
+@receiver(post_save, sender=TaggedItem)
+@receiver(post_delete, sender=TaggedItem)
+def tags_changed(sender, instance, **kwargs):
+    if in_link_save():
+        return  # counted by link_saved
+    if instance.content_type_id == ContentType.objects.get_for_model(Link).id:
+        completer.invalidate()
@@ -0,0 +1,120 @@
+# -*- coding: utf-8 -*-
+"""Conditional GET for the HTML pages, keyed on a global pile version.
+
+The pile version is a random seed plus a counter, kept in Django's cache
+with the time of the last change.  Saving, deleting, bulk-writing or
+retagging any link (and recording link checks or snapshots) bumps the
+counter, which changes every page's ETag at once.
+
+Views wrapped in conditional_page() send that ETag and the time of the
+last change as Last-Modified, and answer a matching If-None-Match or
+If-Modified-Since with a 304 before running the view.  The ETag also
+covers the viewer's class and id and the full path with its query
+string, so pages never leak between users or variants; the responses
+are marked private.  LINKPILE_CONDITIONAL_GET = False turns this off.
+"""
+
+from calendar import timegm
+from functools import wraps
+import hashlib
+import uuid
+
+from django.conf import settings
+from django.contrib.contenttypes.models import ContentType
+from django.core.cache import cache
+from django.db.models import Max
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+from django.utils import timezone
+from django.utils.cache import get_conditional_response, patch_cache_control, patch_vary_headers
+from django.utils.http import http_date
+
+from tagging.models import TaggedItem
+
+from linkpile.models import Link, Snapshot, viewer_class
+from linkpile.signals import in_link_save, links_bulk_saved
+
+SEED_KEY = 'linkpile:pile:seed'
+COUNTER_KEY = 'linkpile:pile:counter'
+MODIFIED_KEY = 'linkpile:pile:modified'
+
+
+def enabled():
+    return getattr(settings, 'LINKPILE_CONDITIONAL_GET', True)
+
+def _reset():
+    """Starts a new series of versions, e.g. after the cache was cleared.
+    """
+    newest = Link.objects.aggregate(newest=Max('modified'))['newest']
+    state = {
+        SEED_KEY: uuid.uuid4().hex,
+        COUNTER_KEY: 0,
+        MODIFIED_KEY: newest or timezone.now(),
+    }
+    cache.set_many(state, None)
+    return state
+
+def pile_version():
+    """(version string, time of the last change).
+    """
+    state = cache.get_many([SEED_KEY, COUNTER_KEY, MODIFIED_KEY])
+    if len(state) < 3:
+        state = _reset()
+    return '%s.%s' % (state[SEED_KEY], state[COUNTER_KEY]),state[MODIFIED_KEY]
+
+def bump():
+    """Marks the pile as changed.
+    """
+    try:
+        cache.incr(COUNTER_KEY)
+    except ValueError:
+        _reset()  # a fresh seed is as good as a bump
+    cache.set(MODIFIED_KEY, timezone.now(), None)
+
+def page_etag(request, version):
+    user = getattr(request, 'user', None)
+    user_id = user.pk if (user is not None) and user.is_authenticated else ''
+    key = '%s %s %s %s' % (version, viewer_class(user), user_id, request.get_full_path())
+    return '"%s"' % hashlib.md5(key.encode('utf-8')).hexdigest()
+
+def conditional_page(view):
+    """Adds ETag/Last-Modified from the pile version and answers 304s.
+    """
+    @wraps(view)
+    def wrapper(request, *args, **kwargs):
+        if (request.method not in ['GET', 'HEAD']) or not enabled():
+            return view(request, *args, **kwargs)
+        version,modified = pile_version()
+        etag = page_etag(request, version)
+        last_modified = timegm(modified.utctimetuple())
+        response = get_conditional_response(request, etag=etag, last_modified=last_modified)
+        if response is None:
+            response = view(request, *args, **kwargs)
+            if response.status_code != 200:
+                return response
+        response['ETag'] = etag
+        response['Last-Modified'] = http_date(last_modified)
+        patch_cache_control(response, private=True, no_cache=True)
+        patch_vary_headers(response, ['Cookie'])
+        return response
+    return wrapper
+
+
+@receiver(post_save, sender=Link)
+@receiver(post_delete, sender=Link)
+@receiver(post_save, sender=Snapshot)
+@receiver(post_delete, sender=Snapshot)
+def link_changed(sender, **kwargs):
+    bump()
+
+@receiver(links_bulk_saved, sender=Link)
+def links_bulk_written(sender, links, **kwargs):
+    bump()
+
+@receiver(post_save, sender=TaggedItem)
+@receiver(post_delete, sender=TaggedItem)
+def tags_changed(sender, instance, **kwargs):
+    if in_link_save():
+        return  # bumped by link_changed
+    if instance.content_type_id == ContentType.objects.get_for_model(Link).id:
+        bump()
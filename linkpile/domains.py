@@ -0,0 +1,56 @@
+# -*- coding: utf-8 -*-
+"""Cached per-domain link counts.
+
+Counts are kept in the Django cache per (viewer class, domain) and
+dropped whenever a link in the domain is saved or deleted.
+"""
+
+import hashlib
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+
+from linkpile.models import Link, VIEWER_CLASSES, viewer_class
+from linkpile.signals import links_bulk_saved
+
+CACHE_KEY = 'linkpile:domain:%s:%s'
+
+
+def _key(domain, vclass):
+    # domains can be longer than memcached allows in a key
+    return CACHE_KEY % (vclass, hashlib.md5(domain.encode('utf-8')).hexdigest())
+
+def domain_count(domain, viewer=None):
+    """Number of links in domain that viewer may see.
+    """
+    vclass = viewer if viewer in VIEWER_CLASSES else viewer_class(viewer)
+    key = _key(domain, vclass)
+    count = cache.get(key)
+    if count is None:
+        count = Link.objects.filter(domain=domain).visible_to(vclass).count()
+        cache.set(key, count, getattr(settings, 'LINKPILE_DOMAIN_CACHE_TIMEOUT', 3600))
+    return count
+
+def invalidate(domains):
+    cache.delete_many([
+        _key(domain, vclass)
+        for domain in set(domains) if domain
+        for vclass in VIEWER_CLASSES
+    ])
+
+
+@receiver(post_save, sender=Link)
+def link_saved(sender, instance, **kwargs):
+    invalidate([instance.domain, getattr(instance, '_old_domain', '')])
+
+@receiver(post_delete, sender=Link)
+def link_deleted(sender, instance, **kwargs):
+    invalidate([instance.domain])
+
+@receiver(links_bulk_saved, sender=Link)
+def links_bulk_written(sender, links, **kwargs):
+    domains = [link.domain for link in links]
+    domains += [getattr(link, '_old_domain', '') for link in links]
+    invalidate(domains)
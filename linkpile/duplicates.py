@@ -0,0 +1,219 @@
+# -*- coding: utf-8 -*-
+"""Finding and merging Links that point to the same page.
+
+Two links are duplicates when their Link.url_hash (the sha1 of
+urlnorm.canonical_url) is equal.  Clusters are found with one grouped
+query on the url_hash index.
+
+Two links are near duplicates when their Link.simhash fingerprints (of
+title, description and domain; see linkpile.simhash) differ in at most
+LINKPILE_SIMHASH_DISTANCE bits (default and maximum 3): the same
+article under a mirror, AMP or syndicated URL.  Every fingerprint's
+bands are kept in SimHashBand, so candidates are one query on the
+(band, value) index and only they are compared bit by bit.
+"""
+
+from collections import defaultdict
+from itertools import groupby
+
+from django.conf import settings
+from django.db import transaction
+from django.db.models import Count, Q
+from django.db.models.signals import post_save
+from django.dispatch import receiver
+
+from tagging.models import Tag
+from tagging.utils import edit_string_for_tags, parse_tag_input
+
+from linkpile import simhash
+from linkpile.models import Link, SCRAPE_FAILED_TITLE, SimHashBand, VIEWER_STAFF
+from linkpile.signals import links_bulk_saved
+
+CHUNK_SIZE = 500
+# fingerprints per band query; each adds one parameter per band
+BAND_CHUNK_SIZE = 200
+
+
+def duplicate_hashes():
+    """url_hash values shared by more than one link.
+    """
+    return list(
+        Link.objects.exclude(url_hash='').order_by().values('url_hash').annotate(
+            n=Count('id')
+        ).filter(n__gt=1).values_list('url_hash', flat=True)
+    )
+
+def clusters():
+    """Yields lists of duplicate Links, oldest first in each list.
+    """
+    hashes = duplicate_hashes()
+    for n in range(0, len(hashes), CHUNK_SIZE):
+        links = Link.objects.filter(
+            url_hash__in=hashes[n:n+CHUNK_SIZE]
+        ).order_by('url_hash', 'date', 'id')
+        for _,cluster in groupby(links, key=lambda link: link.url_hash):
+            yield list(cluster)
+
+def merge(links):
+    """Merges a cluster of duplicates into its first (oldest) link.
+
+    The oldest link keeps its URL, date and sharing flags, gets the
+    union of all the tags and borrows a title or description if it has
+    none.  The other links are deleted.  Returns the merged link.
+    """
+    keeper,others = links[0],links[1:]
+    names = set(parse_tag_input(keeper.tags or ''))
+    for other in others:
+        names.update(parse_tag_input(other.tags or ''))
+        if (not keeper.title) or (keeper.title == SCRAPE_FAILED_TITLE):
+            keeper.title = other.title
+        if not keeper.description:
+            keeper.description = other.description
+    keeper.tags = edit_string_for_tags([Tag(name=name) for name in sorted(names)])
+    with transaction.atomic():
+        for other in others:
+            other.delete()
+        keeper.save()
+    return keeper
+
+
+def max_distance(distance=None):
+    """distance (default LINKPILE_SIMHASH_DISTANCE), at most what the bands can find.
+    """
+    if distance is None:
+        distance = getattr(settings, 'LINKPILE_SIMHASH_DISTANCE', simhash.DISTANCE)
+    return min(distance, simhash.DISTANCE)
+
+
+class BandIndex(object):
+    """In-memory fingerprints by (band, value).
+    """
+
+    def __init__(self):
+        self.entries = defaultdict(list)
+
+    def add(self, key, fingerprint):
+        for band in simhash.bands(fingerprint):
+            self.entries[band].append((key, fingerprint))
+
+    def find(self, fingerprint, distance=None):
+        """[(bits apart, key)] of fingerprints near this one, closest first.
+
+        Keys need not be comparable; ties keep the order they were found in.
+        """
+        distance = max_distance(distance)
+        found = {}
+        for band in simhash.bands(fingerprint):
+            for key,other in self.entries.get(band, []):
+                bits = simhash.distance(fingerprint, other)
+                if bits <= distance:
+                    found[key] = bits
+        return sorted(((bits, key) for key,bits in found.items()), key=lambda item: item[0])
+
+def stored_bands(fingerprints):
+    """BandIndex of the stored links sharing a band with any of fingerprints.
+
+    Keys are link ids.  One query per BAND_CHUNK_SIZE fingerprints.
+    """
+    index = BandIndex()
+    fingerprints = sorted(set(fingerprints))
+    seen = set()
+    for n in range(0, len(fingerprints), BAND_CHUNK_SIZE):
+        values = defaultdict(set)
+        for fingerprint in fingerprints[n:n+BAND_CHUNK_SIZE]:
+            for band,value in simhash.bands(fingerprint):
+                values[band].add(value)
+        query = Q()
+        for band,band_values in values.items():
+            query |= Q(band=band, value__in=band_values)
+        rows = SimHashBand.objects.filter(query, link__simhash__isnull=False).values_list(
+            'link_id', 'link__simhash'
+        )
+        for link_id,fingerprint in rows:
+            if link_id not in seen:
+                seen.add(link_id)
+                index.add(link_id, fingerprint)
+    return index
+
+def near_duplicates(fingerprint, distance=None, exclude=(), viewer=VIEWER_STAFF):
+    """Links that viewer may see within distance bits of fingerprint.
+
+    Closest first, then oldest first.
+    """
+    found = [
+        (bits, link_id) for bits,link_id in stored_bands([fingerprint]).find(fingerprint, distance)
+        if link_id not in exclude
+    ]
+    if not found:
+        return []
+    links = Link.objects.filter(id__in=[link_id for _,link_id in found]).visible_to(viewer)
+    links = links.select_related('user').in_bulk()
+    return [links[link_id] for _,link_id in found if link_id in links]
+
+def index_bands(links):
+    """Replaces the SimHashBand rows of links.
+    
+    Links never loaded from the database (just created) have no rows
+    to delete.
+    """
+    stored = [link.pk for link in links if hasattr(link, '_db_simhash')]
+    if stored:
+        SimHashBand.objects.filter(link_id__in=stored).delete()
+    SimHashBand.objects.bulk_create([
+        SimHashBand(link_id=link.pk, band=band, value=value)
+        for link in links if link.simhash is not None
+        for band,value in simhash.bands(link.simhash)
+    ])
+
+def near_clusters(distance=None):
+    """Yields lists of near-duplicate Links, oldest first in each list.
+
+    One pass over the (band, value) index: links in the same band
+    bucket are compared pairwise and joined with union-find, so a
+    cluster can chain links that are each near the next.
+    """
+    distance = max_distance(distance)
+    parent = {}
+
+    def find(key):
+        root = parent.setdefault(key, key)
+        while parent[root] != root:
+            root = parent[root]
+        while parent[key] != root:
+            parent[key],key = root,parent[key]
+        return root
+
+    rows = SimHashBand.objects.filter(link__simhash__isnull=False).order_by(
+        'band', 'value', 'link_id'
+    ).values_list('band', 'value', 'link_id', 'link__simhash')
+    for _,bucket in groupby(rows.iterator(), key=lambda row: row[:2]):
+        bucket = [row[2:] for row in bucket]
+        for n,(link_id,fingerprint) in enumerate(bucket):
+            for other_id,other in bucket[n+1:]:
+                if simhash.distance(fingerprint, other) <= distance:
+                    a,b = find(link_id),find(other_id)
+                    if a != b:
+                        parent[max(a, b)] = min(a, b)
+    members = defaultdict(list)
+    for link_id in parent:
+        members[find(link_id)].append(link_id)
+    roots = sorted(members)
+    for n in range(0, len(roots), CHUNK_SIZE):
+        ids = [link_id for root in roots[n:n+CHUNK_SIZE] for link_id in members[root]]
+        links = Link.objects.filter(id__in=ids).order_by('date', 'id')
+        by_root = defaultdict(list)
+        for link in links:
+            by_root[find(link.id)].append(link)
+        for root in roots[n:n+CHUNK_SIZE]:
+            if len(by_root[root]) > 1:
+                yield by_root[root]
+
+
+@receiver(post_save, sender=Link)
+def link_saved(sender, instance, **kwargs):
+    if instance.simhash != getattr(instance, '_db_simhash', None):
+        index_bands([instance])
+
+@receiver(links_bulk_saved, sender=Link)
+def links_bulk_written(sender, links, **kwargs):
+    index_bands(links)
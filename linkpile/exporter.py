@@ -0,0 +1,85 @@
+# -*- coding: utf-8 -*-
+"""Streaming export of Links as JSON or NDJSON.
+
+Links are read in keyset order on (date, id), one chunk per query, so
+neither the queryset nor the encoded payload is ever held in memory as
+a whole.  Output is a stream of text chunks that can optionally be
+gzipped on the fly.
+"""
+
+import json
+import zlib
+
+from django.db.models import Q
+
+from linkpile.models import Link
+
+CHUNK_SIZE = 500
+FORMATS = ['json', 'ndjson']
+CONTENT_TYPES = {
+    'json': 'application/json',
+    'ndjson': 'application/x-ndjson',
+}
+
+
+def iter_chunks(since=None, until=None, chunk_size=CHUNK_SIZE):
+    """Yields lists of Links ordered by (date, id).
+
+    since/until are datetimes; since is inclusive, until exclusive.
+    """
+    links = Link.objects.select_related('user').order_by('date', 'id')
+    if since:
+        links = links.filter(date__gte=since)
+    if until:
+        links = links.filter(date__lt=until)
+    last = None
+    while True:
+        page = links
+        if last:
+            # the date bound lets the (date, id) index seek to last
+            page = page.filter(
+                Q(date__gt=last.date) | Q(id__gt=last.id), date__gte=last.date
+            )
+        chunk = list(page[:chunk_size])
+        if not chunk:
+            return
+        yield chunk
+        last = chunk[-1]
+
+def encode(chunks, format='json'):
+    """Encodes chunks of Links as text, one piece per chunk.
+    """
+    if format not in FORMATS:
+        raise ValueError('Unknown export format: %s' % format)
+    if format == 'ndjson':
+        for chunk in chunks:
+            yield ''.join(json.dumps(link.to_dict()) + '\n' for link in chunk)
+        return
+    yield '['
+    first = True
+    for chunk in chunks:
+        text = ',\n'.join(json.dumps(link.to_dict()) for link in chunk)
+        if first:
+            yield text
+            first = False
+        else:
+            yield ',\n' + text
+    yield ']\n'
+
+def gzipped(pieces):
+    """Gzips a stream of text pieces (as UTF-8) into bytes chunks.
+    """
+    compressor = zlib.compressobj(6, zlib.DEFLATED, zlib.MAX_WBITS | 16)
+    for piece in pieces:
+        data = compressor.compress(piece.encode('utf-8'))
+        if data:
+            yield data
+    yield compressor.flush()
+
+def export_links(format='json', compress=False, **kwargs):
+    """Export stream: text pieces, or bytes chunks if compress.
+    """
+    pieces = encode(iter_chunks(**kwargs), format)
+    if compress:
+        return gzipped(pieces)
+    return pieces
@@ -0,0 +1,156 @@
+# -*- coding: utf-8 -*-
+"""Streaming extraction of page metadata from the HTML <head>.
+
+Pages are fed to the parser chunk by chunk and reading stops as soon as
+the head is over (</head> or the first <body> tag) or MAX_BYTES have
+been read, so large pages are never held in memory.  Responses that are
+not HTML (PDFs, images, ...) are not read at all.
+"""
+
+import codecs
+from html.parser import HTMLParser
+import re
+
+CHUNK_SIZE = 8192
+MAX_BYTES = 256 * 1024
+SNIFF_BYTES = 1024
+DEFAULT_ENCODING = 'utf-8'
+HTML_TYPES = ['text/html', 'application/xhtml+xml']
+
+FIELDS = ['title', 'description', 'og_title', 'og_description']
+META_FIELDS = {
+    'description': 'description',
+    'og:title': 'og_title',
+    'og:description': 'og_description',
+}
+
+CHARSET_RE = re.compile(r'charset\s*=\s*["\']?\s*([-\w.:]+)', re.I)
+HEAD_END_RE = re.compile(br'</head|<body', re.I)
+META_CHARSET_RE = re.compile(
+    br'<meta[^>]+charset\s*=\s*["\']?\s*([-\w.:]+)', re.I
+)
+
+
+class HeadParser(HTMLParser):
+    """Collects <title> and <meta> values until the head ends.
+    """
+
+    def __init__(self):
+        HTMLParser.__init__(self, convert_charrefs=True)
+        self.data = {}
+        self.done = False
+        self._title = None
+
+    def handle_starttag(self, tag, attrs):
+        if tag == 'title' and 'title' not in self.data:
+            self._title = []
+        elif tag == 'meta':
+            attrs = dict(attrs)
+            key = (attrs.get('property') or attrs.get('name') or '').lower()
+            field = META_FIELDS.get(key)
+            if field and (field not in self.data) and attrs.get('content'):
+                self.data[field] = attrs['content'].strip()
+        elif tag == 'body':
+            self.done = True
+
+    def handle_endtag(self, tag):
+        if tag == 'title' and self._title is not None:
+            self.data['title'] = ' '.join(''.join(self._title).split())
+            self._title = None
+        elif tag == 'head':
+            self.done = True
+
+    def handle_data(self, data):
+        if self._title is not None:
+            self._title.append(data)
+
+
+def is_html(content_type):
+    """True if a Content-Type header value is HTML (or missing).
+    """
+    if not content_type:
+        return True
+    return content_type.split(';')[0].strip().lower() in HTML_TYPES
+
+def header_encoding(content_type):
+    """Charset from a Content-Type header value, or None.
+    """
+    if content_type:
+        match = CHARSET_RE.search(content_type)
+        if match:
+            return _codec(match.group(1))
+    return None
+
+def sniff_encoding(head):
+    """Charset from a <meta charset> or http-equiv tag in the first bytes.
+    """
+    match = META_CHARSET_RE.search(head[:SNIFF_BYTES])
+    if match:
+        return _codec(match.group(1).decode('ascii', 'ignore'))
+    return None
+
+def _codec(name):
+    try:
+        return codecs.lookup(name).name
+    except LookupError:
+        return None
+
+def extract_head(chunks, content_type=None, max_bytes=MAX_BYTES):
+    """Parses metadata out of an iterable of byte chunks.
+
+    Returns a dict with any of FIELDS that were found, plus 'encoding'
+    and 'bytes_read'.  Stops consuming `chunks` as soon as the head has
+    been parsed or `max_bytes` have been read.
+    """
+    data = {'bytes_read': 0}
+    if not is_html(content_type):
+        return data
+    encoding = header_encoding(content_type)
+    parser = HeadParser()
+    decoder = None
+    pending = b''
+    for chunk in chunks:
+        if not chunk:
+            continue
+        data['bytes_read'] += len(chunk)
+        if decoder is None:
+            # hold bytes back until there is enough to look for <meta charset>
+            pending += chunk
+            if (not encoding) and (len(pending) < SNIFF_BYTES):
+                if (data['bytes_read'] < max_bytes) and not HEAD_END_RE.search(pending):
+                    continue
+            encoding = encoding or sniff_encoding(pending) or DEFAULT_ENCODING
+            decoder = codecs.getincrementaldecoder(encoding)(errors='replace')
+            chunk,pending = pending,b''
+        parser.feed(decoder.decode(chunk))
+        if parser.done or (data['bytes_read'] >= max_bytes):
+            break
+    else:
+        if decoder is None:
+            encoding = encoding or sniff_encoding(pending) or DEFAULT_ENCODING
+            decoder = codecs.getincrementaldecoder(encoding)(errors='replace')
+            parser.feed(decoder.decode(pending))
+        if not parser.done:
+            parser.feed(decoder.decode(b'', final=True))
+            parser.close()
+    if (parser._title is not None) and ('title' not in parser.data):
+        # unterminated <title>; keep what we have
+        parser.handle_endtag('title')
+    data.update(parser.data)
+    data['encoding'] = encoding
+    return data
+
+def extract_response(response, max_bytes=MAX_BYTES, chunk_size=CHUNK_SIZE):
+    """Metadata from a requests Response opened with stream=True.
+
+    The response is closed afterwards so that the unread remainder of
+    the body is never downloaded.
+    """
+    try:
+        return extract_head(
+            response.iter_content(chunk_size=chunk_size),
+            content_type=response.headers.get('Content-Type'),
+            max_bytes=max_bytes,
+        )
+    finally:
+        response.close()
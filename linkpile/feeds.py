@@ -1,21 +1,231 @@
+# -*- coding: utf-8 -*-
+"""RSS, Atom and JSON feeds of public links.
+
+Every feed (the main one, per tag and per search) is rendered once and
+kept in Django's cache under a hash of its URL and the current feed
+version.  The version changes whenever a public link is saved, deleted
+or retagged, which retires every cached feed at once.  The same hash is
+sent as the ETag and the time of the last change as Last-Modified, so
+a poll costs a cache lookup and usually ends in a 304.
+"""
+
+from calendar import timegm
+import hashlib
+import json
+from urllib.parse import urlencode
+import uuid
+
+from django.conf import settings
+from django.contrib.contenttypes.models import ContentType
 from django.contrib.syndication.views import Feed
+from django.core.cache import cache
 from django.core.urlresolvers import reverse
+from django.db.models import Max
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+from django.http import HttpResponse
+from django.utils import feedgenerator, timezone
+from django.utils.cache import get_conditional_response
+from django.utils.decorators import method_decorator
+from django.utils.http import http_date
+
+from tagging.models import TaggedItem
+
+from linkpile import search
+from linkpile.fragments import prefetch_tags
+from linkpile.models import Link, VIEWER_PUBLIC, VISIBILITY_PUBLIC, filter_visible
+from linkpile.routers import use_replicas
+from linkpile.signals import in_link_save, links_bulk_saved
+
+STATE_KEY = 'linkpile:feed:state'
+CACHE_KEY = 'linkpile:feed:%s'
+
+
+class JSONFeed( feedgenerator.SyndicationFeed ):
+    """JSON Feed 1.0 (https://jsonfeed.org/version/1).
+    """
+    content_type = 'application/feed+json; charset=utf-8'
+
+    def write( self, outfile, encoding ):
+        feed = {
+            'version': 'https://jsonfeed.org/version/1',
+            'title': self.feed['title'],
+            'home_page_url': self.feed['link'],
+            'feed_url': self.feed['feed_url'],
+            'description': self.feed['description'],
+            'items': [self.item_dict(item) for item in self.items],
+        }
+        outfile.write(json.dumps(feed))
+
+    def item_dict( self, item ):
+        data = {
+            'id': item['unique_id'] or item['link'],
+            'url': item['link'],
+            'title': item['title'],
+            'content_text': item['description'] or '',
+            'tags': list(item['categories']),
+        }
+        if item['pubdate']:
+            data['date_published'] = feedgenerator.rfc3339_date(item['pubdate'])
+        if item['updateddate']:
+            data['date_modified'] = feedgenerator.rfc3339_date(item['updateddate'])
+        return data
+
+FEED_TYPES = {
+    'rss': feedgenerator.Rss201rev2Feed,
+    'atom': feedgenerator.Atom1Feed,
+    'json': JSONFeed,
+}
+
+
+def _timeout():
+    return getattr(settings, 'LINKPILE_FEED_CACHE_TIMEOUT', 86400)
+
+def feed_size():
+    return getattr(settings, 'LINKPILE_FEED_SIZE', 10)
+
+def feed_state():
+    """{'version': ..., 'modified': ...} shared by all feeds.
+
+    'modified' starts out as the newest public link's `modified` and
+    becomes the time of the last change after invalidate().
+    """
+    state = cache.get(STATE_KEY)
+    if state is None:
+        newest = Link.objects.visible_to(VIEWER_PUBLIC).aggregate(newest=Max('modified'))
+        state = {
+            'version': uuid.uuid4().hex,
+            'modified': newest['newest'] or timezone.now(),
+        }
+        cache.set(STATE_KEY, state, _timeout())
+    return state
+
+def invalidate():
+    """Retires every cached feed.
+    """
+    cache.set(STATE_KEY, {
+        'version': uuid.uuid4().hex,
+        'modified': timezone.now(),
+    }, _timeout())
+
+def feed_etag(request, state):
+    uri = '%s %s' % (state['version'], request.build_absolute_uri())
+    return hashlib.md5(uri.encode('utf-8')).hexdigest()
 
-from linkpile.models import Link
 
 class LinksFeed( Feed ):
     title = 'Linkpile Links'
-    link = '/linkpile/'
     description = 'A pile of links from around the web'
-    
-    def items( self ):
-        return Link.get_recent(10)
-    
+    subtitle = description
+
+    def __init__( self, format='rss' ):
+        self.format = format
+        self.feed_type = FEED_TYPES[format]
+
+    @method_decorator(use_replicas)
+    def __call__( self, request, *args, **kwargs ):
+        state = feed_state()
+        etag = feed_etag(request, state)
+        last_modified = timegm(state['modified'].utctimetuple())
+        response = get_conditional_response(
+            request, etag='"%s"' % etag, last_modified=last_modified
+        )
+        if response is None:
+            key = CACHE_KEY % etag
+            cached = cache.get(key)
+            if cached is None:
+                response = super(LinksFeed, self).__call__(request, *args, **kwargs)
+                cache.set(key, (response.content, response['Content-Type']), _timeout())
+            else:
+                response = HttpResponse(cached[0], content_type=cached[1])
+        response['ETag'] = '"%s"' % etag
+        response['Last-Modified'] = http_date(last_modified)
+        return response
+
+    def link( self ):
+        return reverse('linkpile-index')
+
+    def get_links( self, obj ):
+        return Link.objects.visible_to(VIEWER_PUBLIC).order_by('-date')
+
+    def items( self, obj ):
+        links = list(self.get_links(obj)[:feed_size()])
+        prefetch_tags(links)
+        return links
+
     def item_title(self, item):
         return item.title
-    
+
     def item_description(self, item):
         return item.description
-    
+
     def item_link(self, item):
-        return reverse('linkpile-link', args=[item.id])
+        return item.absolute_url()
+
+    def item_pubdate(self, item):
+        return item.date
+
+    def item_updateddate(self, item):
+        return item.modified
+
+    def item_categories(self, item):
+        return item.tag_list
+
+
+class TagFeed( LinksFeed ):
+    """Public links with all of the given tags ("a+b").
+    """
+
+    def get_object( self, request, tags ):
+        return tags.split('+')
+
+    def title( self, obj ):
+        return 'Linkpile Links tagged %s' % ', '.join(obj)
+
+    def link( self, obj ):
+        return reverse('linkpile-tags', args=['+'.join(obj)])
+
+    def get_links( self, obj ):
+        links = TaggedItem.objects.get_by_model(Link, obj)
+        return filter_visible(links, VIEWER_PUBLIC).order_by('-date')
+
+
+class SearchFeed( LinksFeed ):
+    """Public links matching ?keywords=, newest first.
+    """
+
+    def get_object( self, request ):
+        return request.GET.get('keywords', '')
+
+    def title( self, obj ):
+        return 'Linkpile Links matching "%s"' % obj
+
+    def link( self, obj ):
+        return '%s?%s' % (reverse('linkpile-index'), urlencode({'keywords': obj}))
+
+    def get_links( self, obj ):
+        links = Link.objects.filter(id__in=search.search(obj, viewer=VIEWER_PUBLIC))
+        return links.visible_to(VIEWER_PUBLIC).order_by('-date')
+
+
+def _was_public(link):
+    return link.public or (getattr(link, '_db_visibility', 0) & VISIBILITY_PUBLIC)
+
+@receiver(post_save, sender=Link)
+@receiver(post_delete, sender=Link)
+def link_changed(sender, instance, **kwargs):
+    if _was_public(instance):
+        invalidate()
+
+@receiver(links_bulk_saved, sender=Link)
+def links_bulk_written(sender, links, **kwargs):
+    if any(_was_public(link) for link in links):
+        invalidate()
+
+@receiver(post_save, sender=TaggedItem)
+@receiver(post_delete, sender=TaggedItem)
+def tags_changed(sender, instance, **kwargs):
+    if in_link_save():
+        return  # handled by link_changed
+    if instance.content_type_id == ContentType.objects.get_for_model(Link).id:
+        invalidate()
@@ -18,9 +18,21 @@ class LinkEditForm( forms.Form ):
     url = forms.URLField()
     title = forms.CharField()
     description = forms.CharField(widget=forms.Textarea, required=False)
-    tags = TagField(required=False)
+    tags = TagField(required=False, widget=forms.TextInput(
+        attrs={'data-autocomplete': 'tags', 'autocomplete': 'off'}
+    ))
     date = forms.DateTimeField()
     family = forms.BooleanField(required=False)
     friends = forms.BooleanField(required=False)
     public = forms.BooleanField(required=False)
     shared = forms.BooleanField(required=False)
+
+class LinkApiForm( LinkEditForm ):
+    """LinkEditForm for the bulk API, where title and date may be left out.
+    
+    A link without a title goes to the scrape queue; one without a date
+    is dated now.
+    """
+    url = forms.URLField(max_length=400)
+    title = forms.CharField(max_length=200, required=False)
+    date = forms.DateTimeField(required=False)
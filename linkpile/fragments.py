@@ -0,0 +1,102 @@
+# -*- coding: utf-8 -*-
+"""Rendering (and caching) of the linkpile-link.html fragment.
+
+Each link's rendered fragment is cached under a key made of its id, its
+`modified` timestamp and the viewer class (staff see edit links, others
+do not).  Saving a link or changing its tags bumps `modified`, so stale
+fragments are never looked up again; deleting a link drops its
+fragments.  A page of links is fetched with one get_many; only the
+misses are rendered, with their tags fetched in one query.
+"""
+
+from django.conf import settings
+from django.contrib.contenttypes.models import ContentType
+from django.core.cache import cache
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+from django.template import loader
+from django.utils import timezone
+
+from tagging.models import TaggedItem
+
+from linkpile.models import Link, VIEWER_STAFF, viewer_class
+from linkpile.signals import in_link_save
+
+LINK_TEMPLATE = 'linkpile/linkpile-link.html'
+CACHE_KEY = 'linkpile:frag:%s:%s:%s'
+STAFF = 'staff'
+OTHERS = 'others'
+_templates = {}
+
+
+def link_template():
+    """Compiled linkpile-link.html, loaded once per process.
+    """
+    if LINK_TEMPLATE not in _templates:
+        _templates[LINK_TEMPLATE] = loader.get_template(LINK_TEMPLATE)
+    return _templates[LINK_TEMPLATE]
+
+def prefetch_tags(links):
+    """Sets link.tag_list (sorted tag names) on links with one query.
+    """
+    links = [link for link in links if not hasattr(link, 'tag_list')]
+    if not links:
+        return
+    names = {link.pk: [] for link in links}
+    items = TaggedItem.objects.filter(
+        content_type=ContentType.objects.get_for_model(Link),
+        object_id__in=list(names.keys()),
+    ).values_list('object_id', 'tag__name')
+    for object_id,name in items:
+        names[object_id].append(name)
+    for link in links:
+        link.tag_list = sorted(names[link.pk])
+
+def fragment_class(user):
+    if viewer_class(user) == VIEWER_STAFF:
+        return STAFF
+    return OTHERS
+
+def fragment_key(link, fclass):
+    stamp = link.modified.strftime('%Y%m%d%H%M%S%f') if link.modified else '0'
+    return CACHE_KEY % (link.pk, stamp, fclass)
+
+def _timeout():
+    return getattr(settings, 'LINKPILE_FRAGMENT_CACHE_TIMEOUT', 86400)
+
+def render_links(links, user=None):
+    """Rendered fragments for links, as a list of strings.
+    """
+    links = list(links)
+    fclass = fragment_class(user)
+    keys = [fragment_key(link, fclass) for link in links]
+    cached = cache.get_many(keys)
+    missing = [link for link,key in zip(links, keys) if key not in cached]
+    if missing:
+        prefetch_tags(missing)
+        t = link_template()
+        rendered = {}
+        for link in missing:
+            key = fragment_key(link, fclass)
+            rendered[key] = t.render({'link': link, 'can_edit': fclass == STAFF})
+        cache.set_many(rendered, _timeout())
+        cached.update(rendered)
+    return [cached[key] for key in keys]
+
+def touch(link_ids):
+    """Bumps Link.modified, retiring the links' cached fragments.
+    """
+    Link.objects.filter(id__in=link_ids).update(modified=timezone.now())
+
+
+@receiver(post_delete, sender=Link)
+def link_deleted(sender, instance, **kwargs):
+    cache.delete_many([fragment_key(instance, fclass) for fclass in [STAFF, OTHERS]])
+
+@receiver(post_save, sender=TaggedItem)
+@receiver(post_delete, sender=TaggedItem)
+def tags_changed(sender, instance, **kwargs):
+    if in_link_save():
+        return  # Link.save() has already bumped modified
+    if instance.content_type_id == ContentType.objects.get_for_model(Link).id:
+        touch([instance.object_id])
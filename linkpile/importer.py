@@ -0,0 +1,232 @@
+# -*- coding: utf-8 -*-
+"""Streaming bulk import of Link.to_dict() records.
+
+Input is either a JSON array or newline-delimited JSON (one object per
+line).  Records are decoded one at a time from a text stream and
+inserted in batches with bulk_create, so memory use depends on the
+batch size rather than on the size of the file.
+"""
+
+from collections import Counter, defaultdict
+import json
+import re
+
+import pytz
+
+from django.conf import settings
+from django.contrib.auth.models import User
+from django.contrib.contenttypes.models import ContentType
+from django.db import transaction
+
+from tagging import settings as tagging_settings
+from tagging.models import Tag, TaggedItem
+from tagging.utils import parse_tag_input
+
+from linkpile import duplicates
+from linkpile.models import Link
+from linkpile.signals import links_bulk_saved
+
+READ_SIZE = 64 * 1024
+BATCH_SIZE = 500
+SPACE_RE = re.compile(r'\s*')
+
+
+def iter_records(fp, read_size=READ_SIZE):
+    """Yields dicts from a text stream holding a JSON array or NDJSON.
+
+    Records are decoded in place at an offset into the buffer, which is
+    only trimmed when more text is read.
+    """
+    decoder = json.JSONDecoder()
+    buf = ''
+    pos = 0
+    eof = False
+    in_array = None
+
+    def fill():
+        chunk = fp.read(read_size)
+        return chunk, not chunk
+
+    while True:
+        pos = SPACE_RE.match(buf, pos).end()
+        if pos == len(buf):
+            if eof:
+                return
+            chunk,eof = fill()
+            buf = buf[pos:] + chunk
+            pos = 0
+            continue
+        if in_array is None:
+            in_array = buf.startswith('[', pos)
+            if in_array:
+                pos += 1
+            continue
+        if in_array and buf.startswith(',', pos):
+            pos += 1
+            continue
+        if in_array and buf.startswith(']', pos):
+            return
+        try:
+            record,pos = decoder.raw_decode(buf, pos)
+        except ValueError:
+            if eof:
+                raise
+            # object is cut off at the end of the buffer
+            chunk,eof = fill()
+            buf = buf[pos:] + chunk
+            pos = 0
+            continue
+        yield record
+
+def batches(iterable, size):
+    batch = []
+    for item in iterable:
+        batch.append(item)
+        if len(batch) >= size:
+            yield batch
+            batch = []
+    if batch:
+        yield batch
+
+
+class Importer(object):
+    """Writes Link records to the database in batches.
+
+    Users are looked up once per username and tags are written straight
+    to the tagging tables, bypassing TagField's per-save signal.
+    """
+
+    def __init__(self, batch_size=BATCH_SIZE, skip_duplicates=False, skip_near_duplicates=False):
+        self.batch_size = batch_size
+        self.skip_duplicates = skip_duplicates
+        self.skip_near_duplicates = skip_near_duplicates
+        self.users = {}
+        self.tz = pytz.timezone(settings.TIME_ZONE)
+        self.ctype = ContentType.objects.get_for_model(Link)
+        self.counts = {'imported': 0, 'duplicates': 0, 'near_duplicates': 0}
+
+    def run(self, records):
+        for batch in batches(records, self.batch_size):
+            self.import_batch(batch)
+        return self.counts
+
+    def load_users(self, records):
+        names = set(r['user'] for r in records) - set(self.users.keys())
+        if names:
+            for user in User.objects.filter(username__in=names):
+                self.users[user.username] = user
+        missing = names - set(self.users.keys())
+        if missing:
+            raise User.DoesNotExist('Unknown users: %s' % ', '.join(sorted(missing)))
+
+    def filter_duplicates(self, links):
+        """Drops links whose URL is already in the db or earlier in the batch.
+
+        URLs are compared by Link.url_hash, so different spellings of
+        the same page count as duplicates.
+        """
+        hashes = set(link.url_hash for link in links)
+        seen = set(
+            Link.objects.filter(url_hash__in=hashes).values_list('url_hash', flat=True)
+        )
+        unique = []
+        for link in links:
+            if link.url_hash in seen:
+                self.counts['duplicates'] += 1
+                continue
+            seen.add(link.url_hash)
+            unique.append(link)
+        return unique
+
+    def filter_near_duplicates(self, links):
+        """Drops links nearly the same as one in the db or earlier in the batch.
+        
+        See duplicates.near_duplicates; links without a fingerprint
+        (no title yet) are kept.
+        """
+        index = duplicates.stored_bands(
+            [link.simhash for link in links if link.simhash is not None]
+        )
+        unique = []
+        for link in links:
+            if link.simhash is not None:
+                if index.find(link.simhash):
+                    self.counts['near_duplicates'] += 1
+                    continue
+                index.add(None, link.simhash)
+            unique.append(link)
+        return unique
+
+    def import_batch(self, records):
+        self.load_users(records)
+        links = [Link.from_dict(r, users=self.users, tz=self.tz) for r in records]
+        for link in links:
+            link.fill_computed_fields()
+        with transaction.atomic():
+            if self.skip_duplicates:
+                links = self.filter_duplicates(links)
+            if self.skip_near_duplicates:
+                links = self.filter_near_duplicates(links)
+            if not links:
+                return
+            self.bulk_create(links)
+            self.bulk_tag(links)
+            links_bulk_saved.send(sender=Link, links=links)
+        self.counts['imported'] += len(links)
+
+    def bulk_create(self, links):
+        Link.objects.bulk_create(links)
+        if links[0].pk is None:
+            self.recover_ids(links)
+
+    def recover_ids(self, links):
+        """Sets the ids of links just inserted by a backend that does not
+        return them from bulk inserts.
+
+        Rows are matched on (url_hash, user, date), which other writers
+        are unlikely to share; where several rows have the same key the
+        newest are ours, in insertion order.
+        """
+        ids = defaultdict(list)
+        rows = Link.objects.filter(
+            url_hash__in=set(link.url_hash for link in links)
+        ).order_by('id').values_list('url_hash', 'user_id', 'date', 'id')
+        for url_hash,user_id,date,pk in rows:
+            ids[url_hash, user_id, date].append(pk)
+        keys = [(link.url_hash, link.user_id, link.date) for link in links]
+        for key,count in Counter(keys).items():
+            ids[key] = ids[key][-count:]
+        for link,key in zip(links, keys):
+            link.pk = ids[key].pop(0)
+
+    def bulk_tag(self, links):
+        """Creates the Tag and TaggedItem rows for links in a few queries.
+        """
+        names_by_link = []
+        names = set()
+        for link in links:
+            link_names = parse_tag_input(link.tags or '')
+            if tagging_settings.FORCE_LOWERCASE_TAGS:
+                link_names = [name.lower() for name in link_names]
+            names_by_link.append((link, link_names))
+            names.update(link_names)
+        if not names:
+            return
+        tags = dict(Tag.objects.filter(name__in=names).values_list('name', 'id'))
+        missing = names - set(tags.keys())
+        if missing:
+            Tag.objects.bulk_create([Tag(name=name) for name in missing])
+            tags.update(
+                Tag.objects.filter(name__in=missing).values_list('name', 'id')
+            )
+        TaggedItem.objects.bulk_create([
+            TaggedItem(tag_id=tags[name], content_type=self.ctype, object_id=link.pk)
+            for link,link_names in names_by_link
+            for name in set(link_names)
+        ])
+
+
+def import_links(fp, **kwargs):
+    """Imports Links from a JSON or NDJSON text stream; returns counts.
+    """
+    return Importer(**kwargs).run(iter_records(fp))
@@ -0,0 +1,208 @@
+# -*- coding: utf-8 -*-
+"""Link rot checking.
+
+Each link's URL is requested with HEAD (falling back to GET for servers
+that do not answer HEAD properly) from a thread pool sharing one pooled
+session.  At most LINKPILE_CHECK_WORKERS requests are in flight, no more
+than LINKPILE_CHECK_PER_HOST of them to the same host, and requests to
+one host start at least LINKPILE_CHECK_HOST_DELAY seconds apart.
+
+Results go to the LinkCheck table one batch at a time, so an interrupted
+run picks up where it stopped.  Links never checked come first, then
+those last checked more than LINKPILE_CHECK_INTERVAL seconds ago.  A
+link counts as dead after LINKPILE_CHECK_DEAD_AFTER failed checks in a
+row.
+"""
+
+from collections import OrderedDict, defaultdict
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from datetime import timedelta
+import logging
+import threading
+import time
+from urllib.parse import urlparse
+
+import requests
+
+from django.conf import settings
+from django.db import transaction
+from django.db.models import F
+from django.utils import timezone
+
+from linkpile import conditional
+from linkpile import scrape as scraper
+from linkpile.models import Link, LinkCheck
+
+logger = logging.getLogger(__name__)
+
+# answers that say nothing about whether the page is still there
+INCONCLUSIVE_STATUSES = [401, 403, 429]
+# answers to HEAD that are worth a GET
+HEAD_FALLBACK_STATUSES = [400, 403, 404, 405, 501]
+
+
+def _setting(name, default):
+    return getattr(settings, name, default)
+
+def is_failure(result):
+    status = result['status']
+    if status is None:
+        return True
+    return (status >= 400) and (status not in INCONCLUSIVE_STATUSES)
+
+
+class HostLimiter(object):
+    """Per-host concurrency cap and minimum delay between requests.
+    """
+
+    def __init__(self, per_host, delay):
+        self.per_host = per_host
+        self.delay = delay
+        self._lock = threading.Lock()
+        self._semaphores = defaultdict(lambda: threading.BoundedSemaphore(self.per_host))
+        self._next_start = defaultdict(float)
+
+    def _semaphore(self, host):
+        with self._lock:
+            return self._semaphores[host]
+
+    def _wait_turn(self, host):
+        with self._lock:
+            now = time.time()
+            start = max(now, self._next_start[host])
+            self._next_start[host] = start + self.delay
+        if start > now:
+            time.sleep(start - now)
+
+    def run(self, host, func, *args):
+        semaphore = self._semaphore(host)
+        with semaphore:
+            self._wait_turn(host)
+            return func(*args)
+
+
+def check_url(url, session, timeout=None):
+    """HEAD (or GET) url; returns {'status', 'final_url', 'error'}.
+
+    'status' is None if there was no HTTP answer at all.  Bodies are
+    never downloaded.
+    """
+    result = {'status': None, 'final_url': '', 'error': ''}
+    if timeout is None:
+        timeout = _setting('LINKPILE_CHECK_TIMEOUT', (5, 10))
+    if urlparse(url).scheme not in scraper.SCHEMES:
+        result['error'] = 'unsupported URL'
+        return result
+    try:
+        r = session.head(url, allow_redirects=True, timeout=timeout)
+        if r.status_code in HEAD_FALLBACK_STATUSES:
+            r = session.get(url, allow_redirects=True, timeout=timeout, stream=True)
+            r.close()
+        result['status'] = r.status_code
+        result['final_url'] = r.url
+    except requests.RequestException as err:
+        logger.info('check %s failed: %s' % (url, err))
+        result['error'] = str(err)[:200] or err.__class__.__name__
+    return result
+
+def interleave(jobs):
+    """Reorders (key, url) jobs round-robin by host.
+
+    Keeps workers from queueing up behind one host's limit.
+    """
+    by_host = OrderedDict()
+    for job in jobs:
+        by_host.setdefault(urlparse(job[1]).hostname, []).append(job)
+    queues = list(by_host.values())
+    n = 0
+    while queues:
+        for queue in queues:
+            if n < len(queue):
+                yield queue[n]
+        n += 1
+        queues = [queue for queue in queues if n < len(queue)]
+
+def check_many(jobs, workers=None, per_host=None, delay=None, session=None):
+    """Checks (key, url) jobs concurrently; yields (key, result) pairs.
+    """
+    if workers is None:
+        workers = _setting('LINKPILE_CHECK_WORKERS', 8)
+    if per_host is None:
+        per_host = _setting('LINKPILE_CHECK_PER_HOST', 2)
+    if delay is None:
+        delay = _setting('LINKPILE_CHECK_HOST_DELAY', 1.0)
+    if session is None:
+        session = scraper.make_session(pool_size=workers)
+    limiter = HostLimiter(per_host, delay)
+    with ThreadPoolExecutor(max_workers=workers) as pool:
+        futures = {
+            pool.submit(limiter.run, urlparse(url).hostname, check_url, url, session): key
+            for key,url in interleave(jobs)
+        }
+        for future in as_completed(futures):
+            yield futures[future], future.result()
+
+def due_links(cutoff):
+    """(id, url) of links not checked since cutoff, unchecked ones first.
+    """
+    links = Link.objects.exclude(linkcheck__checked__gte=cutoff)
+    return links.order_by(
+        F('linkcheck__checked').asc(nulls_first=True), 'id'
+    ).values_list('id', 'url')
+
+def record(results):
+    """Stores {link id: check_url() result}; returns the LinkChecks.
+    """
+    now = timezone.now()
+    dead_after = _setting('LINKPILE_CHECK_DEAD_AFTER', 2)
+    with transaction.atomic():
+        previous = LinkCheck.objects.in_bulk(list(results.keys()))
+        checks = []
+        for link_id,result in results.items():
+            old = previous.get(link_id)
+            failures = 0
+            if is_failure(result):
+                failures = 1 + (old.failures if old else 0)
+            dead = failures >= dead_after
+            if result['status'] in INCONCLUSIVE_STATUSES:
+                # says nothing either way; keep the streak as it was
+                failures = old.failures if old else 0
+                dead = old.dead if old else False
+            checks.append(LinkCheck(
+                link_id=link_id,
+                status=result['status'],
+                final_url=(result['final_url'] or '')[:400],
+                error=result['error'][:200],
+                failures=failures,
+                dead=dead,
+                checked=now,
+            ))
+        LinkCheck.objects.filter(link_id__in=list(results.keys())).delete()
+        LinkCheck.objects.bulk_create(checks)
+    conditional.bump()  # ?dead= listings
+    return checks
+
+def check_links(limit=None, workers=None, batch_size=500, force=False, **kwargs):
+    """Checks the links that are due; returns (checked, dead) counts.
+
+    Extra keyword arguments (per_host, delay, session) go to check_many.
+    """
+    checked = dead = 0
+    if force:
+        cutoff = timezone.now()  # everything not done in this run
+    else:
+        cutoff = timezone.now() - timedelta(
+            seconds=_setting('LINKPILE_CHECK_INTERVAL', 7 * 86400)
+        )
+    if kwargs.get('session') is None:
+        kwargs['session'] = scraper.make_session(pool_size=workers)
+    while (limit is None) or (checked < limit):
+        size = batch_size if limit is None else min(batch_size, limit - checked)
+        batch = list(due_links(cutoff)[:size])
+        if not batch:
+            break
+        results = dict(check_many(batch, workers=workers, **kwargs))
+        for check in record(results):
+            checked += 1
+            dead += check.dead
+    return checked,dead
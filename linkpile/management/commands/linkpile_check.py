@@ -0,0 +1,43 @@
+from django.core.management.base import BaseCommand
+
+from linkpile import linkcheck
+
+
+class Command(BaseCommand):
+    help = 'Checks link URLs for rot and records the results.'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--limit', type=int, default=None,
+            help='Stop after this many links.'
+        )
+        parser.add_argument(
+            '--workers', type=int, default=None,
+            help='Number of concurrent requests (LINKPILE_CHECK_WORKERS).'
+        )
+        parser.add_argument(
+            '--per-host', type=int, default=None,
+            help='Concurrent requests per host (LINKPILE_CHECK_PER_HOST).'
+        )
+        parser.add_argument(
+            '--delay', type=float, default=None,
+            help='Seconds between requests to one host (LINKPILE_CHECK_HOST_DELAY).'
+        )
+        parser.add_argument(
+            '--batch-size', type=int, default=500,
+        )
+        parser.add_argument(
+            '--force', action='store_true',
+            help='Check every link, not just those due (LINKPILE_CHECK_INTERVAL).'
+        )
+
+    def handle(self, *args, **options):
+        checked,dead = linkcheck.check_links(
+            limit=options['limit'],
+            workers=options['workers'],
+            batch_size=options['batch_size'],
+            force=options['force'],
+            per_host=options['per_host'],
+            delay=options['delay'],
+        )
+        self.stdout.write('%s links checked, %s dead' % (checked, dead))
@@ -0,0 +1,40 @@
+from django.core.management.base import BaseCommand
+
+from linkpile import duplicates
+
+
+class Command(BaseCommand):
+    help = ('Lists links that point to the same page (or with --near, have nearly '
+            'the same title and description), optionally merging them.')
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--merge', action='store_true',
+            help='Merge each cluster into its oldest link.'
+        )
+        parser.add_argument(
+            '--near', action='store_true',
+            help='Cluster links by simhash instead of by URL.'
+        )
+        parser.add_argument(
+            '--distance', type=int, default=None,
+            help='Bits two simhashes may differ in (default LINKPILE_SIMHASH_DISTANCE).'
+        )
+
+    def handle(self, *args, **options):
+        clusters = 0
+        removed = 0
+        if options['near']:
+            found = duplicates.near_clusters(options['distance'])
+        else:
+            found = duplicates.clusters()
+        for cluster in found:
+            clusters += 1
+            removed += len(cluster) - 1
+            self.stdout.write(cluster[0].url)
+            for link in cluster:
+                self.stdout.write('  %s %s %s %s' % (link.id, link.date.date(), link.url, link.title))
+            if options['merge']:
+                duplicates.merge(cluster)
+        verb = 'merged' if options['merge'] else 'found'
+        self.stdout.write('%s clusters, %s duplicate links %s' % (clusters, removed, verb))
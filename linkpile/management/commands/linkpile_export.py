@@ -0,0 +1,58 @@
+import io
+import sys
+
+from django.core.management.base import BaseCommand, CommandError
+
+from linkpile import exporter
+from linkpile.models import parse_date
+
+
+class Command(BaseCommand):
+    help = 'Exports links as JSON or NDJSON (see Link.to_dict).'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '-o', '--output', default='-',
+            help='File to write; "-" for stdout.  *.gz implies --gzip.'
+        )
+        parser.add_argument(
+            '--format', choices=exporter.FORMATS, default='json',
+        )
+        parser.add_argument(
+            '--gzip', action='store_true',
+        )
+        parser.add_argument(
+            '--since', help='Only links dated at or after this date.'
+        )
+        parser.add_argument(
+            '--until', help='Only links dated before this date.'
+        )
+        parser.add_argument(
+            '--chunk-size', type=int, default=exporter.CHUNK_SIZE,
+        )
+
+    def handle(self, *args, **options):
+        try:
+            since = options['since'] and parse_date(options['since'])
+            until = options['until'] and parse_date(options['until'])
+        except ValueError as err:
+            raise CommandError(err)
+        path = options['output']
+        compress = options['gzip'] or path.endswith('.gz')
+        stream = exporter.export_links(
+            format=options['format'],
+            compress=compress,
+            since=since,
+            until=until,
+            chunk_size=options['chunk_size'],
+        )
+        if path == '-':
+            out = sys.stdout.buffer if compress else sys.stdout
+        else:
+            out = io.open(path, 'wb' if compress else 'w', encoding=None if compress else 'utf-8')
+        try:
+            for piece in stream:
+                out.write(piece)
+        finally:
+            if path != '-':
+                out.close()
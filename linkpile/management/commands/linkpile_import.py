@@ -0,0 +1,51 @@
+import gzip
+import io
+import sys
+
+from django.core.management.base import BaseCommand
+
+from linkpile import importer
+
+
+class Command(BaseCommand):
+    help = 'Imports links from a JSON array or NDJSON file (see Link.to_dict).'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            'path', help='File to read; "-" for stdin, *.gz is decompressed.'
+        )
+        parser.add_argument(
+            '--batch-size', type=int, default=importer.BATCH_SIZE,
+            help='Links per bulk insert and transaction.'
+        )
+        parser.add_argument(
+            '--skip-duplicates', action='store_true',
+            help='Skip links whose URL is already in the database.'
+        )
+        parser.add_argument(
+            '--skip-near-duplicates', action='store_true',
+            help='Skip links with nearly the same title and description as one '
+                 'already in the database (mirrors, AMP or syndicated copies).'
+        )
+
+    def handle(self, *args, **options):
+        if options['path'] == '-':
+            fp = sys.stdin
+        elif options['path'].endswith('.gz'):
+            fp = io.TextIOWrapper(gzip.open(options['path']), encoding='utf-8')
+        else:
+            fp = io.open(options['path'], 'r', encoding='utf-8')
+        try:
+            counts = importer.import_links(
+                fp,
+                batch_size=options['batch_size'],
+                skip_duplicates=options['skip_duplicates'],
+                skip_near_duplicates=options['skip_near_duplicates'],
+            )
+        finally:
+            if fp is not sys.stdin:
+                fp.close()
+        self.stdout.write(
+            '%(imported)s links imported, %(duplicates)s duplicates and '
+            '%(near_duplicates)s near duplicates skipped' % counts
+        )
@@ -0,0 +1,36 @@
+import time
+
+from django.core.management.base import BaseCommand
+
+from linkpile import related
+
+
+class Command(BaseCommand):
+    help = 'Computes related links for links saved since their list was computed.'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--rebuild', action='store_true',
+            help='Recompute the related links of every link.'
+        )
+        parser.add_argument(
+            '--engine', choices=['auto'] + sorted(related.ENGINES), default=None,
+            help='How to compute similarities (LINKPILE_RELATED_ENGINE).'
+        )
+        parser.add_argument(
+            '--loop', type=int, default=0, metavar='SECONDS',
+            help='Keep updating, sleeping SECONDS between runs.'
+        )
+
+    def handle(self, *args, **options):
+        engine = related.engine_name(options['engine'])
+        if options['rebuild']:
+            count = related.rebuild(engine)
+            self.stdout.write('%s links recomputed (%s)' % (count, engine))
+        while True:
+            count = related.update(engine)
+            if count or not options['loop']:
+                self.stdout.write('%s links updated (%s)' % (count, engine))
+            if not options['loop']:
+                break
+            time.sleep(options['loop'])
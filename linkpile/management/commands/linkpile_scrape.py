@@ -0,0 +1,54 @@
+import time
+
+from django.core.management.base import BaseCommand
+
+from linkpile import scrapecache
+from linkpile.models import Link
+
+
+class Command(BaseCommand):
+    help = 'Fetches titles for links waiting in the scrape queue.'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--failed', action='store_true',
+            help='Requeue links whose title is "[scrape failed]" first.'
+        )
+        parser.add_argument(
+            '--limit', type=int, default=None,
+            help='Stop after this many links.'
+        )
+        parser.add_argument(
+            '--workers', type=int, default=None,
+            help='Number of concurrent requests (LINKPILE_SCRAPE_WORKERS).'
+        )
+        parser.add_argument(
+            '--batch-size', type=int, default=100,
+        )
+        parser.add_argument(
+            '--loop', type=int, default=0, metavar='SECONDS',
+            help='Keep polling the queue, sleeping SECONDS between runs.'
+        )
+
+    def handle(self, *args, **options):
+        evicted = scrapecache.evict_stale()
+        if evicted:
+            self.stdout.write('%s stale cache entries evicted' % evicted)
+        if options['failed']:
+            requeued = Link.requeue_failed()
+            self.stdout.write('%s failed links requeued' % requeued)
+        while True:
+            scraped,failed = Link.scrape_pending(
+                limit=options['limit'],
+                workers=options['workers'],
+                batch_size=options['batch_size'],
+            )
+            if scraped or failed:
+                self.stdout.write('%s scraped, %s failed' % (scraped, failed))
+                self.stdout.write(
+                    'cache: %(hits)s hits, %(revalidated)s revalidated, '
+                    '%(misses)s misses' % scrapecache.stats()
+                )
+            if not options['loop']:
+                break
+            time.sleep(options['loop'])
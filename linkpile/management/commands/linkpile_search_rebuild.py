@@ -0,0 +1,23 @@
+import time
+
+from django.core.management.base import BaseCommand
+
+from linkpile import search
+
+
+class Command(BaseCommand):
+    help = 'Rebuilds the keyword search index from scratch.'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--backend', choices=sorted(search.BACKENDS.keys()),
+            help='Backend to rebuild (default: LINKPILE_SEARCH_BACKEND).'
+        )
+
+    def handle(self, *args, **options):
+        backend = search.get_backend(options['backend'])
+        start = time.time()
+        count = backend.rebuild()
+        self.stdout.write('%s: %s links indexed in %.1fs' % (
+            backend.name, count, time.time() - start
+        ))
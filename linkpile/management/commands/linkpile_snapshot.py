@@ -0,0 +1,42 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from linkpile import snapshots
+
+
+class Command(BaseCommand):
+    help = 'Stores local copies of linked pages, or reports on the store.'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--limit', type=int, default=None,
+            help='Stop after this many links.'
+        )
+        parser.add_argument(
+            '--workers', type=int, default=None,
+            help='Number of concurrent fetches (LINKPILE_SCRAPE_WORKERS).'
+        )
+        parser.add_argument(
+            '--force', action='store_true',
+            help='Fetch links that already have a snapshot again.'
+        )
+        parser.add_argument(
+            '--report', action='store_true',
+            help='Only print disk usage.'
+        )
+
+    def handle(self, *args, **options):
+        if not options['report']:
+            if not snapshots.enabled():
+                raise CommandError('Snapshots are disabled; set LINKPILE_SNAPSHOTS = True.')
+            stored,failed = snapshots.snapshot_links(
+                limit=options['limit'],
+                workers=options['workers'],
+                force=options['force'],
+            )
+            self.stdout.write('%s links stored, %s failed' % (stored, failed))
+        report = snapshots.report()
+        self.stdout.write(
+            '%(snapshots)s snapshots in %(blobs)s blobs: '
+            '%(size)s bytes of pages stored as %(stored_size)s bytes' % report
+        )
+        self.stdout.write('%(files)s files, %(disk)s bytes on disk' % report)
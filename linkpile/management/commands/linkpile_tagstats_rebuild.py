@@ -0,0 +1,14 @@
+import time
+
+from django.core.management.base import BaseCommand
+
+from linkpile import tagstats
+
+
+class Command(BaseCommand):
+    help = 'Recomputes the tag counts and co-occurrence tables.'
+
+    def handle(self, *args, **options):
+        start = time.time()
+        count = tagstats.rebuild()
+        self.stdout.write('%s tags counted in %.1fs' % (count, time.time() - start))
@@ -0,0 +1,43 @@
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand, CommandError
+
+from linkpile.models import ApiToken
+
+
+class Command(BaseCommand):
+    help = 'Creates, lists or revokes API tokens for the bulk links API.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('username')
+        parser.add_argument(
+            '--name', default='',
+            help='What the token is for, e.g. "browser extension".'
+        )
+        parser.add_argument(
+            '--list', action='store_true',
+            help="List the user's tokens instead of creating one."
+        )
+        parser.add_argument(
+            '--revoke', type=int, default=None, metavar='ID',
+            help='Delete the token with this id.'
+        )
+
+    def handle(self, *args, **options):
+        try:
+            user = User.objects.get(username=options['username'])
+        except User.DoesNotExist:
+            raise CommandError('No user named %s' % options['username'])
+        tokens = ApiToken.objects.filter(user=user)
+        if options['list']:
+            for token in tokens.order_by('id'):
+                self.stdout.write('%s %s created %s last used %s' % (
+                    token.id, token.name or '-', token.created, token.last_used or 'never'
+                ))
+        elif options['revoke'] is not None:
+            deleted,_ = tokens.filter(id=options['revoke']).delete()
+            if not deleted:
+                raise CommandError('%s has no token %s' % (user.username, options['revoke']))
+            self.stdout.write('Token %s revoked' % options['revoke'])
+        else:
+            token,key = ApiToken.create(user, options['name'])
+            self.stdout.write(key)
@@ -0,0 +1,229 @@
+# -*- coding: utf-8 -*-
+"""Per-request performance metrics.
+
+Off unless LINKPILE_METRICS is True; MetricsMiddleware then removes
+itself at startup, and the timer() hooks in Link.scrape, paginate, the
+linkpile_link(s) tags and view rendering cost one thread-local lookup.
+
+When on, each request records its total time, SQL time and query count
+(from the connections' query logs, forced on for the request), and the
+time spent in each timer(), keyed by URL name.  The last
+LINKPILE_METRICS_WINDOW values of each are kept in this process for
+percentiles.  /metrics/ serves them in the Prometheus text format, and
+with LINKPILE_METRICS_SERVER_TIMING (default True) each response carries
+a Server-Timing header.  Streaming responses are timed until the
+response is returned, not until the body has been sent.
+"""
+
+from collections import OrderedDict, defaultdict, deque
+import threading
+import time
+
+from django.conf import settings
+from django.core.exceptions import MiddlewareNotUsed
+from django.db import connections
+
+# metric: (help text, True if the values are seconds)
+METRICS = OrderedDict([
+    ('request', ('Time spent handling the request.', True)),
+    ('sql', ('Time spent in SQL queries.', True)),
+    ('queries', ('Number of SQL queries.', False)),
+    ('render', ('Time spent rendering templates.', True)),
+    ('link_tag', ('Time spent in the linkpile_link(s) template tags.', True)),
+    ('paginate', ('Time spent paginating.', True)),
+    ('scrape', ('Time spent scraping pages.', True)),
+])
+QUANTILES = [0.5, 0.9, 0.99]
+
+_local = threading.local()
+
+
+def enabled():
+    return getattr(settings, 'LINKPILE_METRICS', False)
+
+
+class Series(object):
+    """Recent values of one metric, with running totals.
+    """
+
+    def __init__(self, window):
+        self.values = deque(maxlen=window)
+        self.count = 0
+        self.sum = 0
+
+    def observe(self, value):
+        self.values.append(value)
+        self.count += 1
+        self.sum += value
+
+    def quantile(self, q):
+        return quantile(sorted(self.values), q)
+
+
+class Aggregator(object):
+    """Series by (metric, view), shared by all threads of the process.
+    """
+
+    def __init__(self, window=1000):
+        self.window = window
+        self._lock = threading.Lock()
+        self._series = {}
+
+    def observe(self, view, values):
+        """Adds {metric: value} recorded for one request to view.
+        """
+        with self._lock:
+            for metric,value in values.items():
+                key = (metric, view)
+                if key not in self._series:
+                    self._series[key] = Series(self.window)
+                self._series[key].observe(value)
+
+    def series(self, metric, view):
+        return self._series.get((metric, view))
+
+    def reset(self):
+        with self._lock:
+            self._series = {}
+
+    def prometheus(self):
+        """The metrics as Prometheus summaries, one per metric.
+        """
+        with self._lock:
+            snapshot = {
+                key: (sorted(series.values), series.count, series.sum)
+                for key,series in self._series.items()
+            }
+        lines = []
+        for metric,(help_text,seconds) in METRICS.items():
+            name = 'linkpile_%s%s' % (metric, '_seconds' if seconds else '')
+            views = sorted(view for m,view in snapshot if m == metric)
+            if not views:
+                continue
+            lines.append('# HELP %s %s' % (name, help_text))
+            lines.append('# TYPE %s summary' % name)
+            for view in views:
+                values,count,total = snapshot[(metric, view)]
+                label = _label(view)
+                for q in QUANTILES:
+                    lines.append('%s{view="%s",quantile="%s"} %s' % (
+                        name, label, q, _number(quantile(values, q))
+                    ))
+                lines.append('%s_sum{view="%s"} %s' % (name, label, _number(total)))
+                lines.append('%s_count{view="%s"} %s' % (name, label, count))
+        return '\n'.join(lines) + '\n'
+
+def quantile(values, q):
+    """The q quantile (0 to 1) of sorted values; 0 if there are none.
+    """
+    if not values:
+        return 0
+    return values[min(int(q * len(values)), len(values) - 1)]
+
+def _label(value):
+    return value.replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+def _number(value):
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+aggregator = Aggregator(getattr(settings, 'LINKPILE_METRICS_WINDOW', 1000))
+
+
+class RequestMetrics(object):
+    """Timings collected during one request.
+    """
+
+    def __init__(self):
+        self.timings = defaultdict(float)
+
+
+class _Timer(object):
+
+    def __init__(self, current, name):
+        self.current = current
+        self.name = name
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+
+    def __exit__(self, *exc):
+        self.current.timings[self.name] += time.perf_counter() - self.start
+
+
+class _NullTimer(object):
+
+    def __enter__(self):
+        pass
+
+    def __exit__(self, *exc):
+        pass
+
+NULL_TIMER = _NullTimer()
+
+
+def timer(name):
+    """Context manager adding the time spent in it to the current request.
+
+    Does nothing outside instrumented requests.
+    """
+    current = getattr(_local, 'current', None)
+    if current is None:
+        return NULL_TIMER
+    return _Timer(current, name)
+
+def server_timing(values):
+    """Server-Timing header value for a request's {metric: value}.
+    """
+    parts = []
+    for metric,(help_text,seconds) in METRICS.items():
+        if (metric in values) and seconds:
+            part = '%s;dur=%.1f' % (metric, values[metric] * 1000)
+            if metric == 'sql':
+                part += ';desc="%s queries"' % values.get('queries', 0)
+            parts.append(part)
+    return ', '.join(parts)
+
+
+class MetricsMiddleware(object):
+    """Records per-view metrics; put it first in MIDDLEWARE.
+    """
+
+    def __init__(self, get_response=None):
+        if not enabled():
+            raise MiddlewareNotUsed
+        self.get_response = get_response
+
+    def __call__(self, request):
+        conns = connections.all()
+        forced = [conn.force_debug_cursor for conn in conns]
+        logged = []
+        for conn in conns:
+            conn.force_debug_cursor = True
+            logged.append(len(conn.queries_log))
+        current = _local.current = RequestMetrics()
+        start = time.perf_counter()
+        try:
+            response = self.get_response(request)
+        finally:
+            elapsed = time.perf_counter() - start
+            _local.current = None
+            sql = queries = 0
+            for conn,was_forced,n in zip(conns, forced, logged):
+                conn.force_debug_cursor = was_forced
+                # the log is a bounded deque; past 9000 queries this undercounts
+                for query in list(conn.queries_log)[n:]:
+                    queries += 1
+                    sql += float(query['time'])
+        values = dict(current.timings)
+        values.update({'request': elapsed, 'sql': sql, 'queries': queries})
+        aggregator.observe(_view_name(request), values)
+        if getattr(settings, 'LINKPILE_METRICS_SERVER_TIMING', True):
+            response['Server-Timing'] = server_timing(values)
+        return response
+
+def _view_name(request):
+    match = getattr(request, 'resolver_match', None)
+    if match is None:
+        return '<unresolved>'
+    return match.url_name or match.view_name
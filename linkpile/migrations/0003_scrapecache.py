@@ -0,0 +1,30 @@
+# -*- coding: utf-8 -*-
+# Generated by Django 1.11.29 on 2026-10-18 15:18
+from __future__ import unicode_literals
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('linkpile', '0002_scrape_status'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ScrapeCache',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('url_key', models.CharField(max_length=40, unique=True)),
+                ('url', models.CharField(max_length=400)),
+                ('final_url', models.CharField(blank=True, max_length=400)),
+                ('status', models.IntegerField(blank=True, null=True)),
+                ('title', models.CharField(blank=True, max_length=200)),
+                ('description', models.TextField(blank=True)),
+                ('etag', models.CharField(blank=True, max_length=200)),
+                ('last_modified', models.CharField(blank=True, max_length=64)),
+                ('fetched', models.DateTimeField(db_index=True)),
+            ],
+        ),
+    ]
@@ -0,0 +1,41 @@
+# -*- coding: utf-8 -*-
+# Generated by Django 1.11.29 on 2026-10-18 15:22
+from __future__ import unicode_literals
+
+from django.db import migrations, models
+
+from linkpile.urlnorm import url_domain
+
+
+def backfill_domains(apps, schema_editor):
+    """Fills in Link.domain; one UPDATE per distinct domain.
+    """
+    Link = apps.get_model('linkpile', 'Link')
+    ids_by_domain = {}
+    for link_id,url in Link.objects.values_list('id', 'url').iterator():
+        ids_by_domain.setdefault(url_domain(url or ''), []).append(link_id)
+    for domain,ids in ids_by_domain.items():
+        if not domain:
+            continue
+        for n in range(0, len(ids), 500):
+            Link.objects.filter(id__in=ids[n:n+500]).update(domain=domain)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('linkpile', '0003_scrapecache'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='link',
+            name='domain',
+            field=models.CharField(blank=True, default='', editable=False, max_length=255),
+        ),
+        migrations.AddIndex(
+            model_name='link',
+            index=models.Index(fields=['domain', '-date'], name='linkpile_domain_date'),
+        ),
+        migrations.RunPython(backfill_domains, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,62 @@
+# -*- coding: utf-8 -*-
+from __future__ import unicode_literals
+
+from django.db import migrations
+from django.db.utils import OperationalError
+
+# As linkpile.search had them when this migration was written; spelled
+# out so that later changes there do not change what it creates.
+FTS_TABLE = 'linkpile_link_fts'
+FTS_COLUMNS = 'title, description, url, tags'
+GIN_INDEX = 'linkpile_link_search'
+VECTOR = (
+    "setweight(to_tsvector('simple', coalesce(title, '')), 'A') || "
+    "setweight(to_tsvector('simple', coalesce(description, '')), 'C') || "
+    "setweight(to_tsvector('simple', coalesce(url, '')), 'D') || "
+    "setweight(to_tsvector('simple', coalesce(tags, '')), 'B')"
+)
+
+
+def create_search_index(apps, schema_editor):
+    """FTS5 table on SQLite, GIN index on PostgreSQL, nothing elsewhere.
+    """
+    vendor = schema_editor.connection.vendor
+    columns = FTS_COLUMNS
+    if vendor == 'sqlite':
+        try:
+            schema_editor.execute(
+                'CREATE VIRTUAL TABLE IF NOT EXISTS %s USING fts5(%s, '
+                'tokenize="unicode61")' % (FTS_TABLE, columns)
+            )
+        except OperationalError:
+            # no FTS5 in this SQLite; search falls back to the python backend
+            return
+        schema_editor.execute(
+            'INSERT INTO %s (rowid, %s) SELECT id, %s FROM linkpile_link' % (
+                FTS_TABLE, columns, columns
+            )
+        )
+    elif vendor == 'postgresql':
+        schema_editor.execute(
+            'CREATE INDEX IF NOT EXISTS %s ON linkpile_link USING gin((%s))' % (
+                GIN_INDEX, VECTOR
+            )
+        )
+
+def drop_search_index(apps, schema_editor):
+    vendor = schema_editor.connection.vendor
+    if vendor == 'sqlite':
+        schema_editor.execute('DROP TABLE IF EXISTS %s' % FTS_TABLE)
+    elif vendor == 'postgresql':
+        schema_editor.execute('DROP INDEX IF EXISTS %s' % GIN_INDEX)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('linkpile', '0004_link_domain'),
+    ]
+
+    operations = [
+        migrations.RunPython(create_search_index, drop_search_index),
+    ]
@@ -0,0 +1,20 @@
+# -*- coding: utf-8 -*-
+# Generated by Django 1.11.29 on 2026-10-18 15:28
+from __future__ import unicode_literals
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('linkpile', '0005_search_index'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='link',
+            name='modified',
+            field=models.DateTimeField(auto_now=True),
+        ),
+    ]
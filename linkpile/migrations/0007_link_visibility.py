@@ -0,0 +1,40 @@
+# -*- coding: utf-8 -*-
+# Generated by Django 1.11.29 on 2026-10-18 15:32
+from __future__ import unicode_literals
+
+from django.db import migrations, models
+
+
+def backfill_visibility(apps, schema_editor):
+    """Fills in Link.visibility; one UPDATE per combination of flags.
+
+    The bits (public 1, friends 2, family 4) are spelled out here rather
+    than taken from linkpile.models, so that this migration keeps doing
+    what it did when it was written.
+    """
+    Link = apps.get_model('linkpile', 'Link')
+    for public in [False, True]:
+        for friends in [False, True]:
+            for family in [False, True]:
+                Link.objects.filter(
+                    public=public, friends=friends, family=family
+                ).update(visibility=public * 1 | friends * 2 | family * 4)
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('linkpile', '0006_link_modified'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='link',
+            name='visibility',
+            field=models.PositiveSmallIntegerField(default=0, editable=False),
+        ),
+        migrations.AddIndex(
+            model_name='link',
+            index=models.Index(fields=['visibility', '-date'], name='linkpile_visibility_date'),
+        ),
+        migrations.RunPython(backfill_visibility, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,40 @@
+# -*- coding: utf-8 -*-
+# Generated by Django 1.11.29 on 2026-10-18 15:33
+from __future__ import unicode_literals
+
+from django.db import migrations, models
+from django.db.models import Case, CharField, Value, When
+
+from linkpile.urlnorm import url_hash
+
+BATCH_SIZE = 500
+
+
+def backfill_url_hashes(apps, schema_editor):
+    """Fills in Link.url_hash; one UPDATE ... CASE per batch of links.
+    """
+    Link = apps.get_model('linkpile', 'Link')
+    rows = list(Link.objects.values_list('id', 'url').iterator())
+    for n in range(0, len(rows), BATCH_SIZE):
+        batch = rows[n:n+BATCH_SIZE]
+        Link.objects.filter(id__in=[link_id for link_id,_ in batch]).update(
+            url_hash=Case(
+                *[When(id=link_id, then=Value(url_hash(url or ''))) for link_id,url in batch],
+                output_field=CharField()
+            )
+        )
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('linkpile', '0007_link_visibility'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='link',
+            name='url_hash',
+            field=models.CharField(blank=True, db_index=True, default='', editable=False, max_length=40),
+        ),
+        migrations.RunPython(backfill_url_hashes, migrations.RunPython.noop),
+    ]
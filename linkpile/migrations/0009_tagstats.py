@@ -0,0 +1,97 @@
+# -*- coding: utf-8 -*-
+# Generated by Django 1.11.29 on 2026-10-18 15:35
+from __future__ import unicode_literals
+
+from collections import defaultdict
+from itertools import combinations
+
+from django.db import migrations, models
+
+# Viewer classes and the Link.visibility bits (public 1, friends 2,
+# family 4) each may see, as they were when this migration was written;
+# spelled out so that later changes to linkpile.tagstats or the models do
+# not change what it computes.  Staff see every link.
+MASKS = [('public', 1), ('member', 7), ('staff', None)]
+
+
+def _visible(visibility):
+    return [
+        mask is None or bool(visibility & mask) for vclass,mask in MASKS
+    ]
+
+def _fields(counts):
+    return {'%s_count' % vclass: count for (vclass,mask),count in zip(MASKS, counts)}
+
+def fill_tag_stats(apps, schema_editor):
+    """Computes TagStat and TagPair from the existing tags.
+    """
+    Link = apps.get_model('linkpile', 'Link')
+    TagStat = apps.get_model('linkpile', 'TagStat')
+    TagPair = apps.get_model('linkpile', 'TagPair')
+    ContentType = apps.get_model('contenttypes', 'ContentType')
+    TaggedItem = apps.get_model('tagging', 'TaggedItem')
+    ctype = ContentType.objects.filter(app_label='linkpile', model='link').first()
+    if ctype is None:
+        return
+    visibility = dict(Link.objects.values_list('id', 'visibility').iterator())
+    names = defaultdict(list)
+    items = TaggedItem.objects.filter(content_type_id=ctype.id)
+    for object_id,name in items.values_list('object_id', 'tag__name').iterator():
+        if object_id in visibility:
+            names[object_id].append(name)
+    tags = defaultdict(lambda: [0] * len(MASKS))
+    pairs = defaultdict(lambda: [0] * len(MASKS))
+    for pk,link_names in names.items():
+        seen = _visible(visibility[pk])
+        link_names = sorted(set(link_names))
+        for name in link_names:
+            tags[name] = [n + v for n,v in zip(tags[name], seen)]
+        for a,b in combinations(link_names, 2):
+            for key in [(a, b), (b, a)]:
+                pairs[key] = [n + v for n,v in zip(pairs[key], seen)]
+    TagStat.objects.bulk_create([
+        TagStat(name=name, **_fields(counts))
+        for name,counts in tags.items()
+    ], batch_size=500)
+    TagPair.objects.bulk_create([
+        TagPair(tag=tag, other=other, **_fields(counts))
+        for (tag,other),counts in pairs.items()
+    ], batch_size=500)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('contenttypes', '0002_remove_content_type_name'),
+        ('linkpile', '0008_link_url_hash'),
+        ('tagging', '0003_adapt_max_tag_length'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='TagPair',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('tag', models.CharField(max_length=50)),
+                ('other', models.CharField(max_length=50)),
+                ('public_count', models.IntegerField(default=0)),
+                ('member_count', models.IntegerField(default=0)),
+                ('staff_count', models.IntegerField(default=0)),
+            ],
+        ),
+        migrations.CreateModel(
+            name='TagStat',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('name', models.CharField(max_length=50, unique=True)),
+                ('public_count', models.IntegerField(default=0)),
+                ('member_count', models.IntegerField(default=0)),
+                ('staff_count', models.IntegerField(default=0)),
+            ],
+        ),
+        migrations.AlterUniqueTogether(
+            name='tagpair',
+            unique_together=set([('tag', 'other')]),
+        ),
+        migrations.RunPython(fill_tag_stats, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,28 @@
+# -*- coding: utf-8 -*-
+# Generated by Django 1.11.29 on 2026-10-18 15:38
+from __future__ import unicode_literals
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('linkpile', '0009_tagstats'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='LinkCheck',
+            fields=[
+                ('link', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, primary_key=True, serialize=False, to='linkpile.Link')),
+                ('status', models.IntegerField(blank=True, null=True)),
+                ('final_url', models.CharField(blank=True, max_length=400)),
+                ('error', models.CharField(blank=True, max_length=200)),
+                ('failures', models.PositiveIntegerField(default=0)),
+                ('dead', models.BooleanField(db_index=True, default=False)),
+                ('checked', models.DateTimeField(db_index=True)),
+            ],
+        ),
+    ]
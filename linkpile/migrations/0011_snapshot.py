@@ -0,0 +1,30 @@
+# -*- coding: utf-8 -*-
+# Generated by Django 1.11.29 on 2026-10-18 15:40
+from __future__ import unicode_literals
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('linkpile', '0010_linkcheck'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='Snapshot',
+            fields=[
+                ('link', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, primary_key=True, serialize=False, to='linkpile.Link')),
+                ('sha256', models.CharField(db_index=True, max_length=64)),
+                ('status', models.IntegerField()),
+                ('final_url', models.CharField(blank=True, max_length=400)),
+                ('content_type', models.CharField(blank=True, max_length=100)),
+                ('size', models.BigIntegerField()),
+                ('stored_size', models.BigIntegerField()),
+                ('truncated', models.BooleanField(default=False)),
+                ('fetched', models.DateTimeField()),
+            ],
+        ),
+    ]
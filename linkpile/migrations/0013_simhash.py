@@ -0,0 +1,73 @@
+# -*- coding: utf-8 -*-
+# Generated by Django 1.11.29 on 2026-10-18 15:54
+from __future__ import unicode_literals
+
+from collections import defaultdict
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+from linkpile import simhash
+from linkpile.scrape import SCRAPE_FAILED_TITLE
+
+BATCH_SIZE = 500
+
+
+def fingerprint(title, description, domain):
+    if (not title) or (title == SCRAPE_FAILED_TITLE):
+        return None
+    return simhash.fingerprint(title, description, domain)
+
+def backfill_simhashes(apps, schema_editor):
+    """Fills in Link.simhash and the SimHashBand rows, a batch at a time.
+    """
+    Link = apps.get_model('linkpile', 'Link')
+    SimHashBand = apps.get_model('linkpile', 'SimHashBand')
+    rows = list(Link.objects.values_list('id', 'title', 'description', 'domain').iterator())
+    for n in range(0, len(rows), BATCH_SIZE):
+        ids_by_value = defaultdict(list)
+        bands = []
+        for link_id,title,description,domain in rows[n:n+BATCH_SIZE]:
+            value = fingerprint(title, description, domain)
+            if value is None:
+                continue
+            ids_by_value[value].append(link_id)
+            bands += [
+                SimHashBand(link_id=link_id, band=band, value=band_value)
+                for band,band_value in simhash.bands(value)
+            ]
+        for value,ids in ids_by_value.items():
+            Link.objects.filter(id__in=ids).update(simhash=value)
+        SimHashBand.objects.bulk_create(bands)
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('linkpile', '0012_apitoken'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='SimHashBand',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('band', models.PositiveSmallIntegerField()),
+                ('value', models.PositiveIntegerField()),
+            ],
+        ),
+        migrations.AddField(
+            model_name='link',
+            name='simhash',
+            field=models.BigIntegerField(blank=True, editable=False, null=True),
+        ),
+        migrations.AddField(
+            model_name='simhashband',
+            name='link',
+            field=models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to='linkpile.Link'),
+        ),
+        migrations.AddIndex(
+            model_name='simhashband',
+            index=models.Index(fields=['band', 'value'], name='linkpile_simhash_band'),
+        ),
+        migrations.RunPython(backfill_simhashes, migrations.RunPython.noop),
+    ]
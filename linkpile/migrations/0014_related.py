@@ -0,0 +1,45 @@
+# -*- coding: utf-8 -*-
+# Generated by Django 1.11.29 on 2026-10-18 15:58
+from __future__ import unicode_literals
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('linkpile', '0013_simhash'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='RelatedLink',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('rank', models.PositiveSmallIntegerField()),
+                ('score', models.FloatField()),
+            ],
+        ),
+        migrations.CreateModel(
+            name='RelatedState',
+            fields=[
+                ('link', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, primary_key=True, serialize=False, to='linkpile.Link')),
+                ('computed', models.DateTimeField()),
+            ],
+        ),
+        migrations.AddField(
+            model_name='relatedlink',
+            name='link',
+            field=models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='related_links', to='linkpile.Link'),
+        ),
+        migrations.AddField(
+            model_name='relatedlink',
+            name='other',
+            field=models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='related_to', to='linkpile.Link'),
+        ),
+        migrations.AlterUniqueTogether(
+            name='relatedlink',
+            unique_together=set([('link', 'rank')]),
+        ),
+    ]
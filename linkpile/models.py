@@ -1,22 +1,120 @@
 # -*- coding: utf-8 -*-
 
 from datetime import datetime
-import random
-from urllib.parse import urlparse
+import hashlib
+import secrets
 
-from bs4 import BeautifulSoup
 from dateutil import parser
 import pytz
-import requests
 
 from django.conf import settings
 from django.contrib.auth.models import User
-from django.core.urlresolvers import reverse
-from django.db import models
+from django.core.urlresolvers import get_script_prefix, get_urlconf, reverse
+from django.db import models, transaction
 from django.utils.timezone import utc
 
 from tagging.fields import TagField
 
+from linkpile import metrics
+from linkpile import scrape as scraper
+from linkpile import scrapecache
+from linkpile import simhash
+from linkpile.signals import links_bulk_saved, saving_link
+from linkpile.urlnorm import url_domain, url_hash
+
+SCRAPE_PENDING = 'pending'
+SCRAPE_DONE = 'done'
+SCRAPE_FAILED = 'failed'
+SCRAPE_STATUS_CHOICES = (
+    (SCRAPE_PENDING, 'Pending'),
+    (SCRAPE_DONE, 'Done'),
+    (SCRAPE_FAILED, 'Failed'),
+)
+SCRAPE_FAILED_TITLE = scraper.SCRAPE_FAILED_TITLE
+
+# What a viewer may see: anonymous users only public links, logged-in
+# users public, friends and family links, staff everything.
+VIEWER_PUBLIC = 'public'
+VIEWER_MEMBER = 'member'
+VIEWER_STAFF = 'staff'
+VIEWER_CLASSES = [VIEWER_PUBLIC, VIEWER_MEMBER, VIEWER_STAFF]
+
+# Link.visibility packs the public/friends/family flags into one indexed
+# column; a viewer class sees a link if any of its bits are set.
+VISIBILITY_PUBLIC = 1
+VISIBILITY_FRIENDS = 2
+VISIBILITY_FAMILY = 4
+VISIBILITY_SHARED = VISIBILITY_FRIENDS | VISIBILITY_FAMILY
+VIEWER_MASKS = {
+    VIEWER_PUBLIC: VISIBILITY_PUBLIC,
+    VIEWER_MEMBER: VISIBILITY_PUBLIC | VISIBILITY_SHARED,
+    VIEWER_STAFF: None,  # everything, including links with no bits set
+}
+
+URL_SENTINEL = 918273645
+
+def link_fingerprint( title, description, domain ):
+    """linkpile.simhash fingerprint of a link, None until it has a title.
+    """
+    if (not title) or (title == SCRAPE_FAILED_TITLE):
+        return None
+    return simhash.fingerprint(title, description, domain)
+
+def parse_date(text, tz=None):
+    """Parses an ISO 8601 (or looser) date; naive dates get tz.
+    """
+    try:
+        dt = datetime.fromisoformat(text)
+    except (AttributeError, ValueError):
+        dt = parser.parse(text)
+    if dt.tzinfo is None:
+        if tz is None:
+            tz = pytz.timezone(settings.TIME_ZONE)
+        dt = tz.localize(dt)
+    return dt
+
+def visibility_bits( public, friends, family ):
+    """Link.visibility value for these flags.
+    """
+    bits = 0
+    if public:
+        bits |= VISIBILITY_PUBLIC
+    if friends:
+        bits |= VISIBILITY_FRIENDS
+    if family:
+        bits |= VISIBILITY_FAMILY
+    return bits
+
+def visibility_values( mask ):
+    """Every Link.visibility value sharing a bit with mask.
+    
+    >>> visibility_values(VISIBILITY_PUBLIC)
+    [1, 3, 5, 7]
+    """
+    return [bits for bits in range(8) if bits & mask]
+
+_url_templates = {}
+
+def link_url(name, link_id):
+    """reverse(name, args=[link_id]), resolving the URL pattern only once.
+    
+    Listing pages build two URLs per link; this turns all but the first
+    reverse() into string formatting.
+    """
+    key = (name, get_script_prefix(), get_urlconf())
+    if key not in _url_templates:
+        url = reverse(name, args=[URL_SENTINEL])
+        _url_templates[key] = url.replace(str(URL_SENTINEL), '%s')
+    return _url_templates[key] % link_id
+
+
+class LinkQuerySet( models.QuerySet ):
+    
+    def visible_to( self, viewer ):
+        """Links that viewer (a user, None or one of VIEWER_CLASSES) may see.
+        """
+        return filter_visible(self, viewer)
+
 
 class Link( models.Model ):
     """
@@ -31,10 +129,39 @@ class Link( models.Model ):
     url = models.CharField(max_length=400)
     date = models.DateTimeField('Date published')
     tags = TagField(blank=True, null=True)
+    domain = models.CharField(max_length=255, blank=True, default='', editable=False)
+    url_hash = models.CharField(
+        max_length=40, blank=True, default='', editable=False, db_index=True,
+    )
+    modified = models.DateTimeField(auto_now=True)
+    scrape_status = models.CharField(
+        max_length=10, choices=SCRAPE_STATUS_CHOICES, blank=True, default='',
+        db_index=True,
+    )
+    visibility = models.PositiveSmallIntegerField(default=0, editable=False)
+    simhash = models.BigIntegerField(blank=True, null=True, editable=False)
+    
+    objects = LinkQuerySet.as_manager()
     
     class Meta:
         ordering = ('-date',)
         get_latest_by = 'date'
+        indexes = [
+            models.Index(fields=['domain', '-date'], name='linkpile_domain_date'),
+            models.Index(fields=['visibility', '-date'], name='linkpile_visibility_date'),
+            # keyset pages and export chunks, ordered by (date, id)
+            models.Index(fields=['date', 'id'], name='linkpile_date_id'),
+        ]
+    
+    @classmethod
+    def from_db( cls, db, field_names, values ):
+        link = super(Link, cls).from_db(db, field_names, values)
+        # stored values, so that receivers can tell what a save changed
+        # (a link made private, tags removed, ...)
+        for name in ['title', 'visibility', 'tags', 'simhash']:
+            if name in field_names:
+                setattr(link, '_db_%s' % name, values[field_names.index(name)])
+        return link
     
     def __repr__( self ):
         return u'<Link %s %s>' % (self.id, self.title)
@@ -43,10 +170,10 @@ class Link( models.Model ):
         return u'%s' %(self.title)
     
     def absolute_url( self ):
-        return reverse('linkpile-link', args=[self.id])
+        return link_url('linkpile-link', self.id)
     
     def edit_url( self ):
-        return reverse('linkpile-edit', args=[self.id])
+        return link_url('linkpile-edit', self.id)
     
     def archive_url( self ):
         """Link URL at archive.org
@@ -54,12 +181,19 @@ class Link( models.Model ):
         return 'https://web.archive.org/web/*/%s' % self.url
 
     @staticmethod
-    def from_dict(data):
-        dt = pytz.timezone(settings.TIME_ZONE).localize(
-            parser.parse(data['date'])
-        )
+    def from_dict(data, users=None, tz=None):
+        """Unsaved Link from to_dict() output.
+        
+        Bulk callers can pass `users`, a dict of User objects by username
+        that is used (and filled in) instead of a query per record, and
+        `tz`, the timezone for naive dates.
+        """
+        if users is None:
+            users = {}
+        if data['user'] not in users:
+            users[data['user']] = User.objects.get(username=data['user'])
         link = Link(
-            user = User.objects.get(username=data['user']),
+            user = users[data['user']],
             family = data['family'],
             friends = data['friends'],
             public = data['public'],
@@ -67,8 +201,8 @@ class Link( models.Model ):
             title = data['title'],
             description = data['description'],
             url = data['url'],
-            date = dt,
-            tags = data['tags'], # TODO tag objects
+            date = parse_date(data['date'], tz),
+            tags = data['tags'],
         )
         return link
 
@@ -86,12 +220,34 @@ class Link( models.Model ):
             'tags': self.tags,
         }
 
-    def save( self, *args, **kwargs ):
+    def fill_computed_fields( self ):
+        """Sets fields derived from the others; called before saving.
+        
+        Anything that writes Links without save() (bulk_create) must
+        call this itself.
+        """
         if not self.date:
             self.date = datetime.utcnow().replace(tzinfo=utc)
+        # remembered so the old domain's cached count can be dropped too
+        self._old_domain = self.domain
+        self.domain = url_domain(self.url or '')
+        self.url_hash = url_hash(self.url or '')
+        self.visibility = visibility_bits(self.public, self.friends, self.family)
+        self.simhash = link_fingerprint(self.title, self.description, self.domain)
+        # title is filled in later by the scrape queue (linkpile_scrape)
         if self.url and not self.title:
-            self.title = Link.scrape(self.url)
-        super(Link, self).save(*args, **kwargs)
+            self.scrape_status = SCRAPE_PENDING
+        elif self.scrape_status == SCRAPE_PENDING:
+            self.scrape_status = ''
+    
+    def save( self, *args, **kwargs ):
+        self.fill_computed_fields()
+        with saving_link():
+            super(Link, self).save(*args, **kwargs)
+        self._db_title = self.title
+        self._db_visibility = self.visibility
+        self._db_tags = self.tags
+        self._db_simhash = self.simhash
     
     def can_edit( self, user ):
         """
@@ -102,21 +258,24 @@ class Link( models.Model ):
         return False
     
     def can_view( self, user, family, friends ):
-        """
-        TODO refactor
+        """True if user may see this link, given the owner's family and friends.
+        
+        Links shared with friends and family are visible to either group;
+        links shared with one group only to users who are in that group
+        and not the other.
         """
         if not family and friends:
             return False
-        if self.public: return True
-        if (self.friends and self.family) and ((user in friends) or (user in family)):
-            return True
-        if (self.friends and not self.family) and (user in friends) and (user not in family):
-            return True
-        if (self.family and not self.friends) and (user in family) and (user not in friends):
+        bits = visibility_bits(self.public, self.friends, self.family)
+        if (bits & VISIBILITY_PUBLIC) or user.is_staff:
             return True
-        if user.is_staff:
-            return True
-        return False
+        groups = 0
+        if user in friends:
+            groups |= VISIBILITY_FRIENDS
+        if user in family:
+            groups |= VISIBILITY_FAMILY
+        shared = bits & VISIBILITY_SHARED
+        return bool(groups) and (shared in [groups, VISIBILITY_SHARED])
 
     def private( self ):
         """
@@ -130,64 +289,339 @@ class Link( models.Model ):
     def get_recent( num_items=10 ):
         """Gets the N most recent Links
         """
-        return Link.objects.filter(public=True)[:num_items]
+        return Link.objects.visible_to(VIEWER_PUBLIC)[:num_items]
     
     @staticmethod
-    def get_random():
-        """Gets a random Link; sometimes returns None
-        """
-        link = None
-        objects_by_id = Link.objects.order_by('-id')
-        if objects_by_id:
-            max_id = objects_by_id[0].id
-            random_id = random.randint(1, max_id + 1)
-            attempts = 0
-            while( (not link) and (attempts < 10) ):
-                try:
-                    link = Link.objects.get(id=random_id)
-                except:
-                    pass
-                finally:
-                    attempts = attempts + 1
-        return link
+    def find_duplicate( url ):
+        """Oldest Link whose URL is the same page as url, or None.
+        
+        See linkpile.urlnorm.canonical_url.
+        """
+        return Link.objects.filter(url_hash=url_hash(url)).order_by('id').first()
+    
+    def near_duplicates( self, viewer=None ):
+        """Other links viewer may see with nearly the same title and description.
+        
+        See linkpile.duplicates.near_duplicates.
+        """
+        from linkpile import duplicates
+        if self.simhash is None:
+            return []
+        return duplicates.near_duplicates(self.simhash, exclude=[self.id], viewer=viewer)
+    
+    def related( self, viewer=None, limit=None ):
+        """Most similar links that viewer may see, best first.
+        
+        Reads the lists stored by linkpile.related with one query on the
+        (link, rank) index; at most limit (LINKPILE_RELATED_LINKS) links.
+        """
+        if limit is None:
+            limit = getattr(settings, 'LINKPILE_RELATED_LINKS', 5)
+        links = Link.objects.filter(related_to__link=self.id).visible_to(viewer)
+        return list(links.order_by('related_to__rank')[:limit])
     
     @staticmethod
-    def scrape( url ):
+    def get_random( user=None ):
+        """Gets a random Link that user may see, or None if there are none.
+        
+        See linkpile.randomlinks.
+        """
+        from linkpile import randomlinks
+        return randomlinks.pick(user)
+    
+    def visible_to_class( self, viewer_class ):
+        """True if viewers in viewer_class may see this link.
+        """
+        mask = VIEWER_MASKS[viewer_class]
+        if mask is None:
+            return True
+        return bool(visibility_bits(self.public, self.friends, self.family) & mask)
+    
+    @staticmethod
+    def scrape( url, session=None ):
         """Scrapes the link URL and try to get title.
         
         >>> Link.scrape('http://ymarkov.livejournal.com/270570.html')
         u'ymarkov: The Last Ring-bearer'
         """
-        title = '[scrape failed]'
-        check = urlparse(url)
-        if check and check.scheme and (check.scheme in ['http', 'https']):
-            r = requests.get(url, allow_redirects=True)
-            if r.status_code in [200, 301, 302]:
-                soup = BeautifulSoup(r.text)
-                if soup.find('title') and soup.find('title').contents:
-                    title = soup.find('title').contents[0]
-        return title
-    
-    def others_in_domain( self ):
-        """Gets other links from the same domain.
-        """
-        try:
-            check = urlparse(self.url)
-            if check and check.netloc:
-                links = Link.objects.exclude(id=self.id)
-                links = links.filter(url__contains=check.netloc)
-                return links
-        except:
-            pass
-        return []
+        with metrics.timer('scrape'):
+            return scraper.title_from_metadata(scrapecache.fetch(url, session))
+    
+    @staticmethod
+    def requeue_failed():
+        """Marks links whose scrape failed as pending again.
+        
+        Returns the number of links requeued.
+        """
+        return Link.objects.filter(
+            title=SCRAPE_FAILED_TITLE
+        ).update(title='', scrape_status=SCRAPE_PENDING)
+    
+    @staticmethod
+    def scrape_pending( limit=None, workers=None, batch_size=100 ):
+        """Drains the scrape queue; returns (scraped, failed) counts.
+        
+        Pending links are looked up in the scrape cache first and the
+        rest are fetched in batches through a thread pool.  Results are
+        written with an UPDATE that only matches links that are still
+        pending, so a title typed in by a user while the scrape was
+        running is never overwritten.
+        """
+        session = scraper.make_session(pool_size=workers)
+        counts = {'scraped': 0, 'failed': 0}
+        
+        def save_result(link_id, domain, description, data):
+            title = scraper.title_from_metadata(data)
+            fields = {
+                'title': title[:200],
+                'scrape_status': SCRAPE_DONE,
+                'modified': datetime.utcnow().replace(tzinfo=utc),
+            }
+            if title == SCRAPE_FAILED_TITLE:
+                fields['scrape_status'] = SCRAPE_FAILED
+                counts['failed'] += 1
+            else:
+                counts['scraped'] += 1
+            if not description:
+                description = scraper.description_from_metadata(data)
+                if description:
+                    fields['description'] = description
+            fields['simhash'] = link_fingerprint(fields['title'], description, domain)
+            Link.objects.filter(
+                id=link_id, scrape_status=SCRAPE_PENDING
+            ).update(**fields)
+        
+        while (limit is None) or (counts['scraped'] + counts['failed'] < limit):
+            size = batch_size
+            if limit is not None:
+                size = min(size, limit - counts['scraped'] - counts['failed'])
+            batch = list(Link.objects.filter(
+                scrape_status=SCRAPE_PENDING
+            ).order_by('id').values_list('id', 'url', 'domain', 'description')[:size])
+            if not batch:
+                break
+            entries = scrapecache.lookup_many([row[1] for row in batch])
+            pending = {}
+            jobs = []
+            for link_id,url,domain,description in batch:
+                data,headers = scrapecache.plan(url, entries.get(url))
+                if data is None:
+                    pending[link_id] = (url, domain, description)
+                    jobs.append((link_id, url, headers))
+                else:
+                    save_result(link_id, domain, description, data)
+            results = scraper.scrape_many(jobs, workers=workers, session=session)
+            for link_id,data in results:
+                url,domain,description = pending[link_id]
+                data = scrapecache.resolve(url, entries.get(url), data)
+                save_result(link_id, domain, description, data)
+            with transaction.atomic():
+                links_bulk_saved.send(
+                    sender=Link,
+                    links=list(Link.objects.filter(id__in=[row[0] for row in batch])),
+                )
+        return counts['scraped'],counts['failed']
+    
+    def others_in_domain( self, viewer=None, page=1, per_page=None ):
+        """Gets other links from the same domain that viewer may see.
+        
+        Returns at most per_page (LINKPILE_DOMAIN_LINKS) links, newest
+        first, from the (domain, -date) index.
+        """
+        if not self.domain:
+            return []
+        if per_page is None:
+            per_page = getattr(settings, 'LINKPILE_DOMAIN_LINKS', 10)
+        start = (max(int(page), 1) - 1) * per_page
+        links = Link.objects.filter(domain=self.domain).exclude(id=self.id)
+        links = links.visible_to(viewer).order_by('-date')
+        return list(links[start:start+per_page])
+
+class ScrapeCache( models.Model ):
+    """Last scrape result for a URL; see linkpile.scrapecache.
+    """
+    url_key = models.CharField(max_length=40, unique=True)
+    url = models.CharField(max_length=400)
+    final_url = models.CharField(max_length=400, blank=True)
+    status = models.IntegerField(blank=True, null=True)
+    title = models.CharField(max_length=200, blank=True)
+    description = models.TextField(blank=True)
+    etag = models.CharField(max_length=200, blank=True)
+    last_modified = models.CharField(max_length=64, blank=True)
+    fetched = models.DateTimeField(db_index=True)
+    
+    def __repr__( self ):
+        return u'<ScrapeCache %s %s>' % (self.url, self.fetched)
+
+class LinkCheck( models.Model ):
+    """Result of the last liveness check of a Link; see linkpile.linkcheck.
+    """
+    link = models.OneToOneField(Link, primary_key=True, on_delete=models.CASCADE)
+    status = models.IntegerField(blank=True, null=True)
+    final_url = models.CharField(max_length=400, blank=True)
+    error = models.CharField(max_length=200, blank=True)
+    failures = models.PositiveIntegerField(default=0)
+    dead = models.BooleanField(default=False, db_index=True)
+    checked = models.DateTimeField(db_index=True)
+    
+    def __repr__( self ):
+        return u'<LinkCheck %s %s %s>' % (self.link_id, self.status, self.checked)
+
+class Snapshot( models.Model ):
+    """Stored copy of a Link's page; the body is a blob in linkpile.snapshots.
+    """
+    link = models.OneToOneField(Link, primary_key=True, on_delete=models.CASCADE)
+    sha256 = models.CharField(max_length=64, db_index=True)
+    status = models.IntegerField()
+    final_url = models.CharField(max_length=400, blank=True)
+    content_type = models.CharField(max_length=100, blank=True)
+    size = models.BigIntegerField()
+    stored_size = models.BigIntegerField()
+    truncated = models.BooleanField(default=False)
+    fetched = models.DateTimeField()
+    
+    def __repr__( self ):
+        return u'<Snapshot %s %s>' % (self.link_id, self.sha256[:12])
+
+class ApiToken( models.Model ):
+    """Key for the bulk JSON API (linkpile.api), acting as user.
+    
+    Only the sha256 of the key is stored; the key itself is shown once,
+    by ApiToken.create().
+    """
+    user = models.ForeignKey(User, on_delete=models.CASCADE)
+    name = models.CharField(max_length=100, blank=True)
+    key_hash = models.CharField(max_length=64, unique=True, editable=False)
+    created = models.DateTimeField(auto_now_add=True)
+    last_used = models.DateTimeField(blank=True, null=True)
+    
+    def __repr__( self ):
+        return u'<ApiToken %s %s %s>' % (self.id, self.user_id, self.name)
+    
+    @staticmethod
+    def hash_key( key ):
+        return hashlib.sha256(key.encode('utf-8')).hexdigest()
+    
+    @staticmethod
+    def create( user, name='' ):
+        """Makes a token for user; returns (token, key).
+        """
+        key = secrets.token_hex(20)
+        token = ApiToken.objects.create(user=user, name=name, key_hash=ApiToken.hash_key(key))
+        return token,key
+    
+    @staticmethod
+    def authenticate( key ):
+        """The active user a key belongs to, or None.
+        """
+        if not key:
+            return None
+        token = ApiToken.objects.select_related('user').filter(
+            key_hash=ApiToken.hash_key(key), user__is_active=True
+        ).first()
+        if token is None:
+            return None
+        ApiToken.objects.filter(id=token.id).update(last_used=datetime.utcnow().replace(tzinfo=utc))
+        return token.user
+
+class SimHashBand( models.Model ):
+    """One band of a Link's simhash; see linkpile.duplicates.
+    
+    Each fingerprinted link has a row per band, so links sharing any
+    band with a fingerprint are one lookup on the (band, value) index.
+    """
+    link = models.ForeignKey(Link, on_delete=models.CASCADE)
+    band = models.PositiveSmallIntegerField()
+    value = models.PositiveIntegerField()
+    
+    class Meta:
+        indexes = [
+            models.Index(fields=['band', 'value'], name='linkpile_simhash_band'),
+        ]
+    
+    def __repr__( self ):
+        return u'<SimHashBand %s %s %s>' % (self.link_id, self.band, self.value)
+
+class RelatedLink( models.Model ):
+    """One of a Link's most similar links; see linkpile.related.
+    """
+    link = models.ForeignKey(Link, related_name='related_links', on_delete=models.CASCADE)
+    other = models.ForeignKey(Link, related_name='related_to', on_delete=models.CASCADE)
+    rank = models.PositiveSmallIntegerField()
+    score = models.FloatField()
+    
+    class Meta:
+        unique_together = (('link', 'rank'),)
+    
+    def __repr__( self ):
+        return u'<RelatedLink %s %s %s>' % (self.link_id, self.rank, self.other_id)
+
+class RelatedState( models.Model ):
+    """When a Link's related links were last computed; see linkpile.related.
+    """
+    link = models.OneToOneField(Link, primary_key=True, on_delete=models.CASCADE)
+    computed = models.DateTimeField()
+    
+    def __repr__( self ):
+        return u'<RelatedState %s %s>' % (self.link_id, self.computed)
+
+class TagStat( models.Model ):
+    """Number of links with a tag that each viewer class may see.
+    
+    Maintained by linkpile.tagstats.
+    """
+    name = models.CharField(max_length=50, unique=True)
+    public_count = models.IntegerField(default=0)
+    member_count = models.IntegerField(default=0)
+    staff_count = models.IntegerField(default=0)
+    
+    def __repr__( self ):
+        return u'<TagStat %s %s>' % (self.name, self.staff_count)
+
+class TagPair( models.Model ):
+    """Number of links with both tags, per viewer class.
+    
+    Stored in both directions (a, b) and (b, a) so that a tag's partners
+    are one indexed lookup.  Maintained by linkpile.tagstats.
+    """
+    tag = models.CharField(max_length=50)
+    other = models.CharField(max_length=50)
+    public_count = models.IntegerField(default=0)
+    member_count = models.IntegerField(default=0)
+    staff_count = models.IntegerField(default=0)
+    
+    class Meta:
+        unique_together = (('tag', 'other'),)
+    
+    def __repr__( self ):
+        return u'<TagPair %s %s %s>' % (self.tag, self.other, self.staff_count)
+
+def viewer_class( user ):
+    """Which of VIEWER_CLASSES user belongs to (None is anonymous).
+    """
+    if (user is None) or (not user.is_authenticated):
+        return VIEWER_PUBLIC
+    if user.is_staff:
+        return VIEWER_STAFF
+    return VIEWER_MEMBER
+
+def filter_visible( links, viewer ):
+    """Filters a Link queryset down to what viewer may see.
+    
+    viewer is a user (or None) or one of VIEWER_CLASSES.  The filter is
+    a single `visibility IN (...)` so that it can use the (visibility,
+    -date) index.
+    """
+    if viewer not in VIEWER_CLASSES:
+        viewer = viewer_class(viewer)
+    mask = VIEWER_MASKS[viewer]
+    if mask is None:
+        return links
+    return links.filter(visibility__in=visibility_values(mask))
 
 def get_links( owner, user ):
     """Show only links that the user is allowed to see.
     """
-    family = [] # user.get_profile().family
-    friends = [] # user.get_profile().friends
-    links = Link.objects.all()
     if user == owner:
-        return links
-    links = links.filter(public=True)
-    return links
+        return Link.objects.all()
+    return Link.objects.visible_to(VIEWER_PUBLIC)
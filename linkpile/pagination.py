@@ -0,0 +1,191 @@
+# -*- coding: utf-8 -*-
+"""Pagination for Link listings.
+
+Two modes, chosen with LINKPILE_PAGINATION:
+
+'pages' (default)
+    Django's Paginator with numbered pages, except that the total is
+    cached for LINKPILE_COUNT_CACHE_TIMEOUT seconds instead of running
+    COUNT(*) on every request.  Totals may lag behind by that much.
+'cursor'
+    Keyset pagination on (date, id): each page is one indexed range
+    query, no matter how deep, and there is no COUNT(*) at all.  Pages
+    are addressed by opaque ?cursor= tokens instead of numbers.
+
+A request that carries ?cursor= is served in cursor mode, unless the
+view asks for a mode: keyword searches are ranked, not in date order,
+and always have numbered pages.
+"""
+
+import base64
+from datetime import datetime
+import hashlib
+import json
+
+from django.conf import settings
+from django.core.cache import cache
+from django.core.exceptions import EmptyResultSet
+from django.core.paginator import EmptyPage, PageNotAnInteger, Paginator
+from django.db.models import Q
+from django.utils.functional import cached_property
+from django.utils.http import urlencode
+from django.utils.timezone import utc
+
+from linkpile import metrics
+
+COUNT_CACHE_KEY = 'linkpile:count:%s'
+NEXT = 'n'
+PREVIOUS = 'p'
+
+
+def cached_count(queryset):
+    """queryset.count(), cached by the SQL of the query.
+    """
+    try:
+        sql = str(queryset.query).encode('utf-8')
+    except EmptyResultSet:
+        return 0  # e.g. queryset.none()
+    key = COUNT_CACHE_KEY % hashlib.md5(sql).hexdigest()
+    count = cache.get(key)
+    if count is None:
+        count = queryset.count()
+        cache.set(key, count, getattr(settings, 'LINKPILE_COUNT_CACHE_TIMEOUT', 300))
+    return count
+
+
+class CachedCountPaginator(Paginator):
+    """Paginator whose total comes from cached_count().
+    """
+
+    @cached_property
+    def count(self):
+        try:
+            return cached_count(self.object_list)
+        except (AttributeError, TypeError):
+            return len(self.object_list)
+
+
+def encode_cursor(link, direction):
+    data = [link.date.timestamp(), link.id, direction]
+    return base64.urlsafe_b64encode(json.dumps(data).encode('ascii')).decode('ascii')
+
+def decode_cursor(cursor):
+    """(date, id, direction) from a cursor token; ValueError if invalid.
+    """
+    try:
+        stamp,pk,direction = json.loads(
+            base64.urlsafe_b64decode(cursor.encode('ascii')).decode('ascii')
+        )
+        if direction not in [NEXT, PREVIOUS]:
+            raise ValueError(direction)
+        return datetime.fromtimestamp(stamp, utc),int(pk),direction
+    except (TypeError, UnicodeError, OverflowError, OSError) as err:
+        raise ValueError(err)
+
+
+class CursorPage(object):
+    """One page of a keyset-paginated listing, newest first.
+    """
+    is_cursor = True
+
+    def __init__(self, object_list, has_next, has_previous):
+        self.object_list = object_list
+        self.has_next_page = has_next
+        self.has_previous_page = has_previous
+
+    def __iter__(self):
+        return iter(self.object_list)
+
+    def __len__(self):
+        return len(self.object_list)
+
+    def __getitem__(self, index):
+        return self.object_list[index]
+
+    def has_next(self):
+        return self.has_next_page
+
+    def has_previous(self):
+        return self.has_previous_page
+
+    def has_other_pages(self):
+        return self.has_next_page or self.has_previous_page
+
+    @property
+    def next_cursor(self):
+        if self.has_next_page:
+            return encode_cursor(self.object_list[-1], NEXT)
+
+    @property
+    def previous_cursor(self):
+        if self.has_previous_page:
+            return encode_cursor(self.object_list[0], PREVIOUS)
+
+
+def cursor_page(queryset, cursor=None, per_page=None):
+    """CursorPage of queryset ordered by (-date, -id), after/before cursor.
+
+    An invalid cursor gives the first page.  The plain date bound next to
+    each keyset condition lets the (date, id) index seek to the cursor
+    instead of scanning up to it.
+    """
+    if per_page is None:
+        per_page = settings.LINKPILE_PAGE_SIZE
+    direction = None
+    if cursor:
+        try:
+            date,pk,direction = decode_cursor(cursor)
+        except ValueError:
+            direction = None
+    if direction == PREVIOUS:
+        rows = list(queryset.filter(
+            Q(date__gt=date) | Q(id__gt=pk), date__gte=date
+        ).order_by('date', 'id')[:per_page + 1])
+        more = len(rows) > per_page
+        rows = rows[:per_page][::-1]
+        return CursorPage(rows, has_next=True, has_previous=more)
+    if direction == NEXT:
+        queryset = queryset.filter(Q(date__lt=date) | Q(id__lt=pk), date__lte=date)
+    rows = list(queryset.order_by('-date', '-id')[:per_page + 1])
+    more = len(rows) > per_page
+    return CursorPage(rows[:per_page], has_next=more, has_previous=direction == NEXT)
+
+def querystring(request):
+    """Current query string minus page/cursor, ready for 'page=' to be appended.
+    """
+    params = [
+        (key, value)
+        for key,values in request.GET.lists() if key not in ['page', 'cursor']
+        for value in values
+    ]
+    if not params:
+        return ''
+    return urlencode(params) + '&'
+
+def paginate(objects, request, mode=None):
+    """Page of objects for the request, in the configured mode.
+
+    mode overrides LINKPILE_PAGINATION; 'pages' also ignores ?cursor=,
+    for listings such as search results that are not in date order.
+    """
+    cursor = None
+    if mode is None:
+        mode = getattr(settings, 'LINKPILE_PAGINATION', 'pages')
+        cursor = request.GET.get('cursor')
+    with metrics.timer('paginate'):
+        if cursor or mode == 'cursor':
+            page = cursor_page(objects, cursor)
+        else:
+            paginator = CachedCountPaginator(
+                object_list=objects,
+                per_page=settings.LINKPILE_PAGE_SIZE,
+                allow_empty_first_page=True
+            )
+            try:
+                page = paginator.page(request.GET.get('page'))
+            except PageNotAnInteger:
+                page = paginator.page(1)
+            except EmptyPage:
+                page = paginator.page(paginator.num_pages)
+    page.querystring = querystring(request)
+    return page
@@ -0,0 +1,114 @@
+# -*- coding: utf-8 -*-
+"""Random Link selection in (almost) constant time.
+
+For each viewer class the sorted ids of the links it may see are kept in
+the Django cache, split into arrays of LINKPILE_RANDOM_CHUNK_SIZE ids
+(default 10000, well under memcached's 1 MB item limit), next to their
+total count.  Picking a link is a random index, one cached chunk and one
+primary-key lookup.
+
+Every key carries a version number.  post_save, post_delete and bulk
+writes bump the version rather than patching the arrays, so concurrent
+writers cannot lose each other's changes; the arrays are rebuilt on the
+next pick, and expire after LINKPILE_RANDOM_CACHE_TIMEOUT seconds in any
+case.  The pick itself checks visibility again, so a link hidden or
+deleted behind the cache's back is never served.
+"""
+
+from array import array
+import random
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+
+from linkpile.models import Link, viewer_class
+from linkpile.signals import links_bulk_saved
+
+VERSION_KEY = 'linkpile:random:version'
+COUNT_KEY = 'linkpile:random:%s:%s'
+CHUNK_KEY = 'linkpile:random:%s:%s:%s'
+ATTEMPTS = 3
+
+
+def _timeout():
+    return getattr(settings, 'LINKPILE_RANDOM_CACHE_TIMEOUT', 3600)
+
+def _chunk_size():
+    return getattr(settings, 'LINKPILE_RANDOM_CHUNK_SIZE', 10000)
+
+def _version():
+    version = cache.get(VERSION_KEY)
+    if version is None:
+        # a fresh random start, so that no keys of an evicted version match
+        cache.add(VERSION_KEY, random.getrandbits(31), None)
+        version = cache.get(VERSION_KEY)
+    return version
+
+def build(vclass, version=None):
+    """Caches the ids of links visible to vclass; returns them as an array.
+    """
+    if version is None:
+        version = _version()
+    ids = array('l', Link.objects.visible_to(vclass).order_by(
+        'id'
+    ).values_list('id', flat=True))
+    size = _chunk_size()
+    cache.set_many({
+        CHUNK_KEY % (version, vclass, n // size): ids[n:n + size]
+        for n in range(0, len(ids), size)
+    }, _timeout())
+    cache.set(COUNT_KEY % (version, vclass), len(ids), _timeout())
+    return ids
+
+def invalidate():
+    try:
+        cache.incr(VERSION_KEY)
+    except ValueError:
+        pass  # no version yet; the next pick starts a new one
+
+def _random_id(vclass):
+    """Random id from the cached arrays of vclass, or None if there are none.
+    """
+    version = _version()
+    count = cache.get(COUNT_KEY % (version, vclass))
+    if count is not None:
+        if not count:
+            return None
+        n = random.randrange(count)
+        size = _chunk_size()
+        chunk = cache.get(CHUNK_KEY % (version, vclass, n // size))
+        if (chunk is not None) and (n % size < len(chunk)):
+            return chunk[n % size]
+    # not cached, or a chunk was evicted on its own
+    ids = build(vclass, version)
+    return random.choice(ids) if ids else None
+
+def pick(user=None):
+    """Random Link visible to user, or None if there are none.
+    """
+    vclass = viewer_class(user)
+    for attempt in range(ATTEMPTS):
+        pk = _random_id(vclass)
+        if pk is None:
+            return None
+        try:
+            return Link.objects.visible_to(vclass).get(pk=pk)
+        except Link.DoesNotExist:
+            # deleted or hidden behind the cache's back
+            invalidate()
+    return None
+
+
+@receiver(post_save, sender=Link)
+def link_saved(sender, instance, **kwargs):
+    invalidate()
+
+@receiver(post_delete, sender=Link)
+def link_deleted(sender, instance, **kwargs):
+    invalidate()
+
+@receiver(links_bulk_saved, sender=Link)
+def links_bulk_written(sender, links, **kwargs):
+    invalidate()
@@ -0,0 +1,317 @@
+# -*- coding: utf-8 -*-
+"""Related links by TF-IDF similarity of title, description, tags and domain.
+
+Every link is a sparse TF-IDF vector over the words of its title and
+description, its tags and its domain, weighted by field and normalized,
+so that the dot product of two vectors is their cosine similarity.
+Terms found in only one link, or in more than MAX_DF of them, are left
+out.  The LINKPILE_RELATED_STORED (default 20) most similar links of
+each link are kept in RelatedLink, best first, and the detail page reads
+the ones its viewer may see with one indexed query (Link.related).
+
+Similarities are computed by an engine, chosen with
+LINKPILE_RELATED_ENGINE:
+
+'numpy'
+    SciPy sparse matrices; each batch of links is one matrix product
+    with the transposed corpus.  Needs numpy and scipy.
+'python'
+    An inverted index in dicts; fine for small piles.
+'auto' (default)
+    'numpy' if numpy and scipy can be imported, else 'python'.
+
+`manage.py linkpile_related` recomputes the links saved since their
+list was computed (see RelatedState), plus the links whose lists those
+changes enter or leave.  Lists of other links keep their old scores
+until `linkpile_related --rebuild` recomputes everything.
+"""
+
+from collections import defaultdict
+import heapq
+from itertools import chain, islice
+import math
+
+from django.conf import settings
+from django.db import transaction
+from django.db.models import Count, F, Min, Q
+from django.db.models.signals import pre_delete
+from django.dispatch import receiver
+from django.utils import timezone
+
+from linkpile import conditional
+from linkpile.models import Link, RelatedLink, RelatedState
+from linkpile.search import tokenize
+from linkpile.tagstats import tag_names
+
+try:
+    import numpy
+    from scipy import sparse
+except ImportError:
+    numpy = sparse = None
+
+WEIGHTS = {'title': 3.0, 'description': 1.0, 'tags': 2.0, 'domain': 1.0}
+MIN_SCORE = 0.05
+# terms in more than this share of the links (and in more than
+# MAX_DF_FLOOR links) say nothing about them
+MAX_DF = 0.2
+MAX_DF_FLOOR = 100
+BATCH_SIZE = 500
+
+
+def stored():
+    return getattr(settings, 'LINKPILE_RELATED_STORED', 20)
+
+def terms(title, description, tags, domain):
+    """{term: weight} of one link, before IDF.
+    """
+    weights = defaultdict(float)
+    for field,text in [('title', title), ('description', description)]:
+        for word in tokenize(text):
+            weights['w:%s' % word] += WEIGHTS[field]
+    for name in tag_names(tags):
+        weights['t:%s' % name] += WEIGHTS['tags']
+    if domain:
+        weights['d:%s' % domain] += WEIGHTS['domain']
+    return weights
+
+
+class Corpus(object):
+    """Normalized TF-IDF vectors ({term number: weight}) of links.
+    """
+
+    def __init__(self, rows):
+        """rows are (id, title, description, tags, domain).
+        """
+        self.ids = []
+        raw = []
+        df = defaultdict(int)
+        for link_id,title,description,tags,domain in rows:
+            weights = terms(title, description, tags, domain)
+            self.ids.append(link_id)
+            raw.append(weights)
+            for term in weights:
+                df[term] += 1
+        total = len(raw)
+        max_df = max(MAX_DF * total, MAX_DF_FLOOR)
+        self.vocabulary = {}
+        idf = {}
+        for term,count in df.items():
+            if 1 < count <= max_df:
+                self.vocabulary[term] = len(self.vocabulary)
+                idf[term] = math.log((1.0 + total) / (1.0 + count)) + 1.0
+        self.vectors = []
+        for weights in raw:
+            vector = {
+                self.vocabulary[term]: weight * idf[term]
+                for term,weight in weights.items() if term in idf
+            }
+            norm = math.sqrt(sum(value * value for value in vector.values()))
+            self.vectors.append({term: value / norm for term,value in vector.items()})
+        self.rows = {link_id: row for row,link_id in enumerate(self.ids)}
+
+    @classmethod
+    def load(cls):
+        rows = Link.objects.order_by('id').values_list(
+            'id', 'title', 'description', 'tags', 'domain'
+        )
+        return cls(rows.iterator())
+
+
+class PythonEngine(object):
+    """Scores by walking an inverted index of the corpus.
+    """
+    name = 'python'
+
+    def __init__(self, corpus):
+        self.corpus = corpus
+        self.postings = defaultdict(list)
+        for row,vector in enumerate(corpus.vectors):
+            for term,weight in vector.items():
+                self.postings[term].append((row, weight))
+
+    def similar(self, rows, k=None):
+        """Yields (row, [(other row, score)]) for rows, best first.
+
+        At most k others per row (None: all of them), each scoring at
+        least MIN_SCORE.
+        """
+        key = lambda item: (-item[1], item[0])
+        for row in rows:
+            scores = defaultdict(float)
+            for term,weight in self.corpus.vectors[row].items():
+                for other,other_weight in self.postings[term]:
+                    scores[other] += weight * other_weight
+            scores.pop(row, None)
+            best = [(other, score) for other,score in scores.items() if score >= MIN_SCORE]
+            if k is None:
+                yield row,sorted(best, key=key)
+            else:
+                yield row,heapq.nsmallest(k, best, key=key)
+
+
+class NumpyEngine(object):
+    """Scores a batch of rows with one sparse matrix product.
+    """
+    name = 'numpy'
+    batch_size = 256
+
+    def __init__(self, corpus):
+        indptr = [0]
+        indices = []
+        data = []
+        for vector in corpus.vectors:
+            indices.extend(vector.keys())
+            data.extend(vector.values())
+            indptr.append(len(indices))
+        self.matrix = sparse.csr_matrix(
+            (numpy.array(data, dtype=numpy.float64),
+             numpy.array(indices, dtype=numpy.int64),
+             numpy.array(indptr, dtype=numpy.int64)),
+            shape=(len(corpus.vectors), max(len(corpus.vocabulary), 1)),
+        )
+        self.transposed = self.matrix.T.tocsr()
+
+    def similar(self, rows, k=None):
+        """See PythonEngine.similar.
+        """
+        rows = list(rows)
+        for start in range(0, len(rows), self.batch_size):
+            batch = rows[start:start+self.batch_size]
+            products = self.matrix[batch].dot(self.transposed).tocsr()
+            for n,row in enumerate(batch):
+                lo,hi = products.indptr[n],products.indptr[n+1]
+                others = products.indices[lo:hi]
+                scores = products.data[lo:hi]
+                keep = (others != row) & (scores >= MIN_SCORE)
+                others,scores = others[keep],scores[keep]
+                if (k is not None) and (len(scores) > k):
+                    top = numpy.argpartition(-scores, k - 1)[:k]
+                    others,scores = others[top],scores[top]
+                order = numpy.lexsort((others, -scores))
+                yield row,list(zip(others[order].tolist(), scores[order].tolist()))
+
+
+ENGINES = {engine.name: engine for engine in [NumpyEngine, PythonEngine]}
+
+
+def engine_name(name=None):
+    """Engine name (default: LINKPILE_RELATED_ENGINE), with 'auto' resolved.
+    """
+    name = name or getattr(settings, 'LINKPILE_RELATED_ENGINE', 'auto')
+    if name == 'auto':
+        return 'numpy' if sparse is not None else 'python'
+    if name not in ENGINES:
+        raise ValueError('Unknown related links engine: %s' % name)
+    if (name == 'numpy') and (sparse is None):
+        raise ValueError('The numpy related links engine needs numpy and scipy.')
+    return name
+
+def get_engine(corpus, name=None):
+    return ENGINES[engine_name(name)](corpus)
+
+
+def _chunks(items, size=BATCH_SIZE):
+    items = iter(items)
+    while True:
+        chunk = list(islice(items, size))
+        if not chunk:
+            return
+        yield chunk
+
+def store(corpus, results, computed):
+    """Writes [(row, [(other row, score)])] as RelatedLink rows.
+    """
+    ids = [corpus.ids[row] for row,best in results]
+    wanted = set(ids) | set(corpus.ids[other] for row,best in results for other,score in best)
+    # links deleted since the corpus was loaded
+    existing = set()
+    for chunk in _chunks(sorted(wanted)):
+        existing.update(Link.objects.filter(id__in=chunk).values_list('id', flat=True))
+    with transaction.atomic():
+        RelatedLink.objects.filter(link_id__in=ids).delete()
+        RelatedState.objects.filter(link_id__in=ids).delete()
+        RelatedLink.objects.bulk_create([
+            RelatedLink(link_id=corpus.ids[row], other_id=other_id, rank=rank, score=score)
+            for row,best in results if corpus.ids[row] in existing
+            for rank,(other_id,score) in enumerate(
+                (corpus.ids[other], score) for other,score in best
+                if corpus.ids[other] in existing
+            )
+        ])
+        RelatedState.objects.bulk_create([
+            RelatedState(link_id=link_id, computed=computed)
+            for link_id in ids if link_id in existing
+        ])
+
+def _store_all(corpus, results, computed):
+    count = 0
+    for chunk in _chunks(results):
+        store(corpus, chunk, computed)
+        count += len(chunk)
+    conditional.bump()  # detail pages
+    return count
+
+def rebuild(engine=None):
+    """Recomputes every link's related links; returns the number of links.
+    """
+    computed = timezone.now()
+    corpus = Corpus.load()
+    results = get_engine(corpus, engine).similar(range(len(corpus.ids)), stored())
+    return _store_all(corpus, results, computed)
+
+def stale_ids():
+    """Ids of links saved since their related links were computed.
+    """
+    return list(Link.objects.filter(
+        Q(relatedstate__isnull=True) | Q(modified__gt=F('relatedstate__computed'))
+    ).values_list('id', flat=True))
+
+def update(engine=None):
+    """Recomputes the related links of stale_ids() and of links whose lists they affect.
+
+    A stale link's full row of scores shows which other links it now
+    beats the last stored entry of; links already listing a stale link
+    are recomputed too.  Returns the number of links recomputed.
+    """
+    computed = timezone.now()
+    stale = set(stale_ids())
+    if not stale:
+        return 0
+    corpus = Corpus.load()
+    engine = get_engine(corpus, engine)
+    k = stored()
+    results = []
+    candidates = {}  # other link id: best score with a stale link
+    for row,best in engine.similar(sorted(corpus.rows[pk] for pk in stale if pk in corpus.rows)):
+        results.append((row, best[:k]))
+        for other,score in best:
+            link_id = corpus.ids[other]
+            if link_id not in stale:
+                candidates[link_id] = max(candidates.get(link_id, 0), score)
+    affected = set()
+    for chunk in _chunks(sorted(stale)):
+        affected.update(
+            RelatedLink.objects.filter(other_id__in=chunk).values_list('link_id', flat=True)
+        )
+    lists = {}
+    for chunk in _chunks(sorted(candidates)):
+        lists.update(
+            (row['link_id'], (row['n'], row['low']))
+            for row in RelatedLink.objects.filter(link_id__in=chunk).order_by().values(
+                'link_id'
+            ).annotate(n=Count('id'), low=Min('score'))
+        )
+    for link_id,score in candidates.items():
+        n,low = lists.get(link_id, (0, 0))
+        if (n < k) or (score > low):
+            affected.add(link_id)
+    affected = sorted(corpus.rows[pk] for pk in affected - stale if pk in corpus.rows)
+    return _store_all(corpus, chain(results, engine.similar(affected, k)), computed)
+
+
+@receiver(pre_delete, sender=Link)
+def link_deleted(sender, instance, **kwargs):
+    # lists holding the link lose an entry; recompute them next time
+    RelatedState.objects.filter(
+        link_id__in=RelatedLink.objects.filter(other_id=instance.pk).values('link_id')
+    ).delete()
@@ -0,0 +1,178 @@
+# -*- coding: utf-8 -*-
+"""Read replicas for the read-only linkpile views.
+
+Add the router to the project settings and list the replica aliases::
+
+    DATABASE_ROUTERS = ['linkpile.routers.ReplicaRouter']
+    LINKPILE_DB_REPLICAS = ['replica1', 'replica2']
+
+Views wrapped in use_replicas() (the listings, detail, feeds, export)
+read linkpile and tagging models from one replica per request, picked
+round-robin.  A replica that cannot be connected to is skipped for
+LINKPILE_DB_REPLICA_RETRY seconds; with none left, reads go to the
+primary (LINKPILE_DB_PRIMARY, default 'default').
+
+Writes always go to the primary, as does every read in a request after
+its first write.  Views wrapped in pin_after_write() (new, edit, the API)
+also mark the user's session, and for the next LINKPILE_DB_PIN_SECONDS
+that user's reads stay on the primary too, so they see their own
+changes before the replicas catch up.
+"""
+
+from functools import wraps
+import threading
+import time
+
+from django.conf import settings
+from django.db import DatabaseError, connections
+
+PIN_KEY = 'linkpile_primary_until'
+
+_state = threading.local()
+
+
+def primary():
+    return getattr(settings, 'LINKPILE_DB_PRIMARY', 'default')
+
+def replicas():
+    return getattr(settings, 'LINKPILE_DB_REPLICAS', [])
+
+def routed_apps():
+    return getattr(settings, 'LINKPILE_DB_REPLICA_APPS', ['linkpile', 'tagging'])
+
+
+class ReplicaPool(object):
+    """Round-robin over replicas, skipping those that recently failed.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._next = 0
+        self._down = {}  # alias: time to try again
+
+    def choose(self, aliases):
+        """A healthy alias from aliases, or None.
+        """
+        with self._lock:
+            start = self._next
+            self._next += 1
+        now = time.time()
+        for n in range(len(aliases)):
+            alias = aliases[(start + n) % len(aliases)]
+            if self._down.get(alias, 0) > now:
+                continue
+            if self.healthy(alias):
+                return alias
+            self.mark_down(alias)
+        return None
+
+    def healthy(self, alias):
+        try:
+            connections[alias].ensure_connection()
+        except DatabaseError:
+            return False
+        return True
+
+    def mark_down(self, alias):
+        retry = getattr(settings, 'LINKPILE_DB_REPLICA_RETRY', 30)
+        with self._lock:
+            self._down[alias] = time.time() + retry
+
+    def reset(self):
+        with self._lock:
+            self._next = 0
+            self._down = {}
+
+pool = ReplicaPool()
+
+
+class ReplicaRouter(object):
+    """Sends reads to the replica chosen for the request, writes to the primary.
+    """
+
+    def _routed(self, model):
+        return model._meta.app_label in routed_apps()
+
+    def db_for_read(self, model, **hints):
+        replica = getattr(_state, 'replica', None)
+        if (replica is None) or not self._routed(model):
+            return None
+        if getattr(_state, 'wrote', False):
+            return primary()
+        return replica
+
+    def db_for_write(self, model, **hints):
+        if not self._routed(model):
+            return None
+        _state.wrote = True
+        return primary()
+
+    def allow_relation(self, obj1, obj2, **hints):
+        databases = set([primary()] + list(replicas()))
+        if (obj1._state.db in databases) and (obj2._state.db in databases):
+            return True
+        return None
+
+
+def pinned(request):
+    """True if request's user wrote something in the last few seconds.
+    """
+    session = getattr(request, 'session', None)
+    if session is None:
+        return False
+    return session.get(PIN_KEY, 0) > time.time()
+
+class _reading(object):
+    """Routes reads in this thread to alias (None: the primary).
+    """
+
+    def __init__(self, alias):
+        self.alias = alias
+
+    def __enter__(self):
+        self.saved = (getattr(_state, 'replica', None), getattr(_state, 'wrote', False))
+        _state.replica = self.alias
+        _state.wrote = False
+
+    def __exit__(self, *exc):
+        _state.replica,_state.wrote = self.saved
+
+def _streamed(content, alias):
+    with _reading(alias):
+        for chunk in content:
+            yield chunk
+
+def use_replicas(view):
+    """Runs a read-only view against a replica, unless the user is pinned.
+
+    Streaming responses read from the same replica while they stream.
+    """
+    @wraps(view)
+    def wrapper(request, *args, **kwargs):
+        aliases = replicas()
+        if (not aliases) or pinned(request):
+            return view(request, *args, **kwargs)
+        alias = pool.choose(aliases)
+        if alias is None:
+            return view(request, *args, **kwargs)
+        with _reading(alias):
+            response = view(request, *args, **kwargs)
+        if response.streaming:
+            response.streaming_content = _streamed(response.streaming_content, alias)
+        return response
+    return wrapper
+
+def pin_after_write(view):
+    """Keeps the user's reads on the primary for a while after the view writes.
+    """
+    @wraps(view)
+    def wrapper(request, *args, **kwargs):
+        with _reading(None):
+            response = view(request, *args, **kwargs)
+            wrote = _state.wrote
+        user = getattr(request, 'user', None)
+        if wrote and replicas() and (user is not None) and user.is_authenticated:
+            seconds = getattr(settings, 'LINKPILE_DB_PIN_SECONDS', 10)
+            request.session[PIN_KEY] = time.time() + seconds
+        return response
+    return wrapper
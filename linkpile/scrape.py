@@ -0,0 +1,134 @@
+# -*- coding: utf-8 -*-
+"""Fetching remote pages for Link titles.
+
+Nothing in here touches the database; callers hand in URLs and get
+titles back.  HTTP requests run in a bounded thread pool and share a
+single pooled requests.Session so that connections are reused.
+"""
+
+from concurrent.futures import ThreadPoolExecutor, as_completed
+import logging
+from urllib.parse import urlparse
+
+import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+
+from django.conf import settings
+
+from linkpile import extract
+
+logger = logging.getLogger(__name__)
+
+SCRAPE_FAILED_TITLE = '[scrape failed]'
+SCHEMES = ['http', 'https']
+OK_STATUSES = [200, 301, 302]
+RETRY_STATUSES = [429, 500, 502, 503, 504]
+USER_AGENT = 'linkpile (+https://github.com/gjost/linkpile)'
+
+
+def _setting(name, default):
+    return getattr(settings, name, default)
+
+def get_timeout():
+    """(connect, read) timeout in seconds for each request.
+    """
+    return _setting('LINKPILE_SCRAPE_TIMEOUT', (5, 15))
+
+def make_session(pool_size=None, retries=None, backoff=None):
+    """requests.Session with a connection pool and retry/backoff.
+
+    Retries cover connection errors and RETRY_STATUSES; sleep between
+    attempts grows as backoff * 2**(attempt - 1).
+    """
+    if pool_size is None:
+        pool_size = _setting('LINKPILE_SCRAPE_WORKERS', 8)
+    if retries is None:
+        retries = _setting('LINKPILE_SCRAPE_RETRIES', 2)
+    if backoff is None:
+        backoff = _setting('LINKPILE_SCRAPE_BACKOFF', 0.5)
+    retry = Retry(
+        total=retries,
+        backoff_factor=backoff,
+        status_forcelist=RETRY_STATUSES,
+        raise_on_status=False,
+    )
+    adapter = HTTPAdapter(
+        pool_connections=pool_size,
+        pool_maxsize=pool_size,
+        max_retries=retry,
+    )
+    session = requests.Session()
+    session.headers['User-Agent'] = USER_AGENT
+    for scheme in SCHEMES:
+        session.mount('%s://' % scheme, adapter)
+    return session
+
+def fetch_metadata(url, session=None, timeout=None, headers=None):
+    """Fetches the head of URL and returns its metadata as a dict.
+
+    The dict has 'status', 'final_url', 'etag' and 'last_modified' plus
+    whatever extract.extract_head found (title, description, og_title,
+    og_description).  Only the head of the page is downloaded; 'status'
+    is None if the request failed.  Pass If-None-Match/If-Modified-Since
+    in `headers` to make a conditional request; a 304 comes back as
+    status 304 with no metadata.
+    """
+    data = {'status': None}
+    check = urlparse(url)
+    if not (check and check.scheme and (check.scheme in SCHEMES)):
+        return data
+    if session is None:
+        session = requests
+    if timeout is None:
+        timeout = get_timeout()
+    try:
+        r = session.get(
+            url, allow_redirects=True, timeout=timeout, stream=True,
+            headers=headers,
+        )
+        data['status'] = r.status_code
+        data['final_url'] = r.url
+        data['etag'] = r.headers.get('ETag')
+        data['last_modified'] = r.headers.get('Last-Modified')
+        if r.status_code in OK_STATUSES:
+            data.update(extract.extract_response(
+                r, max_bytes=_setting('LINKPILE_SCRAPE_MAX_BYTES', extract.MAX_BYTES)
+            ))
+        else:
+            r.close()
+    except requests.RequestException as err:
+        logger.info('scrape %s failed: %s' % (url, err))
+    return data
+
+def title_from_metadata(data):
+    """Best title in fetch_metadata() output, or SCRAPE_FAILED_TITLE.
+    """
+    return data.get('title') or data.get('og_title') or SCRAPE_FAILED_TITLE
+
+def description_from_metadata(data):
+    return data.get('description') or data.get('og_description') or ''
+
+def fetch_title(url, session=None, timeout=None):
+    """Fetches URL and returns its <title>, or SCRAPE_FAILED_TITLE.
+    """
+    return title_from_metadata(fetch_metadata(url, session, timeout))
+
+def scrape_many(jobs, workers=None, session=None):
+    """Fetches metadata for (key, url, headers) jobs in a thread pool.
+
+    Yields (key, fetch_metadata() dict) pairs as they complete, not in
+    input order.  At most `workers` requests are in flight at once.
+    """
+    if workers is None:
+        workers = _setting('LINKPILE_SCRAPE_WORKERS', 8)
+    if session is None:
+        session = make_session(pool_size=workers)
+    timeout = get_timeout()
+    with ThreadPoolExecutor(max_workers=workers) as pool:
+        futures = {
+            pool.submit(fetch_metadata, url, session, timeout, headers): key
+            for key,url,headers in jobs
+        }
+        for future in as_completed(futures):
+            yield futures[future], future.result()
@@ -0,0 +1,227 @@
+# -*- coding: utf-8 -*-
+"""Cache of scrape results in front of Link.scrape and the scrape queue.
+
+Results are stored in the ScrapeCache table, one row per normalized URL,
+with a small in-process LRU on top.  An entry younger than
+LINKPILE_SCRAPE_CACHE_FRESH seconds is used as is; an older one is
+revalidated with If-None-Match/If-Modified-Since, and one older than
+LINKPILE_SCRAPE_CACHE_TTL is evicted and fetched again.
+
+Only the database and the LRU are touched here, and only from the
+calling thread; the HTTP requests themselves happen in linkpile.scrape.
+"""
+
+from collections import Counter, OrderedDict
+from datetime import timedelta
+import threading
+
+from django.conf import settings
+from django.utils import timezone
+
+from linkpile import scrape as scraper
+from linkpile.urlnorm import normalize_url, url_key
+
+ENTRY_FIELDS = ['final_url', 'status', 'title', 'description', 'etag', 'last_modified']
+
+
+class LRUCache(object):
+    """Thread-safe least-recently-used mapping with a size limit.
+    """
+
+    def __init__(self, maxsize):
+        self.maxsize = maxsize
+        self._data = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        with self._lock:
+            try:
+                self._data.move_to_end(key)
+            except KeyError:
+                return None
+            return self._data[key]
+
+    def set(self, key, value):
+        with self._lock:
+            self._data[key] = value
+            self._data.move_to_end(key)
+            while len(self._data) > self.maxsize:
+                self._data.popitem(last=False)
+
+    def delete(self, key):
+        with self._lock:
+            self._data.pop(key, None)
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+
+    def __len__(self):
+        return len(self._data)
+
+
+_lru = LRUCache(getattr(settings, 'LINKPILE_SCRAPE_CACHE_SIZE', 1000))
+_stats = Counter()
+_stats_lock = threading.Lock()
+
+
+def _count(name, n=1):
+    with _stats_lock:
+        _stats[name] += n
+
+def stats():
+    """Counters: hits, revalidated (304s), misses, evicted.
+    """
+    with _stats_lock:
+        return {
+            name: _stats[name]
+            for name in ['hits', 'revalidated', 'misses', 'evicted']
+        }
+
+def reset():
+    """Empties the in-process LRU and zeroes the counters.
+    """
+    _lru.clear()
+    with _stats_lock:
+        _stats.clear()
+
+def fresh_for():
+    return timedelta(seconds=getattr(settings, 'LINKPILE_SCRAPE_CACHE_FRESH', 3600))
+
+def ttl():
+    return timedelta(seconds=getattr(settings, 'LINKPILE_SCRAPE_CACHE_TTL', 30 * 86400))
+
+def _model():
+    from linkpile.models import ScrapeCache
+    return ScrapeCache
+
+def _entry(obj):
+    entry = {name: getattr(obj, name) for name in ENTRY_FIELDS}
+    entry['fetched'] = obj.fetched
+    return entry
+
+def lookup_many(urls):
+    """Returns {url: entry} for URLs with a live cache entry.
+
+    Checks the LRU first and looks up the rest with a single query.
+    Entries past the TTL are dropped rather than returned.
+    """
+    now = timezone.now()
+    keys = {url: url_key(url) for url in urls}
+    found = {}
+    missing = {}
+    for url,key in keys.items():
+        entry = _lru.get(key)
+        if entry:
+            found[url] = entry
+        else:
+            missing.setdefault(key, []).append(url)
+    if missing:
+        for obj in _model().objects.filter(url_key__in=list(missing.keys())):
+            entry = _entry(obj)
+            _lru.set(obj.url_key, entry)
+            for url in missing[obj.url_key]:
+                found[url] = entry
+    for url,entry in list(found.items()):
+        if entry['fetched'] < now - ttl():
+            _lru.delete(keys[url])
+            del found[url]
+    return found
+
+def is_fresh(entry):
+    return entry['fetched'] >= timezone.now() - fresh_for()
+
+def conditional_headers(entry):
+    """Request headers that revalidate a cache entry.
+    """
+    headers = {}
+    if entry and entry.get('etag'):
+        headers['If-None-Match'] = entry['etag']
+    if entry and entry.get('last_modified'):
+        headers['If-Modified-Since'] = entry['last_modified']
+    return headers
+
+def store(url, data):
+    """Saves fetch_metadata() output for url (and its final URL).
+
+    Failed fetches are not cached so that they can be retried.
+    Returns the stored entry or None.
+    """
+    if scraper.title_from_metadata(data) == scraper.SCRAPE_FAILED_TITLE:
+        return None
+    entry = {
+        'final_url': data.get('final_url') or url,
+        'status': data.get('status'),
+        'title': scraper.title_from_metadata(data)[:200],
+        'description': scraper.description_from_metadata(data),
+        'etag': (data.get('etag') or '')[:200],
+        'last_modified': (data.get('last_modified') or '')[:64],
+        'fetched': timezone.now(),
+    }
+    ScrapeCache = _model()
+    for u in set([url, entry['final_url']]):
+        key = url_key(u)
+        defaults = dict(entry, url=normalize_url(u)[:400])
+        ScrapeCache.objects.update_or_create(url_key=key, defaults=defaults)
+        _lru.set(key, entry)
+    return entry
+
+def touch(url, entry):
+    """Marks an entry as just revalidated (the server said 304).
+    """
+    entry = dict(entry, fetched=timezone.now())
+    key = url_key(url)
+    _model().objects.filter(url_key=key).update(fetched=entry['fetched'])
+    _lru.set(key, entry)
+    return entry
+
+def metadata(entry):
+    """Cache entry in the same shape as fetch_metadata() output.
+    """
+    return {
+        'status': entry['status'],
+        'final_url': entry['final_url'],
+        'title': entry['title'],
+        'description': entry['description'],
+    }
+
+def plan(url, entry):
+    """Decides what to do for url given its cache entry (or None).
+
+    Returns (metadata, None) when the entry can be used without a
+    request, or (None, headers) when the URL has to be fetched with
+    these (possibly conditional) headers.  Updates the counters.
+    """
+    if entry and is_fresh(entry):
+        _count('hits')
+        return metadata(entry), None
+    return None, conditional_headers(entry)
+
+def resolve(url, entry, data):
+    """Turns the result of a (conditional) fetch into metadata.
+    """
+    if data.get('status') == 304 and entry:
+        _count('revalidated')
+        return metadata(touch(url, entry))
+    _count('misses')
+    store(url, data)
+    return data
+
+def fetch(url, session=None, timeout=None):
+    """fetch_metadata() for a single URL, going through the cache.
+    """
+    entry = lookup_many([url]).get(url)
+    data,headers = plan(url, entry)
+    if data is None:
+        data = scraper.fetch_metadata(url, session, timeout, headers=headers)
+        data = resolve(url, entry, data)
+    return data
+
+def evict_stale():
+    """Deletes entries older than the TTL; returns how many.
+    """
+    cutoff = timezone.now() - ttl()
+    deleted,_ = _model().objects.filter(fetched__lt=cutoff).delete()
+    _lru.clear()
+    _count('evicted', deleted)
+    return deleted
@@ -0,0 +1,488 @@
+# -*- coding: utf-8 -*-
+"""Keyword search over Links.
+
+Every backend answers search(keywords) with a list of Link ids, best
+match first.  All keywords must match (AND) and each one matches as a
+prefix ("pyth" finds "python").  Title and tags count for more than the
+description and URL.  Links the viewer may not see are left out by the
+backend itself, so that they do not take up places under the limit.
+
+Backends, chosen with LINKPILE_SEARCH_BACKEND:
+
+'sqlite'
+    An FTS5 virtual table kept next to linkpile_link, ranked by bm25.
+'postgresql'
+    A GIN index over to_tsvector() of the link text, ranked by ts_rank.
+    The index is maintained by PostgreSQL itself.
+'python'
+    An in-process inverted index built from the database on first use.
+    Each process only sees its own writes, so the index is also rebuilt
+    after LINKPILE_SEARCH_PYTHON_TTL seconds.
+'icontains'
+    The old chain of icontains filters; no index, no ranking.
+'auto' (default)
+    'sqlite' or 'postgresql' to match the database, else 'python'.
+
+Searches read through the database router, so views wrapped in
+routers.use_replicas() search a replica's index like their other reads.
+Indexes are updated on Link post_save/post_delete and after bulk writes;
+`manage.py linkpile_search_rebuild` rebuilds one from scratch.
+"""
+
+from bisect import bisect_left
+from collections import defaultdict
+import math
+import re
+import threading
+import time
+
+from django.conf import settings
+from django.db import connection, connections, router, transaction
+from django.db.models import Case, IntegerField, Q, Value, When
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+
+from linkpile.models import Link, VIEWER_CLASSES, VIEWER_MASKS, VIEWER_STAFF, viewer_class, visibility_values
+from linkpile.signals import links_bulk_saved
+
+FIELDS = ['title', 'description', 'url', 'tags']
+WEIGHTS = {'title': 3.0, 'description': 1.0, 'url': 0.5, 'tags': 2.0}
+LIMIT = 1000
+CHUNK_SIZE = 1000
+WORD_RE = re.compile(r'\w+', re.UNICODE)
+
+
+def tokenize(text):
+    return WORD_RE.findall((text or '').lower())
+
+def _link_text(link, field):
+    if field == 'tags':
+        # TagField's descriptor, not a query, for links loaded from the db
+        return link.__dict__.get('tags') or ''
+    return getattr(link, field) or ''
+
+
+class BaseBackend(object):
+    name = None
+
+    def available(self):
+        """False if the index structures are missing from the database.
+        """
+        return True
+
+    def setup(self):
+        """Creates the index structures if they do not exist yet.
+        """
+
+    def index(self, links):
+        """Adds or replaces these links in the index.
+        """
+
+    def remove(self, ids):
+        """Drops these link ids from the index.
+        """
+
+    def rebuild(self):
+        """Re-indexes every link; returns the number indexed.
+        """
+        self.clear()
+        count = 0
+        links = Link.objects.order_by('id').only('id', 'visibility', *FIELDS)
+        for chunk in _chunks(links):
+            self.index(chunk)
+            count += len(chunk)
+        return count
+
+    def clear(self):
+        pass
+
+    def search(self, keywords, limit=LIMIT, visibility=None):
+        """Ids of matching links, best first.
+
+        limit None means all of them; visibility, if not None, is the
+        Link.visibility values to keep.
+        """
+        raise NotImplementedError
+
+
+class IcontainsBackend(BaseBackend):
+    """What views.index used to do: no index, date order.
+    """
+    name = 'icontains'
+
+    def search(self, keywords, limit=LIMIT, visibility=None):
+        if not keywords.split():
+            return []
+        links = Link.objects.all()
+        if visibility is not None:
+            links = links.filter(visibility__in=visibility)
+        for word in keywords.split():
+            links = links.filter(
+                Q(title__icontains=word) | Q(description__icontains=word) |
+                Q(url__icontains=word) | Q(tags__icontains=word)
+            )
+        return list(links.order_by('-date').values_list('id', flat=True)[:limit])
+
+    def rebuild(self):
+        return Link.objects.count()
+
+
+class SQLiteBackend(BaseBackend):
+    """FTS5 table whose rowid is the Link id.
+
+    The table is created and filled by migration 0005.
+    """
+    name = 'sqlite'
+    table = 'linkpile_link_fts'
+
+    def available(self):
+        return self.table in connection.introspection.table_names()
+
+    def setup(self):
+        with connection.cursor() as cursor:
+            cursor.execute(
+                'CREATE VIRTUAL TABLE IF NOT EXISTS %s USING fts5(%s, '
+                'tokenize="unicode61")' % (self.table, ', '.join(FIELDS))
+            )
+
+    def index(self, links):
+        if not links:
+            return
+        with transaction.atomic(), connection.cursor() as cursor:
+            self.remove([link.pk for link in links])
+            cursor.executemany(
+                'INSERT INTO %s (rowid, %s) VALUES (%%s, %s)' % (
+                    self.table, ', '.join(FIELDS), ', '.join(['%s'] * len(FIELDS))
+                ),
+                [
+                    [link.pk] + [_link_text(link, field) for field in FIELDS]
+                    for link in links
+                ]
+            )
+
+    def remove(self, ids):
+        if not ids:
+            return
+        with connection.cursor() as cursor:
+            cursor.execute(
+                'DELETE FROM %s WHERE rowid IN (%s)' % (
+                    self.table, ', '.join(['%s'] * len(ids))
+                ),
+                list(ids)
+            )
+
+    def clear(self):
+        with connection.cursor() as cursor:
+            cursor.execute('DROP TABLE IF EXISTS %s' % self.table)
+        self.setup()
+
+    def rebuild(self):
+        self.clear()
+        columns = ', '.join(FIELDS)
+        with connection.cursor() as cursor:
+            cursor.execute(
+                'INSERT INTO %s (rowid, %s) SELECT id, %s FROM linkpile_link' % (
+                    self.table, columns, columns
+                )
+            )
+        return Link.objects.count()
+
+    def search(self, keywords, limit=LIMIT, visibility=None):
+        terms = tokenize(keywords)
+        if not terms:
+            return []
+        match = ' AND '.join('"%s"*' % term for term in terms)
+        weights = ', '.join(str(WEIGHTS[field]) for field in FIELDS)
+        sql = 'SELECT %s.rowid FROM %s' % (self.table, self.table)
+        where = ['%s MATCH %%s' % self.table]
+        params = [match]
+        if visibility is not None:
+            sql += ' JOIN linkpile_link ON linkpile_link.id = %s.rowid' % self.table
+            where.append(_in_clause('linkpile_link.visibility', visibility))
+            params.extend(visibility)
+        sql += ' WHERE %s ORDER BY bm25(%s, %s)' % (' AND '.join(where), self.table, weights)
+        if limit is not None:
+            sql += ' LIMIT %s'
+            params.append(limit)
+        with _read_connection().cursor() as cursor:
+            cursor.execute(sql, params)
+            return [row[0] for row in cursor.fetchall()]
+
+
+class PostgreSQLBackend(BaseBackend):
+    """GIN expression index; PostgreSQL keeps it up to date.
+
+    The index is created by migration 0005.
+    """
+    name = 'postgresql'
+    index_name = 'linkpile_link_search'
+    labels = {'title': 'A', 'tags': 'B', 'description': 'C', 'url': 'D'}
+
+    @classmethod
+    def vector(cls):
+        return ' || '.join(
+            "setweight(to_tsvector('simple', coalesce(%s, '')), '%s')" % (
+                field, cls.labels[field]
+            )
+            for field in FIELDS
+        )
+
+    def setup(self):
+        with connection.cursor() as cursor:
+            cursor.execute(
+                'CREATE INDEX IF NOT EXISTS %s ON linkpile_link USING gin((%s))' % (
+                    self.index_name, self.vector()
+                )
+            )
+
+    def rebuild(self):
+        with connection.cursor() as cursor:
+            cursor.execute('DROP INDEX IF EXISTS %s' % self.index_name)
+        self.setup()
+        return Link.objects.count()
+
+    def search(self, keywords, limit=LIMIT, visibility=None):
+        terms = tokenize(keywords)
+        if not terms:
+            return []
+        query = ' & '.join('%s:*' % term for term in terms)
+        sql = "SELECT id FROM linkpile_link WHERE (%s) @@ to_tsquery('simple', %%s)" % (
+            self.vector()
+        )
+        params = [query]
+        if visibility is not None:
+            sql += ' AND ' + _in_clause('visibility', visibility)
+            params.extend(visibility)
+        sql += " ORDER BY ts_rank((%s), to_tsquery('simple', %%s)) DESC" % self.vector()
+        params.append(query)
+        if limit is not None:
+            sql += ' LIMIT %s'
+            params.append(limit)
+        with _read_connection().cursor() as cursor:
+            cursor.execute(sql, params)
+            return [row[0] for row in cursor.fetchall()]
+
+
+class PythonBackend(BaseBackend):
+    """In-process inverted index: term -> {link id: weight}.
+
+    A sorted list of terms gives prefix matches by bisection.
+    """
+    name = 'python'
+
+    def __init__(self):
+        self._lock = threading.RLock()
+        self._postings = None
+        self._docs = {}
+        self._visibility = {}
+        self._terms = []
+        self._built = 0
+
+    def _ttl(self):
+        return getattr(settings, 'LINKPILE_SEARCH_PYTHON_TTL', 300)
+
+    def _ensure(self):
+        if (self._postings is None) or (time.time() - self._built > self._ttl()):
+            self.rebuild()
+
+    def clear(self):
+        with self._lock:
+            self._postings = defaultdict(dict)
+            self._docs = {}
+            self._visibility = {}
+            self._terms = []
+            self._built = time.time()
+
+    def rebuild(self):
+        with self._lock:
+            return super(PythonBackend, self).rebuild()
+
+    def _add(self, link):
+        weights = defaultdict(float)
+        for field in FIELDS:
+            for term in tokenize(_link_text(link, field)):
+                weights[term] += WEIGHTS[field]
+        self._docs[link.pk] = list(weights.keys())
+        self._visibility[link.pk] = link.visibility
+        for term,weight in weights.items():
+            postings = self._postings[term]
+            if not postings:
+                n = bisect_left(self._terms, term)
+                self._terms.insert(n, term)
+            postings[link.pk] = weight
+
+    def _remove(self, pk):
+        self._visibility.pop(pk, None)
+        for term in self._docs.pop(pk, []):
+            postings = self._postings.get(term)
+            if postings is None:
+                continue
+            postings.pop(pk, None)
+            if not postings:
+                del self._postings[term]
+                n = bisect_left(self._terms, term)
+                if n < len(self._terms) and self._terms[n] == term:
+                    del self._terms[n]
+
+    def index(self, links):
+        with self._lock:
+            if self._postings is None:
+                return  # built from the database on first search
+            for link in links:
+                self._remove(link.pk)
+                self._add(link)
+
+    def remove(self, ids):
+        with self._lock:
+            if self._postings is None:
+                return
+            for pk in ids:
+                self._remove(pk)
+
+    def _prefix_scores(self, prefix):
+        """{link id: score} for every term starting with prefix.
+        """
+        scores = defaultdict(float)
+        total = max(len(self._docs), 1)
+        n = bisect_left(self._terms, prefix)
+        while n < len(self._terms) and self._terms[n].startswith(prefix):
+            postings = self._postings[self._terms[n]]
+            idf = math.log(1.0 + total / len(postings))
+            for pk,weight in postings.items():
+                scores[pk] += weight * idf
+            n += 1
+        return scores
+
+    def search(self, keywords, limit=LIMIT, visibility=None):
+        terms = tokenize(keywords)
+        if not terms:
+            return []
+        with self._lock:
+            self._ensure()
+            scores = None
+            for term in terms:
+                term_scores = self._prefix_scores(term)
+                if scores is None:
+                    scores = term_scores
+                else:
+                    scores = {
+                        pk: score + term_scores[pk]
+                        for pk,score in scores.items() if pk in term_scores
+                    }
+                if not scores:
+                    return []
+            if visibility is not None:
+                scores = {
+                    pk: score for pk,score in scores.items()
+                    if self._visibility.get(pk) in visibility
+                }
+        ranked = sorted(scores.items(), key=lambda item: (-item[1], -item[0]))
+        return [pk for pk,score in ranked[:limit]]
+
+
+BACKENDS = {
+    backend.name: backend
+    for backend in [IcontainsBackend, SQLiteBackend, PostgreSQLBackend, PythonBackend]
+}
+_backends = {}
+
+
+def _read_connection():
+    """Connection Link reads go to: a replica in use_replicas() views.
+    """
+    return connections[router.db_for_read(Link)]
+
+def _in_clause(column, values):
+    return '%s IN (%s)' % (column, ', '.join(['%s'] * len(values)))
+
+def _chunks(queryset, size=CHUNK_SIZE):
+    chunk = []
+    for obj in queryset.iterator():
+        chunk.append(obj)
+        if len(chunk) >= size:
+            yield chunk
+            chunk = []
+    if chunk:
+        yield chunk
+
+def get_backend(name=None):
+    """Backend instance by name (default: LINKPILE_SEARCH_BACKEND).
+    """
+    name = name or getattr(settings, 'LINKPILE_SEARCH_BACKEND', 'auto')
+    if name not in _backends:
+        if name == 'auto':
+            backend = None
+            if connection.vendor in BACKENDS:
+                backend = get_backend(connection.vendor)
+            if not (backend and backend.available()):
+                # e.g. SQLite built without FTS5
+                backend = get_backend('python')
+        elif name in BACKENDS:
+            backend = BACKENDS[name]()
+        else:
+            raise ValueError('Unknown search backend: %s' % name)
+        _backends[name] = backend
+    return _backends[name]
+
+def search(keywords, limit=LIMIT, viewer=VIEWER_STAFF):
+    """Ids of Links matching every keyword that viewer may see, best first.
+
+    viewer is a user (or None) or one of VIEWER_CLASSES; limit None
+    gives every match.
+    """
+    if viewer not in VIEWER_CLASSES:
+        viewer = viewer_class(viewer)
+    mask = VIEWER_MASKS[viewer]
+    visibility = None if mask is None else visibility_values(mask)
+    return get_backend().search(keywords, limit, visibility)
+
+def ranked(links, ids):
+    """Narrows a Link queryset to ids, ordered as in ids.
+    """
+    if not ids:
+        return links.none()
+    order = Case(*[When(id=pk, then=Value(n)) for n,pk in enumerate(ids)],
+                 output_field=IntegerField())
+    return links.filter(id__in=ids).order_by(order)
+
+def narrowed(ids, links):
+    """The ids also in the Link queryset links, in the same order.
+
+    One query per CHUNK_SIZE ids.
+    """
+    keep = set()
+    for n in range(0, len(ids), CHUNK_SIZE):
+        keep.update(links.filter(id__in=ids[n:n+CHUNK_SIZE]).values_list('id', flat=True))
+    return [pk for pk in ids if pk in keep]
+
+
+class Results(object):
+    """Search hits in rank order, as a sequence of Links for a Paginator.
+
+    Only the Links of the slice asked for are loaded, with ranked().
+    """
+
+    def __init__(self, links, ids):
+        self.links = links
+        self.ids = ids
+
+    def __len__(self):
+        return len(self.ids)
+
+    def __getitem__(self, index):
+        if isinstance(index, slice):
+            return list(ranked(self.links, self.ids[index]))
+        return ranked(self.links, [self.ids[index]])[0]
+
+
+@receiver(post_save, sender=Link)
+def link_saved(sender, instance, **kwargs):
+    get_backend().index([instance])
+
+@receiver(post_delete, sender=Link)
+def link_deleted(sender, instance, **kwargs):
+    get_backend().remove([instance.pk])
+
+@receiver(links_bulk_saved, sender=Link)
+def links_bulk_written(sender, links, **kwargs):
+    get_backend().index(links)
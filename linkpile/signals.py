@@ -0,0 +1,29 @@
+from contextlib import contextmanager
+import threading
+
+from django.dispatch import Signal
+
+# Sent after Links were written without save() (bulk_create/update),
+# so post_save never fired for them.  `links` is a list of Link objects
+# with their ids set.
+links_bulk_saved = Signal(providing_args=['links'])
+
+_state = threading.local()
+
+
+@contextmanager
+def saving_link():
+    """Marks the current thread as inside Link.save().
+
+    TagField writes the link's tags from Link's post_save, i.e. inside
+    save(); receivers for tag changes use in_link_save() to tell those
+    writes apart from tags changed on their own.
+    """
+    _state.depth = getattr(_state, 'depth', 0) + 1
+    try:
+        yield
+    finally:
+        _state.depth -= 1
+
+def in_link_save():
+    return getattr(_state, 'depth', 0) > 0
@@ -0,0 +1,105 @@
+# -*- coding: utf-8 -*-
+"""SimHash fingerprints of a link's title, description and domain.
+
+A fingerprint is 64 bits; pages with mostly the same words get
+fingerprints that differ in only a few bits, so a mirror, AMP or
+syndicated copy of an article lands within DISTANCE bits of the
+original.  Fingerprints are stored as signed 64-bit integers to fit a
+BigIntegerField.
+
+For lookups the 64 bits are cut into BANDS bands of 16.  Two
+fingerprints at most BANDS - 1 bits apart agree on at least one whole
+band, so an indexed lookup of (band, value) pairs finds every candidate
+without comparing against every link.  See linkpile.duplicates.
+"""
+
+import hashlib
+import re
+
+BITS = 64
+BANDS = 4
+BAND_BITS = BITS // BANDS
+DISTANCE = BANDS - 1
+MIN_WORDS = 3
+SITE_WORDS = 8
+MASK = (1 << BITS) - 1
+
+WORD_RE = re.compile(r'\w+', re.UNICODE)
+WEIGHTS = {'title': 3, 'description': 1, 'domain': 3}
+# hosts that serve the same site as the bare domain
+DOMAIN_PREFIXES = ['www.', 'amp.', 'm.', 'mobile.']
+
+
+def _words(text):
+    return WORD_RE.findall((text or '').lower())
+
+def _site(domain):
+    domain = (domain or '').lower()
+    for prefix in DOMAIN_PREFIXES:
+        if domain.startswith(prefix):
+            return domain[len(prefix):]
+    return domain
+
+def features(title, description, domain):
+    """{feature: weight} for a page.
+    
+    The site (the domain without www., amp., ...) only counts for pages
+    with fewer than SITE_WORDS words, where it keeps short generic titles
+    ("Home", "About us") on different sites apart.  With more text it
+    would move a mirror or syndicated copy on another site by several
+    bits.
+    """
+    weights = {}
+    words = 0
+    for field,text in [('title', title), ('description', description)]:
+        for word in _words(text):
+            key = '%s:%s' % (field[0], word)
+            weights[key] = weights.get(key, 0) + WEIGHTS[field]
+            words += 1
+    site = _site(domain)
+    if site and (words < SITE_WORDS):
+        weights['d:%s' % site] = WEIGHTS['domain']
+    return weights
+
+def _hash(feature):
+    digest = hashlib.blake2b(feature.encode('utf-8'), digest_size=8).digest()
+    return int.from_bytes(digest, 'big')
+
+def simhash(weights):
+    """Unsigned 64-bit SimHash of {feature: weight}.
+    """
+    totals = [0] * BITS
+    for feature,weight in weights.items():
+        h = _hash(feature)
+        for bit in range(BITS):
+            if h & (1 << bit):
+                totals[bit] += weight
+            else:
+                totals[bit] -= weight
+    value = 0
+    for bit,total in enumerate(totals):
+        if total > 0:
+            value |= 1 << bit
+    return value
+
+def to_signed(value):
+    return value - (1 << BITS) if value >= (1 << (BITS - 1)) else value
+
+def fingerprint(title, description, domain):
+    """Signed fingerprint of a page, or None if it has too few words.
+    """
+    if len(_words(title)) + len(_words(description)) < MIN_WORDS:
+        return None
+    return to_signed(simhash(features(title, description, domain)))
+
+def distance(a, b):
+    """Number of bits in which two fingerprints differ.
+    """
+    return bin((a ^ b) & MASK).count('1')
+
+def bands(value):
+    """[(band, band value)] of a fingerprint.
+    """
+    value &= MASK
+    band_mask = (1 << BAND_BITS) - 1
+    return [(band, (value >> (band * BAND_BITS)) & band_mask) for band in range(BANDS)]
@@ -0,0 +1,285 @@
+# -*- coding: utf-8 -*-
+"""Local copies of linked pages in a content-addressed blob store.
+
+Off unless LINKPILE_SNAPSHOTS is True.  Page bodies are gzipped into
+LINKPILE_SNAPSHOT_ROOT under their sha256 (ab/cd/abcd....gz), so a page
+fetched for several links, or unchanged between fetches, is stored once.
+A Snapshot row ties a link to its blob; blobs no snapshot refers to are
+deleted with the last one.
+
+Pages are fetched by LINKPILE_SNAPSHOT_FETCHER (dotted path to a class
+with a fetch(url) method, see RequestsFetcher) and read and written in
+chunks, never whole.  Bodies over LINKPILE_SNAPSHOT_MAX_BYTES are cut
+off there.
+"""
+
+from concurrent.futures import ThreadPoolExecutor, as_completed
+import gzip
+import hashlib
+import logging
+import os
+import tempfile
+
+import requests
+
+from django.conf import settings
+from django.db.models import Sum
+from django.db.models.signals import post_delete
+from django.dispatch import receiver
+from django.utils import timezone
+from django.utils.module_loading import import_string
+
+from linkpile import scrape as scraper
+from linkpile.models import Link, Snapshot
+
+logger = logging.getLogger(__name__)
+
+CHUNK_SIZE = 64 * 1024
+MAX_BYTES = 10 * 1024 * 1024
+
+
+def _setting(name, default):
+    return getattr(settings, name, default)
+
+def enabled():
+    return _setting('LINKPILE_SNAPSHOTS', False)
+
+
+class BlobStore(object):
+    """Gzipped blobs on disk, addressed by the sha256 of their content.
+    """
+
+    def __init__(self, root):
+        self.root = root
+
+    def path(self, digest):
+        return os.path.join(self.root, digest[:2], digest[2:4], '%s.gz' % digest)
+
+    def exists(self, digest):
+        return os.path.exists(self.path(digest))
+
+    def put(self, chunks):
+        """Stores the concatenated byte chunks; returns (digest, size).
+
+        The content is hashed and compressed in one pass into a temporary
+        file, which is then moved into place, or dropped if the blob
+        already exists.
+        """
+        tmpdir = os.path.join(self.root, 'tmp')
+        os.makedirs(tmpdir, exist_ok=True)
+        sha = hashlib.sha256()
+        size = 0
+        fd,tmp = tempfile.mkstemp(dir=tmpdir)
+        try:
+            with os.fdopen(fd, 'wb') as raw, gzip.GzipFile(fileobj=raw, mode='wb', mtime=0) as out:
+                for chunk in chunks:
+                    sha.update(chunk)
+                    size += len(chunk)
+                    out.write(chunk)
+            digest = sha.hexdigest()
+            path = self.path(digest)
+            if os.path.exists(path):
+                os.remove(tmp)
+            else:
+                os.makedirs(os.path.dirname(path), exist_ok=True)
+                os.replace(tmp, path)
+        except Exception:
+            if os.path.exists(tmp):
+                os.remove(tmp)
+            raise
+        return digest,size
+
+    def open(self, digest, compressed=False):
+        """File object for a blob, decompressed unless compressed=True.
+        """
+        if compressed:
+            return open(self.path(digest), 'rb')
+        return gzip.open(self.path(digest), 'rb')
+
+    def stored_size(self, digest):
+        return os.path.getsize(self.path(digest))
+
+    def delete(self, digest):
+        try:
+            os.remove(self.path(digest))
+        except FileNotFoundError:
+            pass
+
+    def usage(self):
+        """(number of blobs, bytes on disk).
+        """
+        count = size = 0
+        for dirpath,dirnames,filenames in os.walk(self.root):
+            if dirpath == os.path.join(self.root, 'tmp'):
+                continue
+            for filename in filenames:
+                if filename.endswith('.gz'):
+                    count += 1
+                    size += os.path.getsize(os.path.join(dirpath, filename))
+        return count,size
+
+
+class RequestsFetcher(object):
+    """Fetches pages with a pooled requests session.
+    """
+
+    def __init__(self, session=None, timeout=None):
+        self.session = session or scraper.make_session()
+        self.timeout = timeout or scraper.get_timeout()
+
+    def fetch(self, url):
+        """{'status', 'final_url', 'content_type', 'chunks'} for url.
+
+        'chunks' iterates over the body and closes the connection when
+        done; 'status' is None (and there are no chunks) on failure.
+        """
+        try:
+            r = self.session.get(url, allow_redirects=True, timeout=self.timeout, stream=True)
+        except requests.RequestException as err:
+            logger.info('snapshot %s failed: %s' % (url, err))
+            return {'status': None, 'final_url': '', 'content_type': '', 'chunks': iter(())}
+
+        def chunks():
+            try:
+                for chunk in r.iter_content(chunk_size=CHUNK_SIZE):
+                    yield chunk
+            finally:
+                r.close()
+
+        return {
+            'status': r.status_code,
+            'final_url': r.url,
+            'content_type': r.headers.get('Content-Type', ''),
+            'chunks': chunks(),
+        }
+
+
+def get_store():
+    root = _setting('LINKPILE_SNAPSHOT_ROOT', None)
+    if root is None:
+        root = os.path.join(settings.MEDIA_ROOT, 'linkpile', 'snapshots')
+    return BlobStore(root)
+
+def get_fetcher():
+    return import_string(_setting(
+        'LINKPILE_SNAPSHOT_FETCHER', 'linkpile.snapshots.RequestsFetcher'
+    ))()
+
+def _limited(chunks, limit, state):
+    for chunk in chunks:
+        if state['size'] + len(chunk) > limit:
+            chunk = chunk[:limit - state['size']]
+            state['truncated'] = True
+        state['size'] += len(chunk)
+        yield chunk
+        if state['truncated']:
+            break
+
+def take(url, store, fetcher):
+    """Fetches url into the store; returns Snapshot fields or None.
+
+    A body that fails partway (a dropped connection, a read timeout, a
+    full disk) gives None, like a failed fetch.
+    """
+    data = fetcher.fetch(url)
+    state = {'size': 0, 'truncated': False}
+    try:
+        if (data['status'] is None) or (data['status'] >= 400):
+            return None
+        try:
+            digest,size = store.put(_limited(
+                data['chunks'], _setting('LINKPILE_SNAPSHOT_MAX_BYTES', MAX_BYTES), state
+            ))
+        except (requests.RequestException, OSError) as err:
+            logger.info('snapshot %s failed: %s' % (url, err))
+            return None
+    finally:
+        if hasattr(data['chunks'], 'close'):
+            data['chunks'].close()  # releases the connection
+    return {
+        'sha256': digest,
+        'status': data['status'],
+        'final_url': (data['final_url'] or '')[:400],
+        'content_type': (data['content_type'] or '')[:100],
+        'size': size,
+        'stored_size': store.stored_size(digest),
+        'truncated': state['truncated'],
+        'fetched': timezone.now(),
+    }
+
+def snapshot_links(limit=None, workers=None, force=False, store=None, fetcher=None):
+    """Snapshots links that have none (or all, with force).
+
+    Returns (stored, failed) counts.  Blobs of replaced snapshots are
+    only dropped once every fetch is done: until then a worker may have
+    stored the same page for another link whose row is not written yet.
+    """
+    store = store or get_store()
+    fetcher = fetcher or get_fetcher()
+    if workers is None:
+        workers = _setting('LINKPILE_SCRAPE_WORKERS', 8)
+    links = Link.objects.order_by('id')
+    if not force:
+        links = links.filter(snapshot__isnull=True)
+    links = links.values_list('id', 'url')
+    if limit is not None:
+        links = links[:limit]
+    stored = failed = 0
+    replaced = set()
+    with ThreadPoolExecutor(max_workers=workers) as pool:
+        futures = {
+            pool.submit(take, url, store, fetcher): link_id
+            for link_id,url in links.iterator()
+        }
+        for future in as_completed(futures):
+            fields = future.result()
+            if fields is None:
+                failed += 1
+                continue
+            link_id = futures[future]
+            old = Snapshot.objects.filter(link_id=link_id).values_list('sha256', flat=True)
+            old = list(old)
+            Snapshot.objects.update_or_create(link_id=link_id, defaults=fields)
+            if old and old[0] != fields['sha256']:
+                replaced.add(old[0])
+            stored += 1
+    for digest in replaced:
+        _drop_blob(digest, store)
+    return stored,failed
+
+def report(store=None):
+    """Disk usage of the snapshot store.
+    """
+    store = store or get_store()
+    totals = Snapshot.objects.aggregate(size=Sum('size'))
+    blobs = dict(Snapshot.objects.values_list('sha256', 'stored_size').distinct())
+    files,disk = store.usage()
+    return {
+        'snapshots': Snapshot.objects.count(),
+        'blobs': len(blobs),
+        'size': totals['size'] or 0,
+        'stored_size': sum(blobs.values()),
+        'files': files,
+        'disk': disk,
+    }
+
+def _drop_blob(digest, store=None):
+    if not Snapshot.objects.filter(sha256=digest).exists():
+        (store or get_store()).delete(digest)
+
+def iter_blob(fp, chunk_size=CHUNK_SIZE):
+    """Reads a file in chunks for a StreamingHttpResponse, then closes it.
+    """
+    try:
+        while True:
+            chunk = fp.read(chunk_size)
+            if not chunk:
+                break
+            yield chunk
+    finally:
+        fp.close()
+
+
+@receiver(post_delete, sender=Snapshot)
+def snapshot_deleted(sender, instance, **kwargs):
+    _drop_blob(instance.sha256)
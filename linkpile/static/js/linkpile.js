@@ -0,0 +1,158 @@
+/*
+ * linkpile
+ *
+ * Autocomplete for inputs marked data-autocomplete="tags", "words" or
+ * "all" inside a form with data-autocomplete-url (the linkpile
+ * autocomplete view).  The last word typed is completed; the server is
+ * asked once typing pauses for DELAY ms, and answers are remembered per
+ * prefix.
+ */
+(function () {
+    'use strict';
+
+    var DELAY = 150;
+    var LIMIT = 10;
+
+    function lastWord(value) {
+        var words = value.split(/[\s,]+/);
+        return words[words.length - 1];
+    }
+
+    function replaceLastWord(value, word) {
+        return value.replace(/[^\s,]*$/, word) + ' ';
+    }
+
+    function suggestions(data) {
+        var seen = {};
+        var names = [];
+        ['tags', 'words'].forEach(function (kind) {
+            (data[kind] || []).forEach(function (item) {
+                if (!seen[item.name.toLowerCase()]) {
+                    seen[item.name.toLowerCase()] = true;
+                    names.push(item.name);
+                }
+            });
+        });
+        return names.slice(0, LIMIT);
+    }
+
+    function attach(url, input) {
+        var kind = input.getAttribute('data-autocomplete');
+        var list = document.createElement('ul');
+        var answers = {};
+        var timer = null;
+        var request = null;
+        var active = -1;
+
+        list.className = 'linkpile-autocomplete';
+        list.hidden = true;
+        input.parentNode.insertBefore(list, input.nextSibling);
+
+        function hide() {
+            list.hidden = true;
+            active = -1;
+        }
+
+        function choose(name) {
+            input.value = replaceLastWord(input.value, name);
+            hide();
+            input.focus();
+        }
+
+        function highlight(n) {
+            var items = list.children;
+            if (!items.length) {
+                return;
+            }
+            active = (n + items.length) % items.length;
+            for (var i = 0; i < items.length; i++) {
+                items[i].className = (i === active) ? 'active' : '';
+            }
+        }
+
+        function show(prefix, names) {
+            if (lastWord(input.value) !== prefix) {
+                return;  // typed on while waiting
+            }
+            list.innerHTML = '';
+            names.forEach(function (name) {
+                var item = document.createElement('li');
+                item.textContent = name;
+                item.addEventListener('mousedown', function (event) {
+                    event.preventDefault();  // keep the focus in the input
+                    choose(name);
+                });
+                list.appendChild(item);
+            });
+            active = -1;
+            list.hidden = !names.length;
+        }
+
+        function fetch(prefix) {
+            if (answers.hasOwnProperty(prefix)) {
+                show(prefix, answers[prefix]);
+                return;
+            }
+            if (request) {
+                request.abort();
+            }
+            request = new XMLHttpRequest();
+            request.open('GET', url + '?q=' + encodeURIComponent(prefix) +
+                         '&kind=' + encodeURIComponent(kind) + '&limit=' + LIMIT);
+            request.onload = function () {
+                if (this.status === 200) {
+                    answers[prefix] = suggestions(JSON.parse(this.responseText));
+                    show(prefix, answers[prefix]);
+                }
+            };
+            request.send();
+        }
+
+        input.addEventListener('input', function () {
+            var prefix = lastWord(input.value);
+            clearTimeout(timer);
+            if (!prefix) {
+                hide();
+                return;
+            }
+            timer = setTimeout(function () { fetch(prefix); }, DELAY);
+        });
+
+        input.addEventListener('keydown', function (event) {
+            if (list.hidden) {
+                return;
+            }
+            if (event.key === 'ArrowDown') {
+                highlight(active + 1);
+            } else if (event.key === 'ArrowUp') {
+                highlight(active - 1);
+            } else if ((event.key === 'Enter' || event.key === 'Tab') && active >= 0) {
+                choose(list.children[active].textContent);
+            } else if (event.key === 'Escape') {
+                hide();
+            } else {
+                return;
+            }
+            event.preventDefault();
+        });
+
+        input.addEventListener('blur', hide);
+    }
+
+    function init() {
+        var forms = document.querySelectorAll('form[data-autocomplete-url]');
+        Array.prototype.forEach.call(forms, function (form) {
+            var url = form.getAttribute('data-autocomplete-url');
+            var inputs = form.querySelectorAll('input[data-autocomplete]');
+            Array.prototype.forEach.call(inputs, function (input) {
+                attach(url, input);
+            });
+        });
+    }
+
+    if (document.readyState === 'loading') {
+        document.addEventListener('DOMContentLoaded', init);
+    } else {
+        init();
+    }
+}());
@@ -0,0 +1,311 @@
+# -*- coding: utf-8 -*-
+"""Materialized tag statistics: link counts and co-occurrence.
+
+TagStat holds, for every tag, how many links each viewer class may see;
+TagPair holds the same for every pair of tags found on one link.  Both
+are kept up to date from Link post_save/post_delete, bulk writes and
+tags changed outside Link.save(), by adding the difference between a
+link's stored and new (tags, visibility).  Changes from a batch of links
+are summed first and written with a few queries.
+`manage.py linkpile_tagstats_rebuild` recomputes both tables.
+
+The tag cloud built from TagStat is cached per viewer class until the
+statistics change.
+"""
+
+from collections import Counter, defaultdict
+from itertools import combinations, groupby
+
+from django.conf import settings
+from django.contrib.contenttypes.models import ContentType
+from django.core.cache import cache
+from django.db import IntegrityError, transaction
+from django.db.models import F
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+
+from tagging import settings as tagging_settings
+from tagging.models import TaggedItem
+from tagging.utils import calculate_cloud, parse_tag_input
+
+from linkpile.models import Link, TagPair, TagStat
+from linkpile.models import VIEWER_CLASSES, VIEWER_MASKS, viewer_class
+from linkpile.signals import in_link_save, links_bulk_saved
+
+COUNT_FIELDS = {vclass: '%s_count' % vclass for vclass in VIEWER_CLASSES}
+CLOUD_CACHE_KEY = 'linkpile:tagcloud:%s'
+CHUNK_SIZE = 500
+
+
+def tag_names(tags):
+    """Distinct tag names in a TagField string, as tagging stores them.
+    """
+    names = parse_tag_input(tags or '')
+    if tagging_settings.FORCE_LOWERCASE_TAGS:
+        names = [name.lower() for name in names]
+    return sorted(set(names))
+
+def visible_classes(visibility):
+    """Viewer classes that may see a link with this Link.visibility.
+    """
+    return [
+        vclass for vclass in VIEWER_CLASSES
+        if (VIEWER_MASKS[vclass] is None) or (visibility & VIEWER_MASKS[vclass])
+    ]
+
+def count_fields(counts):
+    """Model field values for a Counter of viewer class -> count.
+    """
+    return {COUNT_FIELDS[vclass]: counts[vclass] for vclass in VIEWER_CLASSES}
+
+def _vclass(viewer):
+    return viewer if viewer in VIEWER_CLASSES else viewer_class(viewer)
+
+
+class Deltas(object):
+    """Pending changes to TagStat and TagPair rows.
+    """
+
+    def __init__(self):
+        self.tags = defaultdict(Counter)
+        self.pairs = defaultdict(Counter)
+
+    def add(self, names, visibility, sign=1):
+        classes = visible_classes(visibility)
+        for name in names:
+            for vclass in classes:
+                self.tags[name][vclass] += sign
+        for a,b in combinations(names, 2):
+            for vclass in classes:
+                self.pairs[(a, b)][vclass] += sign
+                self.pairs[(b, a)][vclass] += sign
+
+    def change(self, old_names, old_visibility, names, visibility):
+        if (old_names == names) and (old_visibility == visibility):
+            return
+        self.add(old_names, old_visibility, -1)
+        self.add(names, visibility)
+
+    def apply(self):
+        if not any(any(counts.values()) for counts in self.tags.values()):
+            if not any(any(counts.values()) for counts in self.pairs.values()):
+                return
+        with transaction.atomic():
+            changed = _apply(TagStat, ['name'], {
+                (name,): counts for name,counts in self.tags.items()
+            })
+            changed = _apply(TagPair, ['tag', 'other'], self.pairs) or changed
+        if changed:
+            invalidate()
+
+
+def _apply(model, key_fields, deltas):
+    """Adds deltas ({key: Counter(vclass: n)}) to the rows of model.
+
+    Rows are looked up, created and updated a chunk of keys at a time,
+    with one UPDATE per distinct delta.  Call inside a transaction.
+    """
+    deltas = {
+        key: counts for key,counts in deltas.items() if any(counts.values())
+    }
+    if not deltas:
+        return False
+    keys = sorted(deltas.keys())
+    for n in range(0, len(keys), CHUNK_SIZE):
+        chunk = keys[n:n+CHUNK_SIZE]
+        lookup = {
+            '%s__in' % field: set(key[i] for key in chunk)
+            for i,field in enumerate(key_fields)
+        }
+        existing = {
+            row[:-1]: row[-1]
+            for row in model.objects.filter(**lookup).values_list(*(key_fields + ['id']))
+        }
+        new = []
+        ids_by_delta = defaultdict(list)
+        for key in chunk:
+            counts = tuple(deltas[key][vclass] for vclass in VIEWER_CLASSES)
+            if key in existing:
+                ids_by_delta[counts].append(existing[key])
+            elif max(counts) > 0:
+                fields = count_fields(Counter({
+                    vclass: max(count, 0) for vclass,count in zip(VIEWER_CLASSES, counts)
+                }))
+                fields.update(zip(key_fields, key))
+                new.append((key, counts, model(**fields)))
+        if new:
+            _create(model, key_fields, new, ids_by_delta)
+        for counts,ids in ids_by_delta.items():
+            model.objects.filter(id__in=ids).update(**{
+                COUNT_FIELDS[vclass]: F(COUNT_FIELDS[vclass]) + count
+                for vclass,count in zip(VIEWER_CLASSES, counts)
+            })
+            if min(counts) < 0:
+                # staff see every link, so this is the total
+                model.objects.filter(id__in=ids, staff_count__lte=0).delete()
+    return True
+
+def _create(model, key_fields, new, ids_by_delta):
+    """Inserts new rows ([(key, counts, instance)]).
+
+    A row another save inserted since the lookup (two links getting the
+    same new tag at once) gets its counts added to ids_by_delta for the
+    UPDATE instead.  Each attempt is in a savepoint, so the conflict does
+    not break the caller's transaction.
+    """
+    try:
+        with transaction.atomic():
+            model.objects.bulk_create([obj for key,counts,obj in new])
+        return
+    except IntegrityError:
+        pass
+    for key,counts,obj in new:
+        try:
+            with transaction.atomic():
+                model.objects.bulk_create([obj])
+        except IntegrityError:
+            pk = model.objects.values_list('id', flat=True).get(**dict(zip(key_fields, key)))
+            ids_by_delta[counts].append(pk)
+
+def compute(rows):
+    """Deltas that build the tables from scratch.
+
+    rows are (visibility, tag names) per link.
+    """
+    deltas = Deltas()
+    for visibility,names in rows:
+        deltas.add(sorted(set(names)), visibility)
+    return deltas
+
+def link_rows():
+    """(visibility, tag names) for every tagged link, from TaggedItem.
+    """
+    visibility = dict(Link.objects.order_by().values_list('id', 'visibility').iterator())
+    items = TaggedItem.objects.filter(
+        content_type=ContentType.objects.get_for_model(Link)
+    ).order_by('object_id').values_list('object_id', 'tag__name')
+    for object_id,rows in groupby(items.iterator(), key=lambda row: row[0]):
+        if object_id in visibility:
+            yield visibility[object_id],[name for _,name in rows]
+
+def rebuild():
+    """Recomputes TagStat and TagPair; returns the number of tags.
+    """
+    deltas = compute(link_rows())
+    with transaction.atomic():
+        TagStat.objects.all().delete()
+        TagPair.objects.all().delete()
+        deltas.apply()
+    invalidate()
+    return TagStat.objects.count()
+
+def invalidate():
+    cache.delete_many([CLOUD_CACHE_KEY % vclass for vclass in VIEWER_CLASSES])
+
+def tag_counts(names, viewer=None):
+    """{name: number of links with the tag that viewer may see}.
+    """
+    field = COUNT_FIELDS[_vclass(viewer)]
+    counts = {name: 0 for name in names}
+    counts.update(TagStat.objects.filter(name__in=names).values_list('name', field))
+    return counts
+
+def tag_cloud(viewer=None):
+    """The LINKPILE_TAG_CLOUD_SIZE most used tags viewer may see, by name.
+
+    Returns TagStat objects with `count` and `font_size` (1 to
+    LINKPILE_TAG_CLOUD_STEPS) set, as tagging's calculate_cloud does.
+    """
+    vclass = _vclass(viewer)
+    key = CLOUD_CACHE_KEY % vclass
+    tags = cache.get(key)
+    if tags is None:
+        limit = getattr(settings, 'LINKPILE_TAG_CLOUD_SIZE', 100)
+        field = COUNT_FIELDS[vclass]
+        tags = list(
+            TagStat.objects.filter(**{'%s__gt' % field: 0}).order_by('-%s' % field, 'name')[:limit]
+        )
+        for tag in tags:
+            tag.count = getattr(tag, field)
+        calculate_cloud(tags, steps=getattr(settings, 'LINKPILE_TAG_CLOUD_STEPS', 4))
+        tags.sort(key=lambda tag: tag.name)
+        cache.set(key, tags, getattr(settings, 'LINKPILE_TAG_CLOUD_TIMEOUT', 3600))
+    return tags
+
+def related_tags(names, viewer=None, limit=10):
+    """Tags most often found together with all of names, with counts.
+
+    Returns a list of (name, count), most frequent first.  For a single
+    tag the count is exact; for several it is the smallest pair count,
+    an upper bound on links carrying all of them.
+    """
+    field = COUNT_FIELDS[_vclass(viewer)]
+    names = list(set(names))
+    pairs = TagPair.objects.filter(
+        tag__in=names, **{'%s__gt' % field: 0}
+    ).exclude(other__in=names).values_list('tag', 'other', field)
+    counts = defaultdict(dict)
+    for tag,other,count in pairs:
+        counts[other][tag] = count
+    related = [
+        (other, min(by_tag.values()))
+        for other,by_tag in counts.items() if len(by_tag) == len(names)
+    ]
+    related.sort(key=lambda item: (-item[1], item[0]))
+    return related[:limit]
+
+
+def _db_state(link, created=False):
+    """(names, visibility) as stored before the current write.
+    """
+    if created:
+        return [],0
+    tags = getattr(link, '_db_tags', None)
+    if tags is None:
+        tags = link.tags  # not loaded; the write did not change it
+    return tag_names(tags),getattr(link, '_db_visibility', link.visibility)
+
+@receiver(post_save, sender=Link)
+def link_saved(sender, instance, created=False, **kwargs):
+    deltas = Deltas()
+    old_names,old_visibility = _db_state(instance, created)
+    deltas.change(old_names, old_visibility, tag_names(instance.tags), instance.visibility)
+    deltas.apply()
+
+@receiver(post_delete, sender=Link)
+def link_deleted(sender, instance, **kwargs):
+    deltas = Deltas()
+    names,visibility = _db_state(instance)
+    deltas.add(names, visibility, -1)
+    deltas.apply()
+
+@receiver(links_bulk_saved, sender=Link)
+def links_bulk_written(sender, links, **kwargs):
+    deltas = Deltas()
+    for link in links:
+        created = not hasattr(link, '_db_visibility')
+        old_names,old_visibility = _db_state(link, created)
+        deltas.change(old_names, old_visibility, tag_names(link.tags), link.visibility)
+    deltas.apply()
+
+@receiver(post_save, sender=TaggedItem)
+@receiver(post_delete, sender=TaggedItem)
+def tags_changed(sender, instance, signal, created=False, **kwargs):
+    if in_link_save():
+        return  # counted by link_saved
+    if (signal == post_save) and not created:
+        return
+    if instance.content_type_id != ContentType.objects.get_for_model(Link).id:
+        return
+    visibility = Link.objects.filter(id=instance.object_id).values_list('visibility', flat=True)
+    if not visibility:
+        return
+    name = instance.tag.name
+    others = set(TaggedItem.objects.filter(
+        content_type_id=instance.content_type_id, object_id=instance.object_id
+    ).exclude(tag_id=instance.tag_id).values_list('tag__name', flat=True))
+    deltas = Deltas()
+    sign = 1 if created else -1
+    deltas.add(sorted(others), visibility[0], -sign)
+    deltas.add(sorted(others | set([name])), visibility[0], sign)
+    deltas.apply()
@@ -1,12 +1,27 @@
 import datetime
 from django import template
+from django.utils.safestring import mark_safe
+
+from linkpile import fragments, metrics
 
 register = template.Library()
 
-def linkpile_link( obj ):
+
+def _user(context):
+    request = getattr(context, 'request', None) or context.get('request')
+    return getattr(request, 'user', None)
+
+def linkpile_link( context, obj ):
     """list-view template for Link
     """
-    t = template.loader.get_template('linkpile/linkpile-link.html')
-    return t.render({'link':obj})
+    with metrics.timer('link_tag'):
+        return mark_safe(fragments.render_links([obj], _user(context))[0])
+
+def linkpile_links( context, links ):
+    """list-view template for a page of Links, cached per link
+    """
+    with metrics.timer('link_tag'):
+        return mark_safe(''.join(fragments.render_links(links, _user(context))))
 
-register.simple_tag(linkpile_link)
+register.simple_tag(linkpile_link, takes_context=True)
+register.simple_tag(linkpile_links, takes_context=True)
@@ -0,0 +1,98 @@
+# -*- coding: utf-8 -*-
+"""URL normalization helpers.
+"""
+
+import hashlib
+from urllib.parse import parse_qsl, urlencode, urlsplit, urlunsplit
+
+DEFAULT_PORTS = {'http': '80', 'https': '443'}
+# query parameters that only track where a click came from
+TRACKING_PARAMS = ['fbclid', 'gclid', 'dclid', 'msclkid', 'mc_cid', 'mc_eid', 'igshid']
+TRACKING_PREFIXES = ['utm_']
+
+
+def normalize_url(url):
+    """Normalizes URL so that equivalent spellings compare equal.
+
+    Lowercases scheme and host, drops default ports and the fragment,
+    sorts the query string and makes an empty path '/'.  A URL that
+    cannot be parsed (a port out of range, a broken IPv6 host) comes back
+    stripped but otherwise as given.
+
+    >>> normalize_url('HTTP://Example.COM:80?b=2&a=1#top')
+    'http://example.com/?a=1&b=2'
+    """
+    try:
+        parts = urlsplit(url.strip())
+        port = parts.port and str(parts.port)
+    except ValueError:
+        return url.strip()
+    scheme = parts.scheme.lower()
+    host = (parts.hostname or '').lower()
+    if port and port != DEFAULT_PORTS.get(scheme):
+        host = '%s:%s' % (host, port)
+    if parts.username:
+        userinfo = parts.username
+        if parts.password:
+            userinfo = '%s:%s' % (userinfo, parts.password)
+        host = '%s@%s' % (userinfo, host)
+    path = parts.path or '/'
+    query = urlencode(sorted(parse_qsl(parts.query, keep_blank_values=True)))
+    return urlunsplit((scheme, host, path, query, ''))
+
+def url_domain(url):
+    """Normalized host of URL: lowercase, no port, no leading "www.".
+
+    >>> url_domain('https://WWW.Example.com:8080/path')
+    'example.com'
+    """
+    try:
+        host = (urlsplit(url.strip()).hostname or '').lower().rstrip('.')
+    except ValueError:
+        return ''
+    if host.startswith('www.'):
+        host = host[4:]
+    return host
+
+def url_key(url):
+    """Fixed-width key (sha1 hex) for the normalized URL.
+    """
+    return hashlib.sha1(normalize_url(url).encode('utf-8')).hexdigest()
+
+def _tracking(name):
+    name = name.lower()
+    return (name in TRACKING_PARAMS) or any(
+        name.startswith(prefix) for prefix in TRACKING_PREFIXES
+    )
+
+def canonical_url(url):
+    """Comparison key under which the same page has only one spelling.
+
+    On top of normalize_url(), treats http and https as the same, drops
+    a leading "www.", tracking parameters (utm_*, fbclid, ...) and a
+    trailing slash.  Meant for finding duplicates, not for display.  Like
+    normalize_url(), gives back a URL it cannot parse stripped.
+
+    >>> canonical_url('https://WWW.Example.com/a/?utm_source=x&b=1')
+    'http://example.com/a?b=1'
+    """
+    try:
+        parts = urlsplit(normalize_url(url))
+    except ValueError:
+        return url.strip()
+    scheme = 'http' if parts.scheme in DEFAULT_PORTS else parts.scheme
+    host = parts.netloc
+    if host.startswith('www.'):
+        host = host[4:]
+    path = parts.path.rstrip('/') or '/'
+    query = urlencode([
+        (name, value)
+        for name,value in parse_qsl(parts.query, keep_blank_values=True)
+        if not _tracking(name)
+    ])
+    return urlunsplit((scheme, host, path, query, ''))
+
+def url_hash(url):
+    """Fixed-width key (sha1 hex) for the canonical URL; see Link.url_hash.
+    """
+    return hashlib.sha1(canonical_url(url).encode('utf-8')).hexdigest()
@@ -1,16 +1,31 @@
 from django.conf.urls import include, url
 from django.views.generic import TemplateView
 
-from linkpile.feeds import LinksFeed
+from linkpile.feeds import LinksFeed, SearchFeed, TagFeed
 from linkpile import views
 
 urlpatterns = [
-    url(r'^feed/$', LinksFeed()),
+    url(r'^feed/$', LinksFeed(), name='linkpile-feed'),
+    url(r'^feed/atom/$', LinksFeed('atom'), name='linkpile-feed-atom'),
+    url(r'^feed/json/$', LinksFeed('json'), name='linkpile-feed-json'),
+    url(r'^feed/search/$', SearchFeed(), name='linkpile-feed-search'),
+    url(r'^feed/search/atom/$', SearchFeed('atom'), name='linkpile-feed-search-atom'),
+    url(r'^feed/search/json/$', SearchFeed('json'), name='linkpile-feed-search-json'),
+    url(r'^feed/tag/(?P<tags>[^/]+)/$', TagFeed(), name='linkpile-feed-tag'),
+    url(r'^feed/tag/(?P<tags>[^/]+)/atom/$', TagFeed('atom'), name='linkpile-feed-tag-atom'),
+    url(r'^feed/tag/(?P<tags>[^/]+)/json/$', TagFeed('json'), name='linkpile-feed-tag-json'),
     url(r'^random/$', views.random, name='linkpile-random'),
     url(r'^export/$', views.export, name='linkpile-export'),
     url(r'^new/$', views.new, name='linkpile-new'),
     url(r'^link/(?P<link_id>\d+)/edit/$', views.edit, name='linkpile-edit'),
     url(r'^link/(?P<link_id>\d+)/$', views.detail, name='linkpile-link'),
+    url(r'^link/(?P<link_id>\d+)/cached/$', views.snapshot, name='linkpile-snapshot'),
+    url(r'^domain/(?P<domain>[^/]+)/$', views.domain, name='linkpile-domain'),
+    url(r'^api/links/$', views.api_links, name='linkpile-api-links'),
+    url(r'^metrics/$', views.prometheus_metrics, name='linkpile-metrics'),
+    url(r'^tagcloud/$', views.tag_cloud, name='linkpile-tagcloud'),
+    url(r'^related/(?P<tags>[^/]+)/$', views.related_tags, name='linkpile-related'),
+    url(r'^autocomplete/$', views.complete, name='linkpile-autocomplete'),
     url(r'^(?P<tags>[\w:$&-_-+/.]+)/$', views.tags, name='linkpile-tags'),
     url(r'^$', views.index, name='linkpile-index'),
 ]
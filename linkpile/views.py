@@ -5,17 +5,25 @@ import pytz
 
 from django.conf import settings
 from django.contrib.auth.decorators import login_required
-from django.core.paginator import Paginator, EmptyPage, PageNotAnInteger
 from django.core.urlresolvers import reverse
-from django.http import HttpResponse, HttpResponseRedirect
-from django.db.models import Q
-from django.shortcuts import Http404, get_object_or_404, render
+from django.http import HttpResponse, HttpResponseBadRequest, HttpResponseRedirect
+from django.http import HttpResponseNotAllowed, JsonResponse
+from django.http import StreamingHttpResponse
+from django import shortcuts
+from django.shortcuts import Http404, get_object_or_404
 from django.template import RequestContext
+from django.utils.http import http_date
+from django.views.decorators.csrf import csrf_exempt
 
 from tagging.models import TaggedItem
 
-from linkpile.models import Link
+from linkpile import api, autocomplete, exporter, metrics, pagination, search, snapshots, tagstats
+from linkpile.conditional import conditional_page
+from linkpile.domains import domain_count
+from linkpile.models import ApiToken, Link, Snapshot, parse_date
+from linkpile.models import VIEWER_STAFF, filter_visible, viewer_class
 from linkpile.forms import LinkNewForm, LinkEditForm
+from linkpile.routers import pin_after_write, use_replicas
 
 TIMEZONE = pytz.timezone(settings.TIME_ZONE)
 
@@ -30,64 +38,65 @@ def app_context(request):
     return context
 
 def filter_by_user(links, request):
-    show_perms = False
-    if request.user:
-        if request.user.is_staff:
-            show_perms = True
-        else:
-            links = links.filter(Q(public=1) | Q(friends=1) | Q(family=1))
-    else:
-        links = links.filter(public=1)
+    show_perms = (viewer_class(request.user) == VIEWER_STAFF)
+    links = filter_visible(links, request.user)
     return links,show_perms
 
-def paginate(objects, request):
-    paginator = Paginator(
-        object_list=objects,
-        per_page=settings.LINKPILE_PAGE_SIZE,
-        allow_empty_first_page=True
-    )
-    page = request.GET.get('page')
-    try:
-        objects = paginator.page(page)
-    except PageNotAnInteger:
-        objects = paginator.page(1)
-    except EmptyPage:
-        objects = paginator.page(paginator.num_pages)
-    return objects
+def paginate(objects, request, mode=None):
+    return pagination.paginate(objects, request, mode)
+
+def render(request, template_name, context=None):
+    with metrics.timer('render'):
+        return shortcuts.render(request, template_name, context)
 
 
 # views -----------------------------------------------------------------------
 
+@conditional_page
+@use_replicas
 def index(request):
     links = Link.objects.all().order_by('-date')
     keywords = request.GET.get('keywords', '')
-    if keywords:
-        for word in keywords.split(' '):
-            links = links.filter(title__icontains = word) \
-                    | links.filter(description__icontains = word) \
-                    | links.filter(url__icontains = word) \
-                    | links.filter(tags__icontains = word)
+    dead = request.GET.get('dead')
+    if dead == '1':
+        links = links.filter(linkcheck__dead=True)
+    elif dead == '0':
+        links = links.exclude(linkcheck__dead=True)
     links,show_perms = filter_by_user(links, request)
-    if links:
-        paginatedlinks = paginate(links, request)
+    if keywords:
+        # every hit the user may see, paged in rank order
+        ids = search.search(keywords, limit=None, viewer=request.user)
+        if dead:
+            ids = search.narrowed(ids, links)
+        paginatedlinks = paginate(search.Results(links, ids), request, mode='pages')
     else:
-        paginatedlinks = []
+        paginatedlinks = paginate(links, request)
     return render(
         request,
         'linkpile/index.html',
         {
             'newlinkform': LinkNewForm({}),
             'keywords': keywords,
+            'dead': dead,
             'show_perms': show_perms,
             'links': paginatedlinks,
         },
     )
 
+@conditional_page
+@use_replicas
 def tags(request, tags=None):
     links = []
+    related = []
+    show_perms = False
     if tags:
         tags = tags.split('+')
-        links = TaggedItem.objects.get_by_model(Link, tags).order_by('-date')
+        if all(tagstats.tag_counts(tags, request.user).values()):
+            links = TaggedItem.objects.get_by_model(Link, tags).order_by('-date')
+            related = tagstats.related_tags(tags, request.user)
+        else:
+            # a tag on no link the user may see; skip the joins
+            links = Link.objects.none()
         links,show_perms = filter_by_user(links, request)
         links = paginate(links, request)
     return render(
@@ -96,49 +105,159 @@ def tags(request, tags=None):
         {
             'newlinkform': LinkNewForm({}),
             'tags': tags,
+            'related_tags': related,
             'show_perms': show_perms,
             'links': links,
         },
     )
 
-def random(request):
+@use_replicas
+def tag_cloud(request):
+    return render(
+        request,
+        'linkpile/tagcloud.html',
+        {
+            'tags': tagstats.tag_cloud(request.user),
+        },
+    )
+
+@use_replicas
+def related_tags(request, tags):
+    """JSON list of tags used together with tags ("a+b"), with counts.
+    """
     try:
-        link = Link.get_random()
-    except:
+        limit = min(int(request.GET.get('limit', 10)), 100)
+    except ValueError:
+        return HttpResponseBadRequest('Bad limit')
+    related = tagstats.related_tags(tags.split('+'), request.user, limit=limit)
+    data = [{'name': name, 'count': count} for name,count in related]
+    return HttpResponse(json.dumps(data), content_type='application/json')
+
+@use_replicas
+def complete(request):
+    """JSON tags and title words starting with ?q=, most used first.
+    
+    ?kind= is "tags", "words" or "all" (default); ?limit= up to 50.
+    """
+    kind = request.GET.get('kind', 'all')
+    if kind == 'all':
+        kinds = autocomplete.KINDS
+    elif kind in autocomplete.KINDS:
+        kinds = [kind]
+    else:
+        return HttpResponseBadRequest('Bad kind')
+    try:
+        limit = min(int(request.GET.get('limit', 10)), autocomplete.MAX_LIMIT)
+    except ValueError:
+        return HttpResponseBadRequest('Bad limit')
+    prefix = request.GET.get('q', '')
+    found = autocomplete.complete(prefix, request.user, kinds, limit)
+    data = {'q': prefix}
+    data.update({
+        kind: [{'name': name, 'count': count} for name,count in suggestions]
+        for kind,suggestions in found.items()
+    })
+    return HttpResponse(json.dumps(data), content_type='application/json')
+
+@use_replicas
+def random(request):
+    link = Link.get_random(request.user)
+    if not link:
         return HttpResponseRedirect(reverse('linkpile-index'))
     url = link.absolute_url() + '?random=1'
     return HttpResponseRedirect(url)
 
+@conditional_page
+@use_replicas
 def detail(request, link_id):
-    link = get_object_or_404(Link, pk=link_id)
+    link = get_object_or_404(Link.objects.visible_to(request.user), pk=link_id)
     if link.can_edit(request.user):
         link.can_edit = True
+    snapshot = None
+    if snapshots.enabled():
+        snapshot = Snapshot.objects.filter(link=link).first()
     return render(
         request,
         'linkpile/detail.html',
         {
             'newlinkform': LinkNewForm({}),
             'link': link,
+            'snapshot': snapshot,
+            'related': link.related(request.user),
+            'others_in_domain': link.others_in_domain(request.user),
             'random': request.GET.get('random', None),
         },
     )
 
+@use_replicas
+def snapshot(request, link_id):
+    """The stored copy of a link's page, streamed from the blob store.
+
+    Sent gzipped as stored to clients that accept it, decompressed on
+    the fly otherwise.  The page is sandboxed so its scripts cannot run
+    on this site.
+    """
+    if not snapshots.enabled():
+        raise Http404
+    link = get_object_or_404(Link.objects.visible_to(request.user), pk=link_id)
+    snapshot = get_object_or_404(Snapshot, link=link)
+    store = snapshots.get_store()
+    gzipped = 'gzip' in request.META.get('HTTP_ACCEPT_ENCODING', '')
+    try:
+        fp = store.open(snapshot.sha256, compressed=gzipped)
+    except FileNotFoundError:
+        raise Http404
+    response = StreamingHttpResponse(
+        snapshots.iter_blob(fp),
+        content_type=snapshot.content_type or 'application/octet-stream',
+    )
+    if gzipped:
+        response['Content-Encoding'] = 'gzip'
+        response['Content-Length'] = snapshot.stored_size
+    else:
+        response['Content-Length'] = snapshot.size
+    response['Vary'] = 'Accept-Encoding'
+    response['Content-Security-Policy'] = 'sandbox'
+    response['X-Content-Type-Options'] = 'nosniff'
+    response['Last-Modified'] = http_date(snapshot.fetched.timestamp())
+    return response
+
+@conditional_page
+@use_replicas
+def domain(request, domain):
+    """Links from one domain, newest first.
+    """
+    links = Link.objects.filter(domain=domain.lower()).order_by('-date')
+    links,show_perms = filter_by_user(links, request)
+    links = paginate(links, request)
+    return render(
+        request,
+        'linkpile/index.html',
+        {
+            'newlinkform': LinkNewForm({}),
+            'domain': domain,
+            'domain_count': domain_count(domain.lower(), request.user),
+            'show_perms': show_perms,
+            'links': links,
+        },
+    )
+
 @login_required
+@pin_after_write
 def new(request):
     if not request.user.is_staff:
         raise Http404
     link = None
+    show_errors = False
     if request.method == 'POST':
         form = LinkNewForm(request.POST)
+        show_errors = True
         if form.is_valid():
             url = form.cleaned_data['url']
-            # link exists already?
-            try:
-                existing = Link.objects.get(url=url)
-                if existing:
-                    return HttpResponseRedirect(reverse('linkpile-edit', {'link_id':existing.id}))
-            except:
-                pass
+            # link exists already (under any spelling)?
+            existing = Link.find_duplicate(url)
+            if existing:
+                return HttpResponseRedirect(existing.edit_url())
             # if not, make new one
             if not link:
                 link = Link(url=url)
@@ -146,7 +265,6 @@ def new(request):
             link.save()
             return HttpResponseRedirect(reverse('linkpile-edit', kwargs={'link_id':link.id}))
     else:
-        show_errors = False
         data = {}
         fields = ['url',]
         form = LinkNewForm(data)
@@ -161,6 +279,7 @@ def new(request):
     )
 
 @login_required
+@pin_after_write
 def edit(request, link_id):
     link = get_object_or_404(Link, pk=link_id)
     if not link.can_edit(request.user):
@@ -213,29 +332,78 @@ def edit(request, link_id):
         'linkpile/edit.html',
         {
             'link': link,
+            'others_in_domain': link.others_in_domain(request.user),
+            'near_duplicates': link.near_duplicates(request.user),
             'form': form,
             'show_errors': show_errors,
         },
     )
 
 @login_required
+@use_replicas
 def export(request):
-    """Export links in format required by 
+    """Streams all links as JSON (or NDJSON with ?format=ndjson).
+    
+    ?since= and ?until= limit the date range; ?gzip=1 compresses the
+    stream on the fly.
     """
     if not request.user.is_authenticated():
         raise Http404
-    links = Link.objects.all().order_by('date')[:10]
-    #return render(
-    #    request,
-    #    'linkpile/export.html',
-    #    {
-    #        'links': links,
-    #        'today': datetime.now(tz=TIMEZONE),
-    #    },
-    #)
+    format = request.GET.get('format', 'json')
+    if format not in exporter.FORMATS:
+        return HttpResponseBadRequest('Unknown format: %s' % format)
+    try:
+        since = request.GET.get('since') and parse_date(request.GET['since'], TIMEZONE)
+        until = request.GET.get('until') and parse_date(request.GET['until'], TIMEZONE)
+    except ValueError as err:
+        return HttpResponseBadRequest('Bad date: %s' % err)
+    compress = request.GET.get('gzip') in ['1', 'true']
+    response = StreamingHttpResponse(
+        exporter.export_links(
+            format=format, compress=compress, since=since, until=until
+        ),
+        content_type=exporter.CONTENT_TYPES[format],
+    )
+    if compress:
+        response['Content-Type'] = 'application/gzip'
+        response['Content-Disposition'] = 'attachment; filename="linkpile.%s.gz"' % format
+    return response
+
+def prometheus_metrics(request):
+    """linkpile.metrics in the Prometheus text format.
+
+    For staff, and for requests from LINKPILE_METRICS_IPS, so a scraper
+    needs no login.  The list is empty by default: behind a reverse proxy
+    on the same host every request comes from localhost.
+    """
+    if not metrics.enabled():
+        raise Http404
+    ips = getattr(settings, 'LINKPILE_METRICS_IPS', [])
+    if not (request.user.is_staff or (request.META.get('REMOTE_ADDR') in ips)):
+        raise Http404
     return HttpResponse(
-        json.dumps([
-            link.to_dict() for link in links
-        ]),
-        content_type="application/json"
+        metrics.aggregator.prometheus(),
+        content_type='text/plain; version=0.0.4; charset=utf-8',
     )
+
+@csrf_exempt
+@pin_after_write
+def api_links(request):
+    """Bulk create/update/delete of links as JSON; see linkpile.api.
+    """
+    if request.method != 'POST':
+        return HttpResponseNotAllowed(['POST'])
+    user = ApiToken.authenticate(api.token_key(request))
+    if user is None:
+        response = JsonResponse({'error': 'Invalid or missing API token.'}, status=401)
+        response['WWW-Authenticate'] = 'Token'
+        return response
+    if not user.is_staff:
+        return JsonResponse({'error': 'Not allowed to write links.'}, status=403)
+    try:
+        operations,atomic = api.parse_body(request.body)
+    except api.BadRequest as err:
+        return JsonResponse({'error': str(err)}, status=400)
+    results,counts = api.apply(user, operations, atomic)
+    status = 400 if (atomic and 'skipped' in counts) else 200
+    return JsonResponse({'results': results, 'counts': counts}, status=status)
@@ -1,3 +1,4 @@
+import os
 import sys
 
 try:
@@ -9,15 +10,34 @@ try:
         DATABASES={
             "default": {
                 "ENGINE": "django.db.backends.sqlite3",
-            }
+            },
+            # a second database for tests/test_routers.py
+            "replica": {
+                "ENGINE": "django.db.backends.sqlite3",
+            },
         },
         ROOT_URLCONF="linkpile.urls",
         INSTALLED_APPS=[
             "django.contrib.auth",
             "django.contrib.contenttypes",
+            "django.contrib.sessions",
             "django.contrib.sites",
+            "tagging",
             "linkpile",
         ],
+        MIDDLEWARE=[
+            "linkpile.metrics.MetricsMiddleware",
+            "django.contrib.sessions.middleware.SessionMiddleware",
+            "django.contrib.auth.middleware.AuthenticationMiddleware",
+        ],
+        TEMPLATES=[
+            {
+                "BACKEND": "django.template.backends.django.DjangoTemplates",
+                "DIRS": [os.path.join(os.path.dirname(__file__), "tests", "templates")],
+                "APP_DIRS": True,
+            },
+        ],
+        LINKPILE_PAGE_SIZE=20,
         SITE_ID=1,
         NOSE_ARGS=['-s'],
     )
@@ -49,4 +69,9 @@ def run_tests(*test_args):
 
 
 if __name__ == '__main__':
-    run_tests(*sys.argv[1:])
\ No newline at end of file
+    if sys.argv[1:2] == ['--bench']:
+        # python runtests.py --bench [options]; see benchmarks/bench_suite.py
+        from benchmarks import bench_suite
+        bench_suite.main(sys.argv[2:])
+    else:
+        run_tests(*sys.argv[1:])
\ No newline at end of file
@@ -43,6 +43,10 @@ setup(
         'pytz',
         'requests',
     ],
+    extras_require={
+        # faster linkpile.related
+        'related': ['numpy', 'scipy'],
+    },
     license="BSD",
     zip_safe=False,
     keywords='linkpile',
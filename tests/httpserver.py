@@ -0,0 +1,73 @@
+"""
+Local HTTP stand-in for tests that fetch remote pages.
+"""
+
+from http.server import BaseHTTPRequestHandler, HTTPServer
+from socketserver import ThreadingMixIn
+import threading
+
+
+class _Server(ThreadingMixIn, HTTPServer):
+    daemon_threads = True
+
+
+class LocalHTTPServer(object):
+    """Serves canned responses from a dict on 127.0.0.1.
+
+    routes maps a path to (status, headers, body) or to a callable that
+    takes the handler and returns one.  Every request is recorded in
+    `requests` as (method, path, headers).
+    """
+
+    def __init__(self, routes=None):
+        self.routes = routes or {}
+        self.requests = []
+        server = self
+
+        class Handler(BaseHTTPRequestHandler):
+
+            def _respond(self, send_body):
+                server.requests.append((self.command, self.path, dict(self.headers)))
+                route = server.routes.get(self.path)
+                if route is None:
+                    route = (404, {}, b'not found')
+                if callable(route):
+                    route = route(self)
+                status,headers,body = route
+                if isinstance(body, str):
+                    body = body.encode('utf-8')
+                self.send_response(status)
+                headers = dict(headers)
+                headers.setdefault('Content-Type', 'text/html; charset=utf-8')
+                headers.setdefault('Content-Length', str(len(body)))
+                for key,value in headers.items():
+                    self.send_header(key, value)
+                self.end_headers()
+                if send_body:
+                    self.wfile.write(body)
+
+            def do_GET(self):
+                self._respond(True)
+
+            def do_HEAD(self):
+                self._respond(False)
+
+            def log_message(self, *args):
+                pass
+
+        self.httpd = _Server(('127.0.0.1', 0), Handler)
+        self.thread = threading.Thread(
+            target=self.httpd.serve_forever, kwargs={'poll_interval': 0.01}
+        )
+        self.thread.daemon = True
+
+    def url(self, path='/'):
+        return 'http://127.0.0.1:%s%s' % (self.httpd.server_address[1], path)
+
+    def start(self):
+        self.thread.start()
+        return self
+
+    def stop(self):
+        self.httpd.shutdown()
+        self.httpd.server_close()
@@ -0,0 +1,154 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+test_api
+------------
+
+Tests for the `linkpile` bulk links API.
+"""
+
+import json
+from io import StringIO
+
+from django.contrib.auth.models import User
+from django.contrib.contenttypes.models import ContentType
+from django.core.management import call_command
+from django.core.urlresolvers import reverse
+from django.test import TestCase
+
+from tagging.models import TaggedItem
+
+from linkpile.models import ApiToken, Link, TagStat
+
+
+class TestApi(TestCase):
+
+    def setUp(self):
+        self.user = User.objects.create(username='syncer', is_staff=True)
+        self.token,self.key = ApiToken.create(self.user, 'tests')
+        self.url = reverse('linkpile-api-links')
+
+    def post(self, operations, key=None, **data):
+        data['operations'] = operations
+        return self.client.post(
+            self.url, json.dumps(data), content_type='application/json',
+            HTTP_AUTHORIZATION='Token %s' % (key or self.key),
+        )
+
+    def make(self, url, **kwargs):
+        link = Link(user=self.user, url=url, title='existing', date='2020-01-01T00:00:00Z', **kwargs)
+        link.save()
+        return link
+
+    def tags_of(self, link):
+        return sorted(TaggedItem.objects.filter(
+            content_type=ContentType.objects.get_for_model(Link), object_id=link.id
+        ).values_list('tag__name', flat=True))
+
+    def test_auth(self):
+        response = self.client.post(self.url, '[]', content_type='application/json')
+        self.assertEqual(response.status_code, 401)
+        self.assertEqual(self.post([], key='wrong').status_code, 401)
+        self.assertEqual(self.client.get(self.url).status_code, 405)
+        outsider = User.objects.create(username='outsider')
+        token,key = ApiToken.create(outsider)
+        self.assertEqual(self.post([], key=key).status_code, 403)
+        self.assertEqual(self.post([]).status_code, 200)
+        self.assertIsNotNone(ApiToken.objects.get(id=self.token.id).last_used)
+        self.assertNotEqual(self.token.key_hash, self.key)
+
+    def test_bad_requests(self):
+        response = self.client.post(
+            self.url, 'nope', content_type='application/json',
+            HTTP_AUTHORIZATION='Token %s' % self.key,
+        )
+        self.assertEqual(response.status_code, 400)
+        with self.settings(LINKPILE_API_MAX_OPERATIONS=1):
+            self.assertEqual(self.post([{}, {}]).status_code, 400)
+
+    def test_create(self):
+        response = self.post([
+            {'op': 'create', 'link': {'url': 'https://example.com/a', 'title': 'A', 'tags': 'x y', 'public': True}},
+            {'op': 'create', 'link': {'url': 'https://example.com/b', 'date': '2021-05-01T12:00:00+00:00'}},
+            {'op': 'create', 'link': {'url': 'not a url'}},
+        ])
+        data = json.loads(response.content.decode())
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual([r['status'] for r in data['results']], ['created', 'created', 'error'])
+        self.assertIn('url', data['results'][2]['errors'])
+        self.assertEqual(data['counts'], {'created': 2, 'error': 1})
+        a = Link.objects.get(id=data['results'][0]['id'])
+        self.assertEqual((a.title, a.public, a.domain), ('A', True, 'example.com'))
+        self.assertEqual(self.tags_of(a), ['x', 'y'])
+        self.assertEqual(TagStat.objects.get(name='x').public_count, 1)
+        b = Link.objects.get(id=data['results'][1]['id'])
+        self.assertEqual(b.scrape_status, 'pending')
+        self.assertEqual(b.date.year, 2021)
+        self.assertEqual(data['results'][0]['link']['tags'], 'x y')
+
+    def test_duplicates(self):
+        existing = self.make('https://example.com/page')
+        response = self.post([
+            {'op': 'create', 'link': {'url': 'http://www.example.com/page/'}},
+            {'op': 'create', 'link': {'url': 'https://example.com/new'}},
+            {'op': 'create', 'link': {'url': 'https://example.com/new#again'}},
+        ])
+        results = json.loads(response.content.decode())['results']
+        self.assertEqual([r['status'] for r in results], ['duplicate', 'created', 'duplicate'])
+        self.assertEqual(results[0]['id'], existing.id)
+        self.assertEqual(Link.objects.count(), 2)
+
+    def test_update_only_changes_named_fields(self):
+        link = self.make('https://example.com/u', tags='old keep', description='desc')
+        other = self.make('https://example.com/v')
+        response = self.post([
+            {'op': 'update', 'id': link.id, 'link': {'public': True}, 'add_tags': 'new', 'remove_tags': 'old'},
+            {'op': 'update', 'id': other.id, 'link': {'title': 'existing'}},
+            {'op': 'update', 'id': 999999, 'link': {}},
+        ])
+        results = json.loads(response.content.decode())['results']
+        self.assertEqual([r['status'] for r in results], ['updated', 'unchanged', 'not_found'])
+        link = Link.objects.get(id=link.id)
+        self.assertTrue(link.public)
+        self.assertEqual((link.title, link.description), ('existing', 'desc'))
+        self.assertEqual(self.tags_of(link), ['keep', 'new'])
+        self.assertFalse(TagStat.objects.filter(name='old').exists())
+        self.assertEqual(TagStat.objects.get(name='keep').public_count, 1)
+
+    def test_delete(self):
+        link = self.make('https://example.com/d', tags='gone')
+        response = self.post([{'op': 'delete', 'id': link.id}, {'op': 'delete', 'id': link.id}])
+        results = json.loads(response.content.decode())['results']
+        self.assertEqual([r['status'] for r in results], ['deleted', 'error'])
+        self.assertFalse(Link.objects.filter(id=link.id).exists())
+        self.assertEqual(self.tags_of(link), [])
+        self.assertFalse(TagStat.objects.filter(name='gone').exists())
+
+    def test_atomic(self):
+        link = self.make('https://example.com/t')
+        response = self.post([
+            {'op': 'create', 'link': {'url': 'https://example.com/new'}},
+            {'op': 'delete', 'id': link.id},
+            {'op': 'explode'},
+        ], atomic=True)
+        self.assertEqual(response.status_code, 400)
+        results = json.loads(response.content.decode())['results']
+        self.assertEqual([r['status'] for r in results], ['skipped', 'skipped', 'error'])
+        self.assertEqual(list(Link.objects.values_list('id', flat=True)), [link.id])
+
+    def test_wrong_user(self):
+        response = self.post([{'op': 'create', 'link': {'url': 'https://example.com/w', 'user': 'someone'}}])
+        self.assertIn('user', json.loads(response.content.decode())['results'][0]['errors'])
+
+    def test_token_command(self):
+        out = StringIO()
+        call_command('linkpile_token', 'syncer', '--name', 'cli', stdout=out)
+        key = out.getvalue().strip()
+        self.assertEqual(ApiToken.authenticate(key), self.user)
+        out = StringIO()
+        call_command('linkpile_token', 'syncer', '--list', stdout=out)
+        self.assertIn('cli', out.getvalue())
+        token = ApiToken.objects.get(name='cli')
+        call_command('linkpile_token', 'syncer', '--revoke', str(token.id), stdout=StringIO())
+        self.assertIsNone(ApiToken.authenticate(key))
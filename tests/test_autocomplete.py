@@ -0,0 +1,121 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+test_autocomplete
+------------
+
+Tests for `linkpile` tag and title word autocomplete.
+"""
+
+import io
+import json
+
+from django.contrib.auth.models import User
+from django.test import TestCase
+
+from linkpile import autocomplete, importer
+from linkpile.autocomplete import PrefixIndex
+from linkpile.models import Link, VIEWER_MEMBER, VIEWER_PUBLIC, VIEWER_STAFF
+
+
+class TestPrefixIndex(TestCase):
+
+    def test_complete(self):
+        index = PrefixIndex({
+            'python': (3, 3, 3), 'pyramid': (1, 1, 1), 'pytest': (0, 2, 2), 'rust': (5, 5, 5),
+        })
+        self.assertEqual(index.complete('py', 0, 10), [('python', 3), ('pyramid', 1)])
+        self.assertEqual(index.complete('py', 1, 2), [('python', 3), ('pytest', 2)])
+        self.assertEqual(index.complete('pyt', 2, 10), [('python', 3), ('pytest', 2)])
+        self.assertEqual(index.complete('x', 2, 10), [])
+
+    def test_add_and_remove(self):
+        index = PrefixIndex({'python': (1, 1, 1)})
+        self.assertEqual(index.complete('p', 0, 10), [('python', 1)])
+        index.add('perl', (2, 2, 2), label='Perl')
+        self.assertEqual(index.complete('p', 0, 10), [('Perl', 2), ('python', 1)])
+        index.add('perl', (-2, -2, -2))
+        index.add('python', (0, 0, 1))
+        self.assertEqual(index.complete('p', 0, 10), [('python', 1)])
+        self.assertEqual(index.complete('p', 2, 10), [('python', 2)])
+        self.assertEqual(index.terms, ['python'])
+
+
+class TestAutocomplete(TestCase):
+
+    def setUp(self):
+        autocomplete.completer.invalidate()
+        self.staff = User.objects.create(username='staff', is_staff=True)
+        self.member = User.objects.create(username='member')
+        self.make('Python packaging guide', 'python packaging', public=True)
+        self.make('Python asyncio tutorial', 'python asyncio', public=True)
+        self.make('Private pyramid notes', 'pyramid', public=False, friends=True, family=True)
+        self.make('Secret pylons memo', 'pylons')
+
+    def tearDown(self):
+        autocomplete.completer.invalidate()
+
+    def make(self, title, tags, **kwargs):
+        link = Link(user=self.staff, url='http://example.com/%s' % title, title=title, tags=tags, **kwargs)
+        link.save()
+        return link
+
+    def test_viewer_classes(self):
+        found = autocomplete.complete('py', VIEWER_PUBLIC)
+        self.assertEqual(found, {'tags': [('python', 2)], 'words': [('python', 2)]})
+        found = autocomplete.complete('Py', VIEWER_MEMBER)
+        self.assertEqual(found['tags'], [('python', 2), ('pyramid', 1)])
+        found = autocomplete.complete('py', self.staff, kinds=['words'])
+        self.assertEqual(found, {'words': [('python', 2), ('pylons', 1), ('pyramid', 1)]})
+        self.assertEqual(autocomplete.complete(' ', VIEWER_STAFF), {'tags': [], 'words': []})
+
+    def test_incremental_updates(self):
+        autocomplete.complete('py')
+        with self.assertNumQueries(0):
+            autocomplete.complete('pa')
+        link = self.make('Pandas dataframes', 'python pandas', public=True)
+        with self.assertNumQueries(0):
+            self.assertEqual(autocomplete.complete('pa')['tags'], [('packaging', 1), ('pandas', 1)])
+            self.assertEqual(autocomplete.complete('py')['tags'], [('python', 3)])
+        link = Link.objects.get(id=link.id)
+        link.title = 'Polars dataframes'
+        link.tags = 'polars'
+        link.public = False
+        link.save()
+        with self.assertNumQueries(0):
+            self.assertEqual(autocomplete.complete('pa')['words'], [('packaging', 1)])
+            self.assertEqual(autocomplete.complete('po')['tags'], [])
+            self.assertEqual(autocomplete.complete('po', self.staff)['tags'], [('polars', 1)])
+        link.delete()
+        self.assertEqual(autocomplete.complete('po', self.staff), {'tags': [], 'words': []})
+
+    def test_bulk_writes_rebuild(self):
+        autocomplete.complete('py')
+        record = {
+            'user': 'staff', 'family': False, 'friends': False, 'public': True,
+            'shared': True, 'title': 'Rust ownership explained', 'description': '',
+            'url': 'http://example.com/rust', 'date': '2017-06-01T12:00:00+00:00',
+            'tags': 'rust',
+        }
+        importer.import_links(io.StringIO(json.dumps([record])))
+        self.assertIsNone(autocomplete.completer.indexes)
+        self.assertEqual(autocomplete.complete('ru'), {'tags': [('rust', 1)], 'words': [('rust', 1)]})
+
+    def test_view(self):
+        response = self.client.get('/autocomplete/', {'q': 'py', 'kind': 'tags'})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json(), {'q': 'py', 'tags': [{'name': 'python', 'count': 2}]})
+        self.client.force_login(self.staff)
+        data = self.client.get('/autocomplete/', {'q': 'pyl', 'limit': '5'}).json()
+        self.assertEqual(data['words'], [{'name': 'pylons', 'count': 1}])
+        self.assertEqual(self.client.get('/autocomplete/', {'kind': 'nope'}).status_code, 400)
+        self.assertEqual(self.client.get('/autocomplete/', {'limit': 'x'}).status_code, 400)
+
+    def test_forms_ask_for_suggestions(self):
+        self.assertContains(self.client.get('/'), 'data-autocomplete="all"')
+        self.client.force_login(self.staff)
+        link = Link.objects.first()
+        response = self.client.get(link.edit_url())
+        self.assertContains(response, 'data-autocomplete-url="/autocomplete/"')
+        self.assertContains(response, 'data-autocomplete="tags"')
@@ -0,0 +1,44 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+test_benchmarks
+------------
+
+Keeps the `linkpile` benchmark suite runnable.
+"""
+
+import json
+
+from django.test import TestCase
+
+from benchmarks import bench_suite
+from linkpile.models import Link
+
+
+class TestBenchSuite(TestCase):
+
+    def test_helpers(self):
+        self.assertEqual(bench_suite.parse_size('100k'), 100000)
+        self.assertEqual(bench_suite.parse_size('250'), 250)
+        self.assertEqual(bench_suite.percentile([3, 1, 2], 50), 2)
+        self.assertEqual(bench_suite.percentile([1, 2, 3, 4], 95), 4)
+
+    def test_run_size(self):
+        result = bench_suite.run_size(50, repeat=2)
+        self.assertEqual(Link.objects.count(), 50)
+        names = [case['name'] for case in result['results']]
+        for name in ['view:index', 'view:detail', 'view:feed', 'view:export',
+                     'model:get_random', 'model:from_dict:x1000', 'model:scrape:x20']:
+            self.assertIn(name, names)
+        for case in result['results']:
+            self.assertGreaterEqual(case['warm']['min_ms'], 0)
+            self.assertGreater(case['cold']['peak_bytes'], 0)
+        json.dumps(result)
+
+    def test_grow_and_filter(self):
+        first = bench_suite.run_size(20, repeat=1, cases=['model:'])
+        second = bench_suite.run_size(30, repeat=1, cases=['model:others'], start=20)
+        self.assertEqual(Link.objects.count(), 30)
+        self.assertTrue(all(case['name'].startswith('model:') for case in first['results']))
+        self.assertEqual([case['name'] for case in second['results']], ['model:others_in_domain'])
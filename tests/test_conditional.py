@@ -0,0 +1,88 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+test_conditional
+------------
+
+Tests for `linkpile` conditional GET on the HTML pages.
+"""
+
+from django.contrib.auth.models import User
+from django.core.cache import cache
+from django.core.urlresolvers import reverse
+from django.db import connection
+from django.test import TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+
+from linkpile import conditional
+from linkpile.models import Link
+
+
+class TestConditional(TestCase):
+
+    def setUp(self):
+        cache.clear()
+        self.staff = User.objects.create(username='keeper', is_staff=True)
+        self.link = Link(user=self.staff, url='http://example.com/', title='t', public=True, tags='x')
+        self.link.save()
+
+    def get(self, url, **headers):
+        return self.client.get(url, **headers)
+
+    def test_not_modified(self):
+        url = reverse('linkpile-index')
+        response = self.get(url)
+        self.assertEqual(response.status_code, 200)
+        etag = response['ETag']
+        self.assertIn('private', response['Cache-Control'])
+        with CaptureQueriesContext(connection) as queries:
+            response = self.get(url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 304)
+        self.assertEqual(len(queries), 0)
+        response = self.get(url, HTTP_IF_MODIFIED_SINCE=response['Last-Modified'])
+        self.assertEqual(response.status_code, 304)
+
+    def test_pages(self):
+        for url in [reverse('linkpile-index'), reverse('linkpile-tags', args=['x']),
+                    self.link.absolute_url(), reverse('linkpile-domain', args=['example.com'])]:
+            etag = self.get(url)['ETag']
+            self.assertEqual(self.get(url, HTTP_IF_NONE_MATCH=etag).status_code, 304, url)
+
+    def test_changes_bump_version(self):
+        url = reverse('linkpile-index')
+        etag = self.get(url)['ETag']
+        self.link.title = 'changed'
+        self.link.save()
+        self.assertEqual(self.get(url, HTTP_IF_NONE_MATCH=etag).status_code, 200)
+        etag = self.get(url)['ETag']
+        self.link.delete()
+        self.assertEqual(self.get(url, HTTP_IF_NONE_MATCH=etag).status_code, 200)
+
+    def test_etag_varies(self):
+        url = reverse('linkpile-index')
+        anonymous = self.get(url)['ETag']
+        self.assertNotEqual(self.get(url + '?page=2')['ETag'], anonymous)
+        self.client.force_login(self.staff)
+        staff = self.get(url)
+        self.assertNotEqual(staff['ETag'], anonymous)
+        self.assertEqual(self.get(url, HTTP_IF_NONE_MATCH=anonymous).status_code, 200)
+        self.assertIn('Cookie', staff['Vary'])
+
+    def test_cache_cleared(self):
+        url = reverse('linkpile-index')
+        etag = self.get(url)['ETag']
+        cache.clear()
+        self.assertEqual(self.get(url, HTTP_IF_NONE_MATCH=etag).status_code, 200)
+        version,modified = conditional.pile_version()
+        conditional.bump()
+        self.assertNotEqual(conditional.pile_version()[0], version)
+
+    def test_not_found_is_not_tagged(self):
+        response = self.get(reverse('linkpile-link', args=[999999]))
+        self.assertEqual(response.status_code, 404)
+        self.assertNotIn('ETag', response)
+
+    @override_settings(LINKPILE_CONDITIONAL_GET=False)
+    def test_disabled(self):
+        self.assertNotIn('ETag', self.get(reverse('linkpile-index')))
@@ -0,0 +1,73 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+test_domains
+------------
+
+Tests for `linkpile` per-domain lookups.
+"""
+
+from django.contrib.auth.models import User
+from django.core.cache import cache
+from django.test import TestCase
+
+from linkpile.domains import domain_count
+from linkpile.models import Link
+from linkpile.urlnorm import url_domain
+
+
+class TestDomains(TestCase):
+
+    def setUp(self):
+        cache.clear()
+        self.staff = User.objects.create(username='staff', is_staff=True)
+        self.link = self.make('https://WWW.Example.com/', public=True)
+        self.make('http://example.com/a', public=True)
+        self.make('http://example.com:8080/b', friends=True)
+        self.make('http://example.com/private')
+        self.make('http://notexample.com/c', public=True)
+
+    def make(self, url, **kwargs):
+        link = Link(user=self.staff, url=url, title=url, **kwargs)
+        link.save()
+        return link
+
+    def test_url_domain(self):
+        self.assertEqual(url_domain('https://WWW.Example.com:8080/path'), 'example.com')
+        self.assertEqual(url_domain('not a url'), '')
+
+    def test_domain_field(self):
+        self.assertEqual(self.link.domain, 'example.com')
+
+    def test_others_in_domain(self):
+        urls = lambda viewer, **kw: sorted(
+            l.url for l in self.link.others_in_domain(viewer, **kw)
+        )
+        self.assertEqual(urls(None), ['http://example.com/a'])
+        self.assertEqual(len(urls(self.staff)), 3)
+        self.assertEqual(len(urls(self.staff, per_page=2)), 2)
+        self.assertEqual(len(urls(self.staff, per_page=2, page=2)), 1)
+
+    def test_domain_count(self):
+        self.assertEqual(domain_count('example.com'), 2)
+        self.assertEqual(domain_count('example.com', self.staff), 4)
+        with self.assertNumQueries(0):
+            domain_count('example.com')
+        self.make('http://example.com/new', public=True)
+        self.assertEqual(domain_count('example.com'), 3)
+        link = Link.objects.get(url='http://example.com/new')
+        link.url = 'http://other.org/'
+        link.save()
+        self.assertEqual(domain_count('example.com'), 2)
+
+    def test_views(self):
+        response = self.client.get('/domain/example.com/')
+        self.assertContains(response, 'example.com (2 links)')
+        self.assertNotContains(response, 'http://example.com/private')
+        response = self.client.get(self.link.absolute_url())
+        self.assertContains(response, 'href="/domain/example.com/"')
+        self.assertContains(response, 'http://example.com/a')
+        self.assertNotContains(response, 'http://example.com/private')
+        private = Link.objects.get(url='http://example.com/private')
+        self.assertEqual(self.client.get(private.absolute_url()).status_code, 404)
@@ -0,0 +1,92 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+test_duplicates
+------------
+
+Tests for `linkpile` duplicate detection.
+"""
+
+from io import StringIO
+
+from django.contrib.auth.models import User
+from django.core.management import call_command
+from django.test import TestCase
+
+from tagging.models import Tag
+
+from linkpile import duplicates
+from linkpile.models import Link
+from linkpile.urlnorm import canonical_url, url_hash
+
+
+class TestDuplicates(TestCase):
+
+    def setUp(self):
+        self.user = User.objects.create(username='staff', is_staff=True)
+
+    def make(self, url, **kwargs):
+        link = Link(user=self.user, url=url, title=kwargs.pop('title', url), **kwargs)
+        link.save()
+        return link
+
+    def test_canonical_url(self):
+        same = [
+            'http://example.com/page',
+            'https://example.com/page/',
+            'HTTP://WWW.Example.COM:80/page',
+            'http://example.com/page?utm_source=feed&utm_medium=rss',
+            'http://example.com/page?fbclid=abc#comments',
+        ]
+        self.assertEqual(set(canonical_url(url) for url in same), {'http://example.com/page'})
+        self.assertEqual(canonical_url('http://example.com/?b=2&a=1'), 'http://example.com/?a=1&b=2')
+        self.assertNotEqual(url_hash('http://example.com/page'), url_hash('http://example.com/other'))
+        self.assertEqual(len(url_hash('http://example.com/')), 40)
+
+    def test_unparsable_urls(self):
+        self.assertEqual(canonical_url(' http://example.com:99999/ '), 'http://example.com:99999/')
+        self.assertEqual(canonical_url('http://[::1/a'), 'http://[::1/a')
+        link = self.make('http://example.com:99999/')
+        self.assertEqual(link.url_hash, url_hash('http://example.com:99999/'))
+        self.assertEqual(Link.find_duplicate('http://example.com:99999/'), link)
+        self.client.force_login(self.user)
+        response = self.client.post('/new/', {'url': 'http://example.com:99999/'})
+        self.assertRedirects(response, link.edit_url(), fetch_redirect_response=False)
+
+    def test_find_duplicate(self):
+        link = self.make('https://example.com/page/')
+        self.assertEqual(link.url_hash, url_hash('http://example.com/page'))
+        with self.assertNumQueries(1):
+            self.assertEqual(Link.find_duplicate('http://www.example.com/page?utm_source=x'), link)
+        self.assertIsNone(Link.find_duplicate('http://example.com/other'))
+
+    def test_new_redirects_to_existing(self):
+        link = self.make('http://example.com/page')
+        self.client.force_login(self.user)
+        response = self.client.post('/new/', {'url': 'https://example.com/page/'})
+        self.assertRedirects(response, link.edit_url(), fetch_redirect_response=False)
+        self.assertEqual(Link.objects.count(), 1)
+        response = self.client.post('/new/', {'url': 'http://example.com/other'})
+        self.assertEqual(Link.objects.count(), 2)
+
+    def test_clusters_and_merge(self):
+        first = self.make('http://example.com/page', tags='python')
+        self.make('https://example.com/page/', tags='django', description='About a page')
+        self.make('http://example.com/page?utm_source=x', title='[scrape failed]')
+        self.make('http://example.com/other')
+        with self.assertNumQueries(2):
+            clusters = list(duplicates.clusters())
+        self.assertEqual([len(cluster) for cluster in clusters], [3])
+        out = StringIO()
+        call_command('linkpile_duplicates', stdout=out)
+        self.assertIn('1 clusters, 2 duplicate links found', out.getvalue())
+        self.assertEqual(Link.objects.count(), 4)
+        call_command('linkpile_duplicates', merge=True, stdout=StringIO())
+        self.assertEqual(Link.objects.count(), 2)
+        merged = Link.objects.get(id=first.id)
+        self.assertEqual(merged.description, 'About a page')
+        self.assertEqual(
+            sorted(tag.name for tag in Tag.objects.get_for_object(merged)), ['django', 'python']
+        )
+        self.assertEqual(list(duplicates.clusters()), [])
@@ -0,0 +1,84 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+test_exporter
+------------
+
+Tests for the `linkpile` streaming export.
+"""
+
+from datetime import datetime, timedelta
+import gzip
+import json
+import os
+import tempfile
+
+from django.contrib.auth.models import User
+from django.core.management import call_command
+from django.test import TestCase
+from django.utils.timezone import utc
+
+from linkpile import exporter
+from linkpile.models import Link
+
+START = datetime(2017, 1, 1, tzinfo=utc)
+
+
+class TestExport(TestCase):
+
+    def setUp(self):
+        self.user = User.objects.create(username='exporter', is_staff=True)
+        for n in range(12):
+            # pairs of links share a date to exercise the (date, id) keyset
+            Link(
+                user=self.user, url='http://example.com/%s' % n,
+                title='Link %s' % n, date=START + timedelta(days=n // 2),
+            ).save()
+
+    def export(self, **kwargs):
+        return ''.join(exporter.export_links(**kwargs))
+
+    def test_json(self):
+        data = json.loads(self.export(chunk_size=5))
+        self.assertEqual([d['title'] for d in data], ['Link %s' % n for n in range(12)])
+
+    def test_ndjson_and_dates(self):
+        text = self.export(
+            format='ndjson', chunk_size=3,
+            since=START + timedelta(days=1), until=START + timedelta(days=3),
+        )
+        titles = [json.loads(line)['title'] for line in text.splitlines()]
+        self.assertEqual(titles, ['Link 2', 'Link 3', 'Link 4', 'Link 5'])
+
+    def test_query_count(self):
+        # one query per chunk plus the empty one at the end; users are joined
+        with self.assertNumQueries(4):
+            self.export(chunk_size=5)
+
+    def test_gzip(self):
+        data = b''.join(exporter.export_links(compress=True))
+        self.assertEqual(len(json.loads(gzip.decompress(data).decode('utf-8'))), 12)
+
+    def test_view(self):
+        self.client.force_login(self.user)
+        response = self.client.get('/export/', {'format': 'ndjson', 'since': '2017-01-06T00:00:00+00:00'})
+        self.assertEqual(response['Content-Type'], 'application/x-ndjson')
+        lines = b''.join(response.streaming_content).decode('utf-8').splitlines()
+        self.assertEqual([json.loads(line)['url'] for line in lines], [
+            'http://example.com/10', 'http://example.com/11',
+        ])
+        response = self.client.get('/export/', {'gzip': '1'})
+        data = gzip.decompress(b''.join(response.streaming_content))
+        self.assertEqual(len(json.loads(data.decode('utf-8'))), 12)
+        self.assertEqual(self.client.get('/export/', {'format': 'xml'}).status_code, 400)
+
+    def test_command(self):
+        fd,path = tempfile.mkstemp(suffix='.json.gz')
+        os.close(fd)
+        try:
+            call_command('linkpile_export', output=path)
+            with gzip.open(path, 'rt') as f:
+                self.assertEqual(len(json.load(f)), 12)
+        finally:
+            os.remove(path)
@@ -0,0 +1,78 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+test_extract
+------------
+
+Tests for the streaming `linkpile` head extractor.
+"""
+
+import unittest
+
+from linkpile import extract
+
+
+def chunked(data, size=7):
+    for n in range(0, len(data), size):
+        yield data[n:n+size]
+
+
+class TestExtractHead(unittest.TestCase):
+
+    def test_fields(self):
+        html = (
+            b'<html><head><title>\n  A  page </title>'
+            b'<meta name="Description" content="About it">'
+            b'<meta property="og:title" content="OG title">'
+            b'<meta property="og:description" content="OG about"></head>'
+            b'<body><title>not this</title></body></html>'
+        )
+        data = extract.extract_head(chunked(html), 'text/html')
+        self.assertEqual(data['title'], 'A page')
+        self.assertEqual(data['description'], 'About it')
+        self.assertEqual(data['og_title'], 'OG title')
+        self.assertEqual(data['og_description'], 'OG about')
+
+    def test_stops_at_head(self):
+        consumed = []
+        def chunks():
+            yield b'<html><head><title>x</title></head>'
+            consumed.append(True)
+            yield b'<body>' + b'a' * 10000
+        data = extract.extract_head(chunks(), 'text/html')
+        self.assertEqual(data['title'], 'x')
+        self.assertEqual(consumed, [])
+
+    def test_byte_cap(self):
+        html = b'<html><head><script>' + b'x' * 5000
+        def chunks():
+            for chunk in chunked(html, 1000):
+                yield chunk
+            raise AssertionError('read past cap')
+        data = extract.extract_head(chunks(), 'text/html', max_bytes=2000)
+        self.assertEqual(data['bytes_read'], 2000)
+        self.assertNotIn('title', data)
+
+    def test_binary_not_read(self):
+        def chunks():
+            raise AssertionError('body was read')
+            yield b''
+        data = extract.extract_head(chunks(), 'application/pdf')
+        self.assertEqual(data, {'bytes_read': 0})
+
+    def test_header_encoding(self):
+        html = '<title>café</title>'.encode('latin-1')
+        data = extract.extract_head([html], 'text/html; charset=ISO-8859-1')
+        self.assertEqual(data['title'], 'café')
+
+    def test_meta_charset(self):
+        html = '<meta charset="windows-1251"><title>Привет</title></head>'.encode('cp1251')
+        data = extract.extract_head(chunked(html, 3), 'text/html')
+        self.assertEqual(data['encoding'], 'cp1251')
+        self.assertEqual(data['title'], 'Привет')
+        html = (
+            b'<meta http-equiv="Content-Type" content="text/html; charset=utf-8">'
+            + '<title>日本</title>'.encode('utf-8')
+        )
+        self.assertEqual(extract.extract_head(chunked(html, 5))['title'], '日本')
@@ -0,0 +1,114 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+test_feeds
+------------
+
+Tests for `linkpile` feeds.
+"""
+
+import json
+
+from django.contrib.auth.models import User
+from django.core.cache import cache
+from django.test import TestCase
+
+from tagging.models import Tag
+
+from linkpile.models import Link
+
+
+class TestFeeds(TestCase):
+
+    def setUp(self):
+        cache.clear()
+        self.user = User.objects.create(username='feeder')
+        self.public = self.make('Public python link', public=True, tags='python web')
+        self.make('Public rust link', public=True, tags='rust')
+        self.private = self.make('Private python link', tags='python')
+
+    def make(self, title, **kwargs):
+        link = Link(user=self.user, url='http://example.com/%s' % title.replace(' ', '-'),
+                    title=title, **kwargs)
+        link.save()
+        return link
+
+    def test_rss(self):
+        response = self.client.get('/feed/')
+        self.assertEqual(response.status_code, 200)
+        self.assertIn(b'Public python link', response.content)
+        self.assertIn(b'Public rust link', response.content)
+        self.assertNotIn(b'Private', response.content)
+        self.assertIn(b'<category>python</category>', response.content)
+        self.assertTrue(response['ETag'])
+        self.assertTrue(response['Last-Modified'])
+
+    def test_cached(self):
+        first = self.client.get('/feed/')
+        with self.assertNumQueries(0):
+            second = self.client.get('/feed/')
+        self.assertEqual(first.content, second.content)
+        self.assertEqual(first['ETag'], second['ETag'])
+
+    def test_conditional_get(self):
+        response = self.client.get('/feed/')
+        with self.assertNumQueries(0):
+            self.assertEqual(self.client.get(
+                '/feed/', HTTP_IF_NONE_MATCH=response['ETag']
+            ).status_code, 304)
+            self.assertEqual(self.client.get(
+                '/feed/', HTTP_IF_MODIFIED_SINCE=response['Last-Modified']
+            ).status_code, 304)
+
+    def test_invalidation(self):
+        etag = self.client.get('/feed/')['ETag']
+        self.make('Another private link')
+        self.assertEqual(self.client.get('/feed/')['ETag'], etag)
+        self.make('Another public link', public=True)
+        response = self.client.get('/feed/')
+        self.assertNotEqual(response['ETag'], etag)
+        self.assertIn(b'Another public link', response.content)
+        # made private
+        link = Link.objects.get(id=self.public.id)
+        link.public = False
+        link.save()
+        response = self.client.get('/feed/')
+        self.assertNotIn(b'Public python link', response.content)
+        # retagged outside of save()
+        etag = response['ETag']
+        Tag.objects.update_tags(Link.objects.get(title='Public rust link'), 'rust systems')
+        self.assertNotEqual(self.client.get('/feed/')['ETag'], etag)
+
+    def test_atom(self):
+        response = self.client.get('/feed/atom/')
+        self.assertTrue(response['Content-Type'].startswith('application/atom+xml'))
+        self.assertIn(b'Public python link', response.content)
+        self.assertNotEqual(response['ETag'], self.client.get('/feed/')['ETag'])
+
+    def test_json(self):
+        response = self.client.get('/feed/json/')
+        self.assertTrue(response['Content-Type'].startswith('application/feed+json'))
+        feed = json.loads(response.content.decode('utf-8'))
+        self.assertEqual(feed['version'], 'https://jsonfeed.org/version/1')
+        titles = [item['title'] for item in feed['items']]
+        self.assertEqual(sorted(titles), ['Public python link', 'Public rust link'])
+        item = feed['items'][0]
+        self.assertTrue(item['url'].startswith('http://'))
+        self.assertIn('date_published', item)
+
+    def test_tag_feed(self):
+        feed = json.loads(self.client.get('/feed/tag/python/json/').content.decode('utf-8'))
+        self.assertEqual([item['title'] for item in feed['items']], ['Public python link'])
+        response = self.client.get('/feed/tag/python+web/')
+        self.assertIn(b'Public python link', response.content)
+        self.assertNotIn(b'rust', response.content)
+
+    def test_search_feed(self):
+        response = self.client.get('/feed/search/json/?keywords=pyth')
+        feed = json.loads(response.content.decode('utf-8'))
+        self.assertEqual([item['title'] for item in feed['items']], ['Public python link'])
+        other = self.client.get('/feed/search/json/?keywords=rust')
+        self.assertNotEqual(response['ETag'], other['ETag'])
+        self.assertIn('Public rust link', other.content.decode('utf-8'))
+        self.assertEqual(self.client.get('/feed/search/').status_code, 200)
@@ -0,0 +1,127 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+test_importer
+------------
+
+Tests for the `linkpile` bulk importer.
+"""
+
+import io
+import json
+
+from django.contrib.auth.models import User
+from django.contrib.contenttypes.models import ContentType
+from django.test import TestCase
+
+from tagging.models import Tag, TaggedItem
+
+from linkpile import importer
+from linkpile.models import Link
+
+
+def record(n, **kwargs):
+    data = {
+        'user': 'importer',
+        'family': False,
+        'friends': False,
+        'public': True,
+        'shared': True,
+        'title': 'Link %s' % n,
+        'description': '',
+        'url': 'http://example.com/%s' % n,
+        'date': '2017-06-%02dT12:00:00+00:00' % (n % 28 + 1),
+        'tags': 'python django',
+    }
+    data.update(kwargs)
+    return data
+
+
+class TestIterRecords(TestCase):
+
+    def test_json_array(self):
+        records = [record(n, description='x' * 100) for n in range(50)]
+        fp = io.StringIO(json.dumps(records, indent=2))
+        self.assertEqual(list(importer.iter_records(fp, read_size=37)), records)
+
+    def test_ndjson(self):
+        records = [record(n) for n in range(20)]
+        fp = io.StringIO('\n'.join(json.dumps(r) for r in records) + '\n')
+        self.assertEqual(list(importer.iter_records(fp, read_size=64)), records)
+
+    def test_empty(self):
+        self.assertEqual(list(importer.iter_records(io.StringIO('[]'))), [])
+        self.assertEqual(list(importer.iter_records(io.StringIO(''))), [])
+
+
+class TestImporter(TestCase):
+
+    def setUp(self):
+        self.user = User.objects.create(username='importer')
+
+    def test_import(self):
+        records = [record(n) for n in range(25)]
+        records.append(record(99, tags='', title='', date='2017-06-01 12:00'))
+        fp = io.StringIO(json.dumps(records))
+        ContentType.objects.clear_cache()
+        with self.assertNumQueries(56):
+            # content type and user once; per batch of 10: savepoint pair,
+            # insert, id lookup, tag lookup, tagged items insert, the
+            # search index update (savepoint pair, delete, insert) and the
+            # tag stats update (savepoint pair, lookup and insert or update
+            # for counts and pairs); plus the tag insert and re-lookup, and
+            # a savepoint pair around each tag stats insert, in the first
+            # batch
+            counts = importer.import_links(fp, batch_size=10)
+        self.assertEqual(counts, {'imported': 26, 'duplicates': 0, 'near_duplicates': 0})
+        self.assertEqual(Link.objects.count(), 26)
+        self.assertEqual(Tag.objects.count(), 2)
+        self.assertEqual(TaggedItem.objects.count(), 50)
+        link = Link.objects.get(url='http://example.com/3')
+        self.assertEqual(link.tags, 'python django')
+        self.assertEqual(link.user, self.user)
+        self.assertEqual(
+            sorted(t.name for t in Tag.objects.get_for_object(link)), ['django', 'python']
+        )
+        self.assertEqual(
+            Link.objects.get(url='http://example.com/99').scrape_status, 'pending'
+        )
+
+    def test_skip_duplicates(self):
+        Link(user=self.user, url='https://www.example.com/1/', title='old').save()
+        records = [record(1), record(2), record(2)]
+        counts = importer.import_links(
+            io.StringIO(json.dumps(records)), skip_duplicates=True
+        )
+        self.assertEqual(counts, {'imported': 1, 'duplicates': 2, 'near_duplicates': 0})
+        self.assertEqual(Link.objects.count(), 2)
+
+    def test_recover_ids(self):
+        old = Link(user=self.user, url='http://example.com/1', date=Link.from_dict(record(1)).date)
+        old.save()
+        links = [Link.from_dict(r) for r in [record(1), record(2), record(1)]]
+        for link in links:
+            link.fill_computed_fields()
+        Link.objects.bulk_create(links)
+        # another writer's row is newer than ours
+        Link(user=self.user, url='http://example.com/other', date=links[0].date).save()
+        importer.Importer().recover_ids(links)
+        self.assertEqual(
+            [Link.objects.get(id=link.pk).url for link in links],
+            ['http://example.com/1', 'http://example.com/2', 'http://example.com/1']
+        )
+        self.assertNotIn(old.pk, [link.pk for link in links])
+        self.assertEqual(len(set(link.pk for link in links)), 3)
+
+    def test_unknown_user(self):
+        fp = io.StringIO(json.dumps([record(1, user='nobody')]))
+        with self.assertRaises(User.DoesNotExist):
+            importer.import_links(fp)
+
+    def test_round_trip(self):
+        Link(user=self.user, url='http://example.com/a', title='A', tags='x').save()
+        data = [link.to_dict() for link in Link.objects.all()]
+        Link.objects.all().delete()
+        importer.import_links(io.StringIO(json.dumps(data)))
+        self.assertEqual([link.to_dict() for link in Link.objects.all()], data)
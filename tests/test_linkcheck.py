@@ -0,0 +1,146 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+test_linkcheck
+------------
+
+Tests for the `linkpile` link rot checker.
+"""
+
+from datetime import timedelta
+from io import StringIO
+import threading
+import time
+
+from django.contrib.auth.models import User
+from django.core.management import call_command
+from django.test import TestCase, override_settings
+from django.utils import timezone
+
+from linkpile import linkcheck
+from linkpile.models import Link, LinkCheck
+
+from tests.httpserver import LocalHTTPServer
+
+
+def no_head(handler):
+    if handler.command == 'HEAD':
+        return (405, {}, '')
+    return (200, {}, 'GET only')
+
+
+@override_settings(
+    LINKPILE_SCRAPE_RETRIES=0, LINKPILE_CHECK_TIMEOUT=2,
+    LINKPILE_CHECK_HOST_DELAY=0, LINKPILE_CHECK_DEAD_AFTER=1,
+)
+class TestLinkCheck(TestCase):
+
+    def setUp(self):
+        self.server = LocalHTTPServer({
+            '/ok': (200, {}, 'ok'),
+            '/moved': (301, {'Location': '/ok'}, ''),
+            '/no-head': no_head,
+            '/gone': (404, {}, 'gone'),
+            '/private': (403, {}, 'forbidden'),
+        }).start()
+        self.user = User.objects.create(username='checker', is_staff=True)
+
+    def tearDown(self):
+        self.server.stop()
+
+    def make(self, path, **kwargs):
+        link = Link(user=self.user, url=self.server.url(path), title=path, public=True, **kwargs)
+        link.save()
+        return link
+
+    def test_check_url(self):
+        session = linkcheck.scraper.make_session(retries=0)
+        result = linkcheck.check_url(self.server.url('/moved'), session)
+        self.assertEqual(result['status'], 200)
+        self.assertEqual(result['final_url'], self.server.url('/ok'))
+        self.assertEqual(linkcheck.check_url(self.server.url('/no-head'), session)['status'], 200)
+        methods = [method for method,path,_ in self.server.requests if path == '/no-head']
+        self.assertEqual(methods, ['HEAD', 'GET'])
+        result = linkcheck.check_url('http://127.0.0.1:1/', session)
+        self.assertIsNone(result['status'])
+        self.assertTrue(result['error'])
+        self.assertEqual(linkcheck.check_url('ftp://example.com/', session)['error'], 'unsupported URL')
+
+    def test_check_links(self):
+        ok = self.make('/ok')
+        gone = self.make('/gone')
+        private = self.make('/private')
+        self.make('/no-head')
+        self.assertEqual(linkcheck.check_links(), (4, 1))
+        self.assertTrue(LinkCheck.objects.get(link=gone).dead)
+        self.assertFalse(LinkCheck.objects.get(link=ok).dead)
+        self.assertFalse(LinkCheck.objects.get(link=private).dead)
+        # nothing is due until the interval has passed
+        self.assertEqual(linkcheck.check_links(), (0, 0))
+        LinkCheck.objects.filter(link=ok).update(checked=timezone.now() - timedelta(days=30))
+        self.assertEqual(linkcheck.check_links(), (1, 0))
+        self.assertEqual(linkcheck.check_links(force=True, batch_size=2), (4, 1))
+
+    @override_settings(LINKPILE_CHECK_DEAD_AFTER=2)
+    def test_dead_after_repeated_failures(self):
+        gone = self.make('/gone')
+        linkcheck.check_links()
+        self.assertFalse(LinkCheck.objects.get(link=gone).dead)
+        linkcheck.check_links(force=True)
+        check = LinkCheck.objects.get(link=gone)
+        self.assertEqual((check.failures, check.dead), (2, True))
+
+    @override_settings(LINKPILE_CHECK_DEAD_AFTER=2)
+    def test_inconclusive_keeps_streak(self):
+        link = self.make('/gone')
+        answers = {
+            404: {'status': 404, 'final_url': link.url, 'error': ''},
+            429: {'status': 429, 'final_url': link.url, 'error': ''},
+        }
+        states = []
+        for status in [404, 429, 404, 429]:
+            linkcheck.record({link.id: answers[status]})
+            check = LinkCheck.objects.get(link=link)
+            states.append((check.status, check.failures, check.dead))
+        self.assertEqual(states, [(404, 1, False), (429, 1, False), (404, 2, True), (429, 2, True)])
+
+    def test_resume(self):
+        for n in range(5):
+            self.make('/ok')
+        self.assertEqual(linkcheck.check_links(limit=3, batch_size=2), (3, 0))
+        self.assertEqual(linkcheck.check_links(), (2, 0))
+
+    def test_per_host_limit(self):
+        state = {'active': 0, 'peak': 0}
+        lock = threading.Lock()
+
+        def slow(handler):
+            with lock:
+                state['active'] += 1
+                state['peak'] = max(state['peak'], state['active'])
+            time.sleep(0.05)
+            with lock:
+                state['active'] -= 1
+            return (200, {}, '')
+
+        self.server.routes['/slow'] = slow
+        jobs = [(n, self.server.url('/slow')) for n in range(6)]
+        results = dict(linkcheck.check_many(jobs, workers=6, per_host=2, delay=0))
+        self.assertEqual(len(results), 6)
+        self.assertEqual(state['peak'], 2)
+
+    def test_interleave(self):
+        jobs = [(1, 'http://a/1'), (2, 'http://a/2'), (3, 'http://b/1'), (4, 'http://a/3')]
+        self.assertEqual([key for key,_ in linkcheck.interleave(jobs)], [1, 3, 2, 4])
+
+    def test_command_and_index_filter(self):
+        self.make('/ok')
+        self.make('/gone')
+        out = StringIO()
+        call_command('linkpile_check', stdout=out)
+        self.assertIn('2 links checked, 1 dead', out.getvalue())
+        response = self.client.get('/?dead=1')
+        self.assertEqual([l.title for l in response.context['links']], ['/gone'])
+        response = self.client.get('/?dead=0')
+        self.assertEqual([l.title for l in response.context['links']], ['/ok'])
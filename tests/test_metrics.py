@@ -0,0 +1,95 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+test_metrics
+------------
+
+Tests for `linkpile` per-request metrics.
+"""
+
+from django.contrib.auth.models import User
+from django.core.cache import cache
+from django.core.urlresolvers import reverse
+from django.test import TestCase, override_settings
+
+from linkpile import metrics
+from linkpile.models import Link
+
+
+class TestAggregator(TestCase):
+
+    def test_quantiles_and_window(self):
+        aggregator = metrics.Aggregator(window=10)
+        for n in range(1, 21):
+            aggregator.observe('v', {'request': float(n)})
+        series = aggregator.series('request', 'v')
+        self.assertEqual(series.count, 20)
+        self.assertEqual(series.sum, 210)
+        self.assertEqual(series.quantile(0.5), 16.0)  # of the last 10
+        self.assertEqual(series.quantile(0.99), 20.0)
+
+    def test_prometheus(self):
+        aggregator = metrics.Aggregator()
+        aggregator.observe('linkpile-index', {'request': 0.5, 'queries': 3})
+        text = aggregator.prometheus()
+        self.assertIn('# TYPE linkpile_request_seconds summary', text)
+        self.assertIn('linkpile_request_seconds{view="linkpile-index",quantile="0.9"} 0.5', text)
+        self.assertIn('linkpile_queries_count{view="linkpile-index"} 1', text)
+        self.assertIn('linkpile_queries_sum{view="linkpile-index"} 3', text)
+        self.assertNotIn('linkpile_scrape_seconds', text)
+
+    def test_timer_outside_request(self):
+        self.assertIs(metrics.timer('scrape'), metrics.NULL_TIMER)
+
+
+@override_settings(LINKPILE_METRICS=True)
+class TestMiddleware(TestCase):
+
+    def setUp(self):
+        cache.clear()
+        metrics.aggregator.reset()
+        self.user = User.objects.create(username='watcher', is_staff=True)
+        for n in range(3):
+            Link(user=self.user, url='http://example.com/%s' % n, title='t', public=True).save()
+
+    def test_records_view(self):
+        response = self.client.get(reverse('linkpile-index'))
+        timing = response['Server-Timing']
+        for metric in ['request', 'sql', 'render', 'link_tag', 'paginate']:
+            self.assertIn('%s;dur=' % metric, timing)
+        self.assertIn('queries"', timing)
+        queries = metrics.aggregator.series('queries', 'linkpile-index')
+        self.assertEqual(queries.count, 1)
+        self.assertGreater(queries.sum, 0)
+        self.assertEqual(metrics.aggregator.series('request', 'linkpile-index').count, 1)
+
+    @override_settings(LINKPILE_METRICS_SERVER_TIMING=False)
+    def test_no_header(self):
+        response = self.client.get(reverse('linkpile-index'))
+        self.assertNotIn('Server-Timing', response)
+
+    def test_endpoint(self):
+        self.client.get(reverse('linkpile-index'))
+        # staff only by default, even from localhost
+        response = self.client.get(reverse('linkpile-metrics'), REMOTE_ADDR='127.0.0.1')
+        self.assertEqual(response.status_code, 404)
+        with self.settings(LINKPILE_METRICS_IPS=['10.1.2.3']):
+            response = self.client.get(reverse('linkpile-metrics'), REMOTE_ADDR='10.1.2.3')
+        self.assertEqual(response.status_code, 200)
+        self.assertIn('linkpile_request_seconds_count{view="linkpile-index"} 1', response.content.decode())
+        response = self.client.get(reverse('linkpile-metrics'), REMOTE_ADDR='10.1.2.3')
+        self.assertEqual(response.status_code, 404)
+        self.client.force_login(self.user)
+        response = self.client.get(reverse('linkpile-metrics'), REMOTE_ADDR='10.1.2.3')
+        self.assertEqual(response.status_code, 200)
+
+
+class TestDisabled(TestCase):
+
+    def test_disabled(self):
+        metrics.aggregator.reset()
+        response = self.client.get(reverse('linkpile-index'))
+        self.assertNotIn('Server-Timing', response)
+        self.assertIsNone(metrics.aggregator.series('request', 'linkpile-index'))
+        self.assertEqual(self.client.get(reverse('linkpile-metrics')).status_code, 404)
@@ -0,0 +1,96 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+test_pagination
+------------
+
+Tests for `linkpile` page-number and cursor pagination.
+"""
+
+from datetime import datetime, timedelta
+
+from django.contrib.auth.models import User
+from django.core.cache import cache
+from django.db import connection
+from django.test import RequestFactory, TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.utils.timezone import utc
+
+from linkpile import pagination
+from linkpile.models import Link
+
+START = datetime(2017, 1, 1, tzinfo=utc)
+
+
+@override_settings(LINKPILE_PAGE_SIZE=4)
+class TestPagination(TestCase):
+
+    def setUp(self):
+        cache.clear()
+        self.factory = RequestFactory()
+        user = User.objects.create(username='pager')
+        for n in range(10):
+            # links 2n and 2n+1 share a date
+            Link(
+                user=user, url='http://example.com/%s' % n, title='Link %s' % n,
+                date=START + timedelta(days=n // 2), public=True,
+                tags='even' if n % 2 == 0 else 'odd',
+            ).save()
+        self.expected = list(Link.objects.order_by('-date', '-id'))
+
+    def page(self, queryset, **params):
+        return pagination.paginate(queryset, self.factory.get('/', params))
+
+    def test_cursor_walk(self):
+        with self.settings(LINKPILE_PAGINATION='cursor'):
+            seen = []
+            page = self.page(Link.objects.all())
+            self.assertFalse(page.has_previous())
+            pages = [page]
+            while page.has_next():
+                seen.extend(page)
+                page = self.page(Link.objects.all(), cursor=page.next_cursor)
+                pages.append(page)
+            seen.extend(page)
+            self.assertEqual(seen, self.expected)
+            self.assertEqual([len(p) for p in pages], [4, 4, 2])
+            # and back again
+            back = self.page(Link.objects.all(), cursor=pages[-1].previous_cursor)
+            self.assertEqual(list(back), list(pages[1]))
+            back = self.page(Link.objects.all(), cursor=back.previous_cursor)
+            self.assertEqual(list(back), list(pages[0]))
+            self.assertFalse(back.has_previous())
+
+    def test_cursor_queries(self):
+        page = self.page(Link.objects.all(), cursor='garbage')
+        self.assertEqual(list(page), self.expected[:4])
+        with CaptureQueriesContext(connection) as queries:
+            list(self.page(Link.objects.all(), cursor=page.next_cursor))
+        self.assertEqual(len(queries), 1)
+        self.assertNotIn('COUNT', queries[0]['sql'])
+
+    def test_cached_count(self):
+        self.assertEqual(self.page(Link.objects.all(), page=2).paginator.num_pages, 3)
+        with CaptureQueriesContext(connection) as queries:
+            page = self.page(Link.objects.all(), page=3)
+            self.assertEqual(len(page), 2)
+        self.assertEqual(len(queries), 1)
+        self.assertNotIn('COUNT', queries[0]['sql'])
+
+    def test_querystring(self):
+        page = self.page(Link.objects.all(), keywords='a b', page='2')
+        self.assertEqual(page.querystring, 'keywords=a+b&')
+
+    def test_views(self):
+        response = self.client.get('/', {'keywords': 'link'})
+        self.assertContains(response, '?keywords=link&amp;page=2')
+        response = self.client.get('/odd/')
+        self.assertEqual(len(response.context['links']), 4)
+        self.assertContains(response, 'Page 1 of 2.')
+        with self.settings(LINKPILE_PAGINATION='cursor'):
+            response = self.client.get('/odd/')
+            cursor = response.context['links'].next_cursor
+            self.assertContains(response, '?cursor=%s' % cursor)
+            response = self.client.get('/odd/', {'cursor': cursor})
+            self.assertEqual([l.title for l in response.context['links']], ['Link 1'])
@@ -0,0 +1,91 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+test_randomlinks
+------------
+
+Tests for `linkpile` random link selection.
+"""
+
+from array import array
+
+from django.contrib.auth.models import AnonymousUser, User
+from django.core.cache import cache
+from django.test import TestCase, override_settings
+
+from linkpile import randomlinks
+from linkpile.models import Link
+
+
+class TestRandomLinks(TestCase):
+
+    def setUp(self):
+        cache.clear()
+        self.staff = User.objects.create(username='staff', is_staff=True)
+        self.member = User.objects.create(username='member')
+        self.links = {}
+        for name,kwargs in [
+                ('public', {'public': True}),
+                ('friends', {'friends': True}),
+                ('private', {})]:
+            link = Link(user=self.staff, url='http://example.com/%s' % name, title=name, **kwargs)
+            link.save()
+            self.links[name] = link
+
+    def picks(self, user, n=60):
+        return set(Link.get_random(user).title for i in range(n))
+
+    def test_visibility(self):
+        self.assertEqual(self.picks(AnonymousUser()), {'public'})
+        self.assertEqual(self.picks(None), {'public'})
+        self.assertEqual(self.picks(self.member), {'public', 'friends'})
+        self.assertEqual(self.picks(self.staff), {'public', 'friends', 'private'})
+
+    def test_one_query(self):
+        Link.get_random(None)
+        with self.assertNumQueries(1):
+            Link.get_random(None)
+
+    def test_signals_invalidate(self):
+        self.picks(None, 1)
+        link = self.links['private']
+        link.public = True
+        link.save()
+        self.links['public'].delete()
+        self.assertEqual(self.picks(None, 20), {'private'})
+        with self.assertNumQueries(1):
+            Link.get_random(None)
+
+    def test_stale_and_hidden_ids(self):
+        version = randomlinks._version()
+        cache.set(randomlinks.COUNT_KEY % (version, 'public'), 2)
+        cache.set(
+            randomlinks.CHUNK_KEY % (version, 'public', 0),
+            array('l', [9999, self.links['private'].id])
+        )
+        self.assertEqual(Link.get_random(None), self.links['public'])
+
+    @override_settings(LINKPILE_RANDOM_CHUNK_SIZE=2)
+    def test_chunks(self):
+        for n in range(5):
+            Link(user=self.staff, url='http://example.com/%s' % n, title='more', public=True).save()
+        ids = randomlinks.build('public')
+        self.assertEqual(len(ids), 6)
+        version = randomlinks._version()
+        self.assertEqual(cache.get(randomlinks.COUNT_KEY % (version, 'public')), 6)
+        self.assertEqual(
+            list(cache.get(randomlinks.CHUNK_KEY % (version, 'public', 2))), list(ids[4:])
+        )
+        self.assertEqual(self.picks(None, 80), {'public', 'more'})
+        # an evicted chunk is rebuilt
+        cache.delete(randomlinks.CHUNK_KEY % (version, 'public', 1))
+        self.assertEqual(self.picks(None, 20) - {'public', 'more'}, set())
+
+    def test_view(self):
+        response = self.client.get('/random/')
+        self.assertEqual(response.status_code, 302)
+        self.assertEqual(response['Location'], self.links['public'].absolute_url() + '?random=1')
+        Link.objects.all().delete()
+        response = self.client.get('/random/')
+        self.assertEqual(response['Location'], '/')
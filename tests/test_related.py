@@ -0,0 +1,120 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+test_related
+------------
+
+Tests for `linkpile` related links.
+"""
+
+from io import StringIO
+from unittest import skipIf
+
+from django.contrib.auth.models import User
+from django.core.management import call_command
+from django.test import TestCase, override_settings
+
+from linkpile import related
+from linkpile.models import Link, RelatedLink, RelatedState
+
+LINKS = [
+    ('http://docs.example.com/django/orm', 'Django ORM query tips', 'Faster querysets in Django', 'python django'),
+    ('http://blog.example.org/django-views', 'Class based views in Django', 'Writing Django views', 'python django'),
+    ('http://blog.example.org/asyncio', 'Python asyncio tutorial', 'Event loops and coroutines in Python', 'python'),
+    ('http://food.example.net/bread', 'Sourdough bread recipe', 'Baking bread with a starter', 'cooking baking'),
+    ('http://food.example.net/pizza', 'Pizza dough recipe', 'Baking pizza at home', 'cooking baking'),
+    ('http://food.example.net/soup', 'Tomato soup recipe', 'A quick soup', 'cooking'),
+]
+
+
+class TestRelated(TestCase):
+
+    def setUp(self):
+        self.user = User.objects.create(username='staff', is_staff=True)
+        self.links = [
+            self.make(url, title, description, tags, public=True)
+            for url,title,description,tags in LINKS
+        ]
+
+    def make(self, url, title, description, tags, **kwargs):
+        link = Link(
+            user=self.user, url=url, title=title, description=description, tags=tags,
+            **kwargs
+        )
+        link.save()
+        return link
+
+    def lists(self):
+        lists = {}
+        for row in RelatedLink.objects.order_by('link_id', 'rank'):
+            lists.setdefault(row.link_id, []).append(row.other_id)
+        return lists
+
+    def test_python_engine(self):
+        self.assertEqual(related.rebuild('python'), 6)
+        orm,views,asyncio,bread,pizza,soup = self.links
+        lists = self.lists()
+        self.assertEqual(lists[orm.id][0], views.id)
+        self.assertEqual(lists[bread.id][0], pizza.id)
+        self.assertNotIn(bread.id, lists[orm.id])
+        self.assertEqual(RelatedState.objects.count(), 6)
+        self.assertEqual(related.stale_ids(), [])
+
+    @skipIf(related.sparse is None, 'needs numpy and scipy')
+    def test_numpy_engine_matches_python(self):
+        related.rebuild('python')
+        expected = self.lists()
+        scores = dict(RelatedLink.objects.values_list('id', 'score'))
+        related.rebuild('numpy')
+        self.assertEqual(self.lists(), expected)
+        self.assertEqual(
+            sorted(round(score, 6) for score in scores.values()),
+            sorted(round(score, 6) for score in RelatedLink.objects.values_list('score', flat=True)),
+        )
+
+    @override_settings(LINKPILE_RELATED_STORED=2)
+    def test_top_k(self):
+        related.rebuild('python')
+        self.assertTrue(all(len(others) <= 2 for others in self.lists().values()))
+
+    def test_related_query(self):
+        related.rebuild()
+        orm,views,asyncio,bread,pizza,soup = self.links
+        views.public = False
+        views.save()
+        with self.assertNumQueries(1):
+            self.assertEqual(orm.related(None)[0], asyncio)
+        self.assertEqual(orm.related(self.user)[0], views)
+        self.assertEqual(orm.related(self.user, limit=1), [views])
+
+    def test_update(self):
+        related.rebuild('python')
+        self.assertEqual(related.update('python'), 0)
+        orm,views,asyncio,bread,pizza,soup = self.links
+        scones = self.make(
+            'http://food.example.net/scones', 'Scones recipe', 'Baking scones', 'cooking baking'
+        )
+        self.assertEqual(related.stale_ids(), [scones.id])
+        # the new link, plus the cooking links it now belongs with
+        self.assertEqual(related.update('python'), 4)
+        lists = self.lists()
+        self.assertIn(scones.id, lists[bread.id])
+        self.assertIn(bread.id, lists[scones.id])
+        self.assertNotIn(scones.id, lists[orm.id])
+        self.assertEqual(related.update('python'), 0)
+        # a deleted link's holders are recomputed next time
+        pizza.delete()
+        self.assertEqual(sorted(related.stale_ids()), sorted([bread.id, soup.id, scones.id]))
+        related.update('python')
+        self.assertNotIn(pizza.id, sum(self.lists().values(), []))
+
+    def test_detail_page_and_command(self):
+        out = StringIO()
+        call_command('linkpile_related', rebuild=True, engine='python', stdout=out)
+        self.assertIn('6 links recomputed (python)', out.getvalue())
+        self.assertIn('0 links updated (python)', out.getvalue())
+        orm,views = self.links[:2]
+        response = self.client.get(orm.absolute_url())
+        self.assertContains(response, 'Related links')
+        self.assertContains(response, views.absolute_url())
@@ -0,0 +1,120 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+test_routers
+------------
+
+Tests for the `linkpile` read replica router, against two SQLite
+databases: "default" as the primary and "replica".
+"""
+
+from django.contrib.auth.models import User
+from django.core.cache import cache
+from django.core.urlresolvers import reverse
+from django.db import connections
+from django.test import TestCase, override_settings
+
+from linkpile import routers, search
+from linkpile.models import Link
+
+
+@override_settings(
+    DATABASE_ROUTERS=['linkpile.routers.ReplicaRouter'],
+    LINKPILE_DB_REPLICAS=['replica'],
+)
+class TestReplicaRouter(TestCase):
+    multi_db = True
+
+    def setUp(self):
+        cache.clear()
+        routers.pool.reset()
+        self.user = User.objects.create(username='reader', is_staff=True)
+        User.objects.using('replica').create(id=self.user.id, username='reader', is_staff=True)
+        self.primary = Link(user=self.user, url='http://primary.example.com/', title='on primary', public=True)
+        self.primary.save()
+        copy = Link(
+            id=self.primary.id, user_id=self.user.id, url='http://replica.example.com/',
+            title='on replica', public=True,
+        )
+        copy.fill_computed_fields()
+        Link.objects.using('replica').bulk_create([copy])
+
+    def text(self, url):
+        response = self.client.get(url)
+        self.assertEqual(response.status_code, 200)
+        if response.streaming:
+            return b''.join(response.streaming_content).decode('utf-8')
+        return response.content.decode('utf-8')
+
+    def test_reads_from_replica(self):
+        self.assertIn('on replica', self.text(reverse('linkpile-index')))
+        self.assertIn('on replica', self.text(self.primary.absolute_url()))
+        self.assertIn('on replica', self.text(reverse('linkpile-feed')))
+        # outside replica views everything is on the primary
+        self.assertEqual(Link.objects.get(id=self.primary.id).title, 'on primary')
+
+    @override_settings(LINKPILE_SEARCH_BACKEND='sqlite')
+    def test_search_reads_from_replica(self):
+        with connections['replica'].cursor() as cursor:
+            cursor.execute(
+                'INSERT INTO linkpile_link_fts (rowid, title, description, url, tags) '
+                'VALUES (%s, %s, %s, %s, %s)',
+                [self.primary.id, 'on replica', '', 'http://replica.example.com/', '']
+            )
+        response = self.client.get(reverse('linkpile-index'), {'keywords': 'replica'})
+        self.assertEqual([link.title for link in response.context['links']], ['on replica'])
+        self.assertEqual(search.search('replica'), [])
+
+    def test_streaming_export(self):
+        self.client.force_login(self.user)
+        self.assertIn('replica.example.com', self.text(reverse('linkpile-export')))
+
+    def test_no_replicas(self):
+        with self.settings(LINKPILE_DB_REPLICAS=[]):
+            self.assertIn('on primary', self.text(reverse('linkpile-index')))
+
+    def test_unhealthy_replica(self):
+        routers.pool.mark_down('replica')
+        self.assertIn('on primary', self.text(reverse('linkpile-index')))
+
+    def test_read_your_writes(self):
+        self.client.force_login(self.user)
+        response = self.client.post(reverse('linkpile-new'), {'url': 'http://new.example.com/'})
+        self.assertEqual(response.status_code, 302)
+        self.assertIn(routers.PIN_KEY, self.client.session)
+        self.assertTrue(Link.objects.filter(url='http://new.example.com/').exists())
+        self.assertFalse(Link.objects.using('replica').filter(url='http://new.example.com/').exists())
+        self.assertIn('on primary', self.text(reverse('linkpile-index')))
+        with self.settings(LINKPILE_DB_PIN_SECONDS=-1):
+            self.client.post(reverse('linkpile-new'), {'url': 'http://newer.example.com/'})
+        self.assertIn('on replica', self.text(reverse('linkpile-index')))
+
+    def test_router(self):
+        router = routers.ReplicaRouter()
+        with routers._reading('replica'):
+            self.assertEqual(router.db_for_read(Link), 'replica')
+            self.assertIsNone(router.db_for_read(User))
+            self.assertEqual(router.db_for_write(Link), 'default')
+            # reads after a write stay on the primary
+            self.assertEqual(router.db_for_read(Link), 'default')
+        self.assertIsNone(router.db_for_read(Link))
+
+
+class TestReplicaPool(TestCase):
+
+    def test_round_robin_skips_unhealthy(self):
+        class Pool(routers.ReplicaPool):
+            down = set(['b'])
+            def healthy(self, alias):
+                return alias not in self.down
+        pool = Pool()
+        self.assertEqual([pool.choose(['a', 'b', 'c']) for n in range(4)], ['a', 'c', 'c', 'a'])
+        Pool.down = set(['a', 'b', 'c'])
+        pool.reset()
+        self.assertIsNone(pool.choose(['a', 'b', 'c']))
+        Pool.down = set()
+        self.assertIsNone(pool.choose(['a', 'b', 'c']))  # still waiting to retry
+        with self.settings(LINKPILE_DB_REPLICA_RETRY=0):
+            pool.reset()
+            self.assertEqual(pool.choose(['a', 'b', 'c']), 'a')
@@ -0,0 +1,91 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+test_scrape
+------------
+
+Tests for the `linkpile` scrape queue.
+"""
+
+from django.contrib.auth.models import User
+from django.core.management import call_command
+from django.test import TestCase, override_settings
+
+from linkpile import scrape, scrapecache
+from linkpile.models import Link, SCRAPE_DONE, SCRAPE_FAILED, SCRAPE_PENDING
+
+from tests.httpserver import LocalHTTPServer
+
+
+@override_settings(LINKPILE_SCRAPE_RETRIES=0, LINKPILE_SCRAPE_TIMEOUT=2)
+class TestScrapeQueue(TestCase):
+
+    def setUp(self):
+        scrapecache.reset()
+        self.server = LocalHTTPServer({
+            '/hello': (200, {}, (
+                '<html><head><title> Hello </title>'
+                '<meta name="description" content="Says hello"></head></html>'
+            )),
+            '/file.pdf': (200, {'Content-Type': 'application/pdf'}, b'%PDF' * 1000),
+            '/moved': (302, {'Location': '/hello'}, ''),
+            '/gone': (404, {}, 'gone'),
+        }).start()
+        self.user = User.objects.create(username='scraper')
+
+    def tearDown(self):
+        self.server.stop()
+
+    def make_link(self, path, **kwargs):
+        link = Link(user=self.user, url=self.server.url(path), **kwargs)
+        link.save()
+        return link
+
+    def test_save_does_not_fetch(self):
+        link = self.make_link('/hello')
+        self.assertEqual(link.title, '')
+        self.assertEqual(link.scrape_status, SCRAPE_PENDING)
+        self.assertEqual(self.server.requests, [])
+
+    def test_save_with_title_is_not_queued(self):
+        link = self.make_link('/hello', title='Given')
+        self.assertEqual(link.scrape_status, '')
+
+    def test_fetch_title(self):
+        self.assertEqual(scrape.fetch_title(self.server.url('/moved')), 'Hello')
+        self.assertEqual(scrape.fetch_title(self.server.url('/gone')), scrape.SCRAPE_FAILED_TITLE)
+        self.assertEqual(scrape.fetch_title('ftp://example.com/'), scrape.SCRAPE_FAILED_TITLE)
+
+    def test_fetch_metadata_skips_binary(self):
+        data = scrape.fetch_metadata(self.server.url('/file.pdf'))
+        self.assertEqual((data['status'], data['bytes_read']), (200, 0))
+        self.assertNotIn('title', data)
+
+    def test_scrape_pending(self):
+        ok = self.make_link('/hello')
+        bad = self.make_link('/gone')
+        scraped,failed = Link.scrape_pending(workers=2)
+        self.assertEqual((scraped, failed), (1, 1))
+        ok.refresh_from_db()
+        bad.refresh_from_db()
+        self.assertEqual((ok.title, ok.scrape_status), ('Hello', SCRAPE_DONE))
+        self.assertEqual(ok.description, 'Says hello')
+        self.assertEqual(
+            (bad.title, bad.scrape_status), (scrape.SCRAPE_FAILED_TITLE, SCRAPE_FAILED)
+        )
+
+    def test_user_title_wins(self):
+        link = self.make_link('/hello')
+        Link.objects.filter(id=link.id).update(title='Typed', scrape_status='')
+        Link.scrape_pending()
+        link.refresh_from_db()
+        self.assertEqual(link.title, 'Typed')
+
+    def test_command_requeues_failed(self):
+        link = self.make_link('/gone')
+        Link.scrape_pending()
+        self.server.routes['/gone'] = (200, {}, '<title>Back</title>')
+        call_command('linkpile_scrape', failed=True, stdout=open('/dev/null', 'w'))
+        link.refresh_from_db()
+        self.assertEqual((link.title, link.scrape_status), ('Back', SCRAPE_DONE))
@@ -0,0 +1,100 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+test_scrapecache
+------------
+
+Tests for the `linkpile` scrape-result cache.
+"""
+
+from datetime import timedelta
+
+from django.contrib.auth.models import User
+from django.test import TestCase, override_settings
+
+from linkpile import scrapecache
+from linkpile.models import Link, ScrapeCache
+from linkpile.urlnorm import normalize_url
+
+from tests.httpserver import LocalHTTPServer
+
+
+def etag_page(handler):
+    if handler.headers.get('If-None-Match') == '"v1"':
+        return (304, {'ETag': '"v1"'}, '')
+    return (200, {'ETag': '"v1"'}, '<title>Tagged</title>')
+
+
+@override_settings(LINKPILE_SCRAPE_RETRIES=0, LINKPILE_SCRAPE_TIMEOUT=2)
+class TestScrapeCache(TestCase):
+
+    def setUp(self):
+        scrapecache.reset()
+        self.server = LocalHTTPServer({
+            '/page': (200, {}, '<title>Page</title>'),
+            '/page?b=2&a=1': (200, {}, '<title>Query</title>'),
+            '/old': (301, {'Location': '/page'}, ''),
+            '/etag': etag_page,
+        }).start()
+        self.user = User.objects.create(username='cache')
+
+    def tearDown(self):
+        self.server.stop()
+
+    def gets(self):
+        return [r for r in self.server.requests if r[0] == 'GET']
+
+    def test_normalize_url(self):
+        self.assertEqual(
+            normalize_url('HTTP://Example.COM:80?b=2&a=1#frag'),
+            'http://example.com/?a=1&b=2'
+        )
+        self.assertEqual(
+            normalize_url('https://example.com:8443/x'), 'https://example.com:8443/x'
+        )
+
+    def test_hit(self):
+        self.assertEqual(Link.scrape(self.server.url('/page?b=2&a=1')), 'Query')
+        self.assertEqual(Link.scrape(self.server.url('/page?a=1&b=2#x')), 'Query')
+        self.assertEqual(len(self.gets()), 1)
+        self.assertEqual(scrapecache.stats()['hits'], 1)
+        self.assertEqual(scrapecache.stats()['misses'], 1)
+
+    def test_hit_from_db(self):
+        Link.scrape(self.server.url('/page'))
+        scrapecache.reset()
+        Link.scrape(self.server.url('/page'))
+        self.assertEqual(len(self.gets()), 1)
+        self.assertEqual(scrapecache.stats()['hits'], 1)
+
+    def test_redirect_target_cached(self):
+        self.assertEqual(Link.scrape(self.server.url('/old')), 'Page')
+        self.assertEqual(Link.scrape(self.server.url('/page')), 'Page')
+        self.assertEqual(len(self.gets()), 2)  # /old and the redirect
+
+    def test_conditional_request(self):
+        url = self.server.url('/etag')
+        Link.scrape(url)
+        with self.settings(LINKPILE_SCRAPE_CACHE_FRESH=0):
+            self.assertEqual(Link.scrape(url), 'Tagged')
+        self.assertEqual(self.gets()[-1][2].get('If-None-Match'), '"v1"')
+        self.assertEqual(scrapecache.stats()['revalidated'], 1)
+
+    def test_ttl_eviction(self):
+        url = self.server.url('/page')
+        Link.scrape(url)
+        ScrapeCache.objects.update(fetched=ScrapeCache.objects.get().fetched - timedelta(days=60))
+        scrapecache.reset()
+        self.assertEqual(scrapecache.lookup_many([url]), {})
+        self.assertEqual(scrapecache.evict_stale(), 1)
+        self.assertFalse(ScrapeCache.objects.exists())
+
+    def test_queue_uses_cache(self):
+        Link.scrape(self.server.url('/page'))
+        link = Link(user=self.user, url=self.server.url('/page'))
+        link.save()
+        Link.scrape_pending()
+        link.refresh_from_db()
+        self.assertEqual(link.title, 'Page')
+        self.assertEqual(len(self.gets()), 1)
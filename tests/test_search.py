@@ -0,0 +1,126 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+test_search
+------------
+
+Tests for the `linkpile` keyword search backends.
+"""
+
+from django.contrib.auth.models import User
+from django.test import TestCase, override_settings
+
+from linkpile import search
+from linkpile.models import Link
+
+
+class SearchTests(object):
+
+    def setUp(self):
+        search._backends.clear()
+        self.user = User.objects.create(username='searcher', is_staff=True)
+        self.python = self.make('Python tips', 'http://example.com/py', 'misc')
+        self.django = self.make('Web framework', 'http://djangoproject.com/', 'python django')
+        self.other = self.make('Cooking', 'http://example.com/food', 'recipes',
+                               description='A python-free zone')
+
+    def make(self, title, url, tags, **kwargs):
+        link = Link(user=self.user, title=title, url=url, tags=tags, public=True, **kwargs)
+        link.save()
+        return link
+
+    def search(self, keywords):
+        return search.search(keywords)
+
+    def test_ranking_and_prefix(self):
+        ids = self.search('pyth')
+        self.assertEqual(set(ids), set([self.python.id, self.django.id, self.other.id]))
+        self.assertEqual(ids[-1], self.other.id)  # description only
+
+    def test_all_keywords_must_match(self):
+        self.assertEqual(self.search('python djang'), [self.django.id])
+        self.assertEqual(self.search('python nothing'), [])
+        self.assertEqual(self.search('  '), [])
+
+    def test_viewer(self):
+        hidden = self.make('Python secrets', 'http://example.com/secret', 'python')
+        hidden.public = False
+        hidden.save()
+        self.assertIn(hidden.id, self.search('python'))
+        ids = search.search('python', viewer=None)
+        self.assertNotIn(hidden.id, ids)
+        # hidden links do not take up places under the limit
+        self.assertEqual(search.search('python', limit=1, viewer=None), ids[:1])
+        self.assertEqual(len(search.search('pyth', limit=None, viewer=None)), 3)
+
+    def test_incremental_updates(self):
+        self.search('warm')
+        self.other.title = 'Quantum cooking'
+        self.other.save()
+        self.assertEqual(self.search('quantum'), [self.other.id])
+        self.other.delete()
+        self.assertEqual(self.search('quantum'), [])
+
+
+@override_settings(LINKPILE_SEARCH_BACKEND='sqlite')
+class TestSQLiteSearch(SearchTests, TestCase):
+    pass
+
+
+@override_settings(LINKPILE_SEARCH_BACKEND='python')
+class TestPythonSearch(SearchTests, TestCase):
+
+    def test_rebuild(self):
+        backend = search.get_backend('python')
+        self.assertEqual(backend.rebuild(), 3)
+        Link.objects.filter(id=self.python.id).update(title='Renamed')
+        backend.rebuild()
+        self.assertNotIn(self.python.id, self.search('tips'))
+
+
+@override_settings(LINKPILE_SEARCH_BACKEND='icontains')
+class TestIcontainsSearch(SearchTests, TestCase):
+
+    def test_ranking_and_prefix(self):
+        # no ranking; newest first
+        self.assertEqual(
+            self.search('pyth'), [self.other.id, self.django.id, self.python.id]
+        )
+
+
+@override_settings(LINKPILE_SEARCH_BACKEND='auto')
+class TestSearchView(TestCase):
+
+    def test_index_keywords(self):
+        search._backends.clear()
+        user = User.objects.create(username='viewer')
+        Link(user=user, title='Alpha beta', url='http://a.com/', public=True).save()
+        Link(user=user, title='Beta gamma', url='http://b.com/', public=True).save()
+        Link(user=user, title='Beta private', url='http://c.com/').save()
+        self.assertEqual(search.get_backend().name, 'sqlite')
+        response = self.client.get('/', {'keywords': 'beta'})
+        self.assertEqual(
+            [link.title for link in response.context['links']], ['Alpha beta', 'Beta gamma']
+        )
+        response = self.client.get('/', {'keywords': 'gam'})
+        self.assertEqual([link.title for link in response.context['links']], ['Beta gamma'])
+
+    @override_settings(LINKPILE_PAGE_SIZE=2, LINKPILE_PAGINATION='cursor')
+    def test_index_pages_in_rank_order(self):
+        search._backends.clear()
+        user = User.objects.create(username='viewer')
+        for n,title in enumerate(['Delta note', 'Delta delta delta', 'Delta', 'Delta gone']):
+            Link(user=user, title=title, url='http://d.com/%s' % n, public=n < 3).save()
+        expected = [
+            Link.objects.get(id=pk).title
+            for pk in search.search('delta', viewer=None)
+        ]
+        self.assertEqual(len(expected), 3)
+        response = self.client.get('/', {'keywords': 'delta', 'cursor': 'x'})
+        self.assertEqual([link.title for link in response.context['links']], expected[:2])
+        self.assertContains(response, '?keywords=delta&amp;page=2')
+        response = self.client.get('/', {'keywords': 'delta', 'page': '2'})
+        self.assertEqual([link.title for link in response.context['links']], expected[2:])
+        response = self.client.get('/', {'keywords': 'delta', 'dead': '0'})
+        self.assertEqual([link.title for link in response.context['links']], expected[:2])
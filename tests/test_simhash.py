@@ -0,0 +1,181 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+test_simhash
+------------
+
+Tests for `linkpile` near-duplicate detection by SimHash.
+"""
+
+import io
+import json
+from io import StringIO
+
+from django.contrib.auth.models import User
+from django.core.management import call_command
+from django.test import TestCase, override_settings
+
+from linkpile import duplicates, importer, scrapecache, simhash
+from linkpile.models import Link, SimHashBand
+
+from tests.httpserver import LocalHTTPServer
+
+TITLE = 'Why the city council voted to close the old library'
+DESCRIPTION = (
+    'After months of debate, the council decided on Tuesday that the branch '
+    'library on Main Street will close at the end of the year.'
+)
+
+
+class TestFingerprint(TestCase):
+
+    def test_near_and_far(self):
+        original = simhash.fingerprint(TITLE, DESCRIPTION, 'news.example.com')
+        amp = simhash.fingerprint(TITLE, DESCRIPTION, 'amp.news.example.com')
+        mirror = simhash.fingerprint(TITLE, DESCRIPTION, 'mirror.example.org')
+        other = simhash.fingerprint('Ten recipes for summer', 'Grill, salad and more.', 'news.example.com')
+        self.assertEqual(original, amp)
+        self.assertLessEqual(simhash.distance(original, mirror), simhash.DISTANCE)
+        self.assertGreater(simhash.distance(original, other), 10)
+        self.assertIsNone(simhash.fingerprint('Home', '', 'example.com'))
+        # short titles are kept apart by their site
+        self.assertNotEqual(
+            simhash.fingerprint('About us here', '', 'example.com'),
+            simhash.fingerprint('About us here', '', 'example.org'),
+        )
+        self.assertEqual(
+            simhash.fingerprint('About us here', '', 'example.com'),
+            simhash.fingerprint('About us here', '', 'www.example.com'),
+        )
+
+    def test_signed_and_bands(self):
+        value = simhash.to_signed(simhash.MASK)
+        self.assertEqual(value, -1)
+        self.assertEqual(simhash.bands(value), [(band, 0xffff) for band in range(4)])
+        self.assertEqual(simhash.distance(-1, 0), 64)
+        # three bits apart, each in a different band: one band still agrees
+        near = value ^ (1 | 1 << 20 | 1 << 40)
+        shared = set(simhash.bands(value)) & set(simhash.bands(near))
+        self.assertEqual(shared, {(3, 0xffff)})
+
+    def test_band_index_ties(self):
+        # a stored link (int key) and a batch link (None) equally close
+        index = duplicates.BandIndex()
+        index.add(5, 0)
+        index.add(None, 0xF)
+        index.add(7, 0x1)
+        self.assertEqual(index.find(0x3), [(1, 7), (2, 5), (2, None)])
+
+
+class TestNearDuplicates(TestCase):
+
+    def setUp(self):
+        self.user = User.objects.create(username='staff', is_staff=True)
+
+    def make(self, url, title=TITLE, description=DESCRIPTION, **kwargs):
+        link = Link(user=self.user, url=url, title=title, description=description, **kwargs)
+        link.save()
+        return link
+
+    def test_bands_follow_saves(self):
+        link = self.make('http://news.example.com/library')
+        self.assertEqual(
+            sorted(SimHashBand.objects.filter(link=link).values_list('band', 'value')),
+            simhash.bands(link.simhash)
+        )
+        link = Link.objects.get(id=link.id)
+        link.title = 'Ten recipes for summer'
+        link.save()
+        self.assertEqual(
+            sorted(SimHashBand.objects.filter(link=link).values_list('band', 'value')),
+            simhash.bands(link.simhash)
+        )
+        link.delete()
+        self.assertEqual(SimHashBand.objects.count(), 0)
+        pending = self.make('http://news.example.com/pending', title='')
+        self.assertIsNone(pending.simhash)
+        self.assertEqual(SimHashBand.objects.count(), 0)
+
+    def test_near_duplicates(self):
+        original = self.make('http://news.example.com/library', public=True)
+        mirror = self.make('http://mirror.example.org/2017/library')
+        self.make('http://news.example.com/recipes', title='Ten recipes for summer')
+        link = Link(url='http://syndicated.example.net/a/1', title=TITLE, description=DESCRIPTION)
+        link.fill_computed_fields()
+        with self.assertNumQueries(2):
+            found = duplicates.near_duplicates(link.simhash)
+        self.assertEqual(set(found), {original, mirror})
+        self.assertEqual(original.near_duplicates(self.user), [mirror])
+        self.assertEqual(mirror.near_duplicates(), [original])
+
+    def test_edit_page_lists_near_duplicates(self):
+        original = self.make('http://news.example.com/library')
+        self.client.force_login(self.user)
+        response = self.client.post('/new/', {'url': 'http://amp.example.net/library'})
+        link = Link.objects.get(url='http://amp.example.net/library')
+        self.assertRedirects(response, link.edit_url(), fetch_redirect_response=False)
+        response = self.client.get(link.edit_url())
+        self.assertNotContains(response, 'Possibly the same page as')
+        link.title = TITLE
+        link.description = DESCRIPTION
+        link.save()
+        response = self.client.get(link.edit_url())
+        self.assertContains(response, 'Possibly the same page as')
+        self.assertContains(response, original.edit_url())
+
+    @override_settings(LINKPILE_SCRAPE_RETRIES=0, LINKPILE_SCRAPE_TIMEOUT=2)
+    def test_scraped_links_get_fingerprints(self):
+        scrapecache.reset()
+        server = LocalHTTPServer({
+            '/library': (200, {}, (
+                '<html><head><title>%s</title>'
+                '<meta name="description" content="%s"></head></html>' % (TITLE, DESCRIPTION)
+            )),
+        }).start()
+        try:
+            original = self.make('http://news.example.com/library')
+            link = self.make(server.url('/library'), title='', description='')
+            Link.scrape_pending()
+        finally:
+            server.stop()
+        link.refresh_from_db()
+        self.assertIsNotNone(link.simhash)
+        self.assertEqual(link.near_duplicates(self.user), [original])
+
+    def test_import_skips_near_duplicates(self):
+        self.make('http://news.example.com/library')
+        records = [
+            {
+                'user': 'staff', 'family': False, 'friends': False, 'public': True,
+                'shared': True, 'title': title, 'description': DESCRIPTION, 'url': url,
+                'date': '2017-06-01T12:00:00+00:00', 'tags': '',
+            }
+            for url,title in [
+                ('http://mirror.example.org/library', TITLE),
+                ('http://example.com/budget', 'The council also passed next year\'s budget'),
+                ('http://other.example.org/budget', 'The council also passed next year\'s budget'),
+            ]
+        ]
+        counts = importer.import_links(
+            io.StringIO(json.dumps(records)), skip_near_duplicates=True
+        )
+        self.assertEqual(counts, {'imported': 1, 'duplicates': 0, 'near_duplicates': 2})
+        self.assertTrue(Link.objects.filter(url='http://example.com/budget').exists())
+        self.assertEqual(SimHashBand.objects.count(), 8)
+
+    def test_clusters_command(self):
+        first = self.make('http://news.example.com/library', tags='news')
+        self.make('http://mirror.example.org/library', tags='library')
+        self.make('http://amp.news.example.com/library')
+        self.make('http://news.example.com/recipes', title='Ten recipes for summer')
+        clusters = list(duplicates.near_clusters())
+        self.assertEqual([len(cluster) for cluster in clusters], [3])
+        self.assertEqual(clusters[0][0], first)
+        out = StringIO()
+        call_command('linkpile_duplicates', near=True, stdout=out)
+        self.assertIn('1 clusters, 2 duplicate links found', out.getvalue())
+        call_command('linkpile_duplicates', near=True, merge=True, stdout=StringIO())
+        self.assertEqual(Link.objects.count(), 2)
+        self.assertEqual(Link.objects.get(id=first.id).tags, 'library news')
+        self.assertEqual(list(duplicates.near_clusters()), [])
@@ -0,0 +1,215 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+test_snapshots
+------------
+
+Tests for `linkpile` local page snapshots.
+"""
+
+import gzip
+from io import StringIO
+import os
+import shutil
+import tempfile
+import threading
+
+import requests
+
+from django.contrib.auth.models import User
+from django.core.management import call_command
+from django.core.urlresolvers import reverse
+from django.db.models.signals import post_save
+from django.test import TestCase, override_settings
+
+from linkpile import snapshots
+from linkpile.models import Link, Snapshot
+
+from tests.httpserver import LocalHTTPServer
+
+PAGE = '<html><body>%s</body></html>' % ('hello ' * 1000)
+
+
+class Body(object):
+    """One-chunk body whose close() can be held back until an event.
+    """
+
+    def __init__(self, body, wait=None):
+        self.chunks = iter([body])
+        self.wait = wait
+
+    def __iter__(self):
+        return self.chunks
+
+    def close(self):
+        if self.wait:
+            self.wait.wait(5)
+
+
+class BrokenBody(object):
+    """Body whose connection drops after the first chunk.
+    """
+
+    def __iter__(self):
+        yield b'partial '
+        raise requests.exceptions.ChunkedEncodingError('connection broken')
+
+
+class DictFetcher(object):
+
+    def __init__(self, pages, waits=None):
+        self.pages = pages
+        self.waits = waits or {}
+
+    def fetch(self, url):
+        body = self.pages[url]
+        return {
+            'status': 200, 'final_url': url, 'content_type': 'text/plain',
+            'chunks': body if isinstance(body, BrokenBody) else Body(body, self.waits.get(url)),
+        }
+
+
+class TestSnapshots(TestCase):
+
+    def setUp(self):
+        self.root = tempfile.mkdtemp()
+        self.settings = override_settings(
+            LINKPILE_SNAPSHOTS=True, LINKPILE_SNAPSHOT_ROOT=self.root,
+            LINKPILE_SCRAPE_RETRIES=0, LINKPILE_SCRAPE_WORKERS=2,
+        )
+        self.settings.enable()
+        self.server = LocalHTTPServer({
+            '/a': (200, {}, PAGE),
+            '/b': (200, {}, PAGE),
+            '/c': (200, {'Content-Type': 'text/plain'}, 'something else'),
+            '/gone': (404, {}, 'gone'),
+        }).start()
+        self.user = User.objects.create(username='archivist', is_staff=True)
+
+    def tearDown(self):
+        self.server.stop()
+        self.settings.disable()
+        shutil.rmtree(self.root)
+
+    def make(self, path, **kwargs):
+        kwargs.setdefault('public', True)
+        link = Link(user=self.user, url=self.server.url(path), title=path, **kwargs)
+        link.save()
+        return link
+
+    def test_blob_store(self):
+        store = snapshots.BlobStore(self.root)
+        digest,size = store.put(iter([b'abc', b'def']))
+        self.assertEqual(size, 6)
+        self.assertEqual(store.put(iter([b'abcdef']))[0], digest)
+        self.assertTrue(store.path(digest).startswith(os.path.join(self.root, digest[:2], digest[2:4])))
+        self.assertEqual(store.open(digest).read(), b'abcdef')
+        self.assertEqual(store.usage()[0], 1)
+        store.delete(digest)
+        self.assertFalse(store.exists(digest))
+
+    def test_snapshot_links_dedups(self):
+        a,b,gone = self.make('/a'), self.make('/b'), self.make('/gone')
+        self.make('/c')
+        self.assertEqual(snapshots.snapshot_links(), (3, 1))
+        self.assertFalse(Snapshot.objects.filter(link=gone).exists())
+        sa,sb = Snapshot.objects.get(link=a), Snapshot.objects.get(link=b)
+        self.assertEqual(sa.sha256, sb.sha256)
+        self.assertEqual(sa.size, len(PAGE))
+        self.assertLess(sa.stored_size, sa.size)
+        report = snapshots.report()
+        self.assertEqual(report['snapshots'], 3)
+        self.assertEqual(report['blobs'], 2)
+        self.assertEqual(report['files'], 2)
+        self.assertEqual(report['size'], 2 * len(PAGE) + len('something else'))
+        # only links without a snapshot are fetched again
+        self.assertEqual(snapshots.snapshot_links(), (0, 1))
+
+    @override_settings(LINKPILE_SNAPSHOT_MAX_BYTES=100)
+    def test_truncated(self):
+        link = self.make('/a')
+        snapshots.snapshot_links()
+        snapshot = Snapshot.objects.get(link=link)
+        self.assertTrue(snapshot.truncated)
+        self.assertEqual(snapshot.size, 100)
+
+    def test_blob_deleted_with_last_snapshot(self):
+        a,b = self.make('/a'), self.make('/b')
+        snapshots.snapshot_links()
+        store = snapshots.get_store()
+        digest = Snapshot.objects.get(link=a).sha256
+        a.delete()
+        self.assertTrue(store.exists(digest))
+        b.delete()
+        self.assertFalse(store.exists(digest))
+
+    def test_replaced_blob_stored_again_in_the_same_run(self):
+        a,b = self.make('/a'), self.make('/b')
+        store = snapshots.get_store()
+        fields = snapshots.take(a.url, store, DictFetcher({a.url: b'old page'}))
+        Snapshot.objects.create(link=a, **fields)
+        old = fields['sha256']
+        # b stores a's old page, but its row is only written after a's
+        # snapshot has been replaced
+        a_saved = threading.Event()
+
+        def saved(sender, instance, **kwargs):
+            if instance.link_id == a.id:
+                a_saved.set()
+        post_save.connect(saved, sender=Snapshot, weak=False)
+        try:
+            fetcher = DictFetcher(
+                {a.url: b'new page', b.url: b'old page'}, waits={b.url: a_saved}
+            )
+            self.assertEqual(snapshots.snapshot_links(force=True, fetcher=fetcher), (2, 0))
+        finally:
+            post_save.disconnect(saved, sender=Snapshot)
+        self.assertEqual(Snapshot.objects.get(link=b).sha256, old)
+        self.assertTrue(store.exists(old))
+        # a blob nothing refers to any more is still dropped
+        fetcher = DictFetcher({a.url: b'new page', b.url: b'other page'})
+        snapshots.snapshot_links(force=True, fetcher=fetcher)
+        self.assertFalse(store.exists(old))
+
+    def test_body_failing_midway(self):
+        a,b,c = self.make('/a'), self.make('/b'), self.make('/c')
+        fetcher = DictFetcher({a.url: b'page a', b.url: BrokenBody(), c.url: b'page c'})
+        self.assertEqual(snapshots.snapshot_links(fetcher=fetcher), (2, 1))
+        self.assertFalse(Snapshot.objects.filter(link=b).exists())
+        self.assertEqual(os.listdir(os.path.join(self.root, 'tmp')), [])
+
+    def test_view(self):
+        link = self.make('/c')
+        snapshots.snapshot_links()
+        url = reverse('linkpile-snapshot', args=[link.id])
+        response = self.client.get(url)
+        self.assertEqual(response['Content-Type'], 'text/plain')
+        self.assertEqual(response['Content-Security-Policy'], 'sandbox')
+        self.assertNotIn('Content-Encoding', response)
+        self.assertEqual(b''.join(response.streaming_content), b'something else')
+        response = self.client.get(url, HTTP_ACCEPT_ENCODING='gzip, deflate')
+        self.assertEqual(response['Content-Encoding'], 'gzip')
+        self.assertEqual(gzip.decompress(b''.join(response.streaming_content)), b'something else')
+        detail = self.client.get(link.absolute_url())
+        self.assertContains(detail, url)
+
+    def test_view_visibility(self):
+        private = self.make('/c', public=False)
+        public = self.make('/a')
+        snapshots.snapshot_links()
+        url = reverse('linkpile-snapshot', args=[private.id])
+        self.assertEqual(self.client.get(url).status_code, 404)
+        url = reverse('linkpile-snapshot', args=[public.id])
+        self.assertEqual(self.client.get(url).status_code, 200)
+        with override_settings(LINKPILE_SNAPSHOTS=False):
+            self.assertEqual(self.client.get(url).status_code, 404)
+
+    def test_command(self):
+        self.make('/a')
+        out = StringIO()
+        call_command('linkpile_snapshot', stdout=out)
+        self.assertIn('1 links stored, 0 failed', out.getvalue())
+        out = StringIO()
+        call_command('linkpile_snapshot', '--report', stdout=out)
+        self.assertIn('1 snapshots in 1 blobs', out.getvalue())
@@ -0,0 +1,144 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+test_tagstats
+------------
+
+Tests for `linkpile` tag statistics.
+"""
+
+from collections import defaultdict
+import io
+import json
+
+from django.contrib.auth.models import User
+from django.core.cache import cache
+from django.core.management import call_command
+from django.db import transaction
+from django.test import TestCase
+
+from tagging.models import Tag
+
+from linkpile import importer, tagstats
+from linkpile.models import Link, TagPair, TagStat
+
+
+class TestTagStats(TestCase):
+
+    def setUp(self):
+        cache.clear()
+        self.staff = User.objects.create(username='staff', is_staff=True)
+        self.member = User.objects.create(username='member')
+        self.a = self.make('a', 'python django', public=True)
+        self.b = self.make('b', 'python web', friends=True)
+        self.c = self.make('c', 'python django web')
+
+    def make(self, name, tags, **kwargs):
+        link = Link(user=self.staff, url='http://example.com/%s' % name, title=name,
+                    tags=tags, **kwargs)
+        link.save()
+        return link
+
+    def stats(self):
+        """Current tables, to compare with a rebuild.
+        """
+        return (
+            sorted(TagStat.objects.values_list(
+                'name', 'public_count', 'member_count', 'staff_count')),
+            sorted(TagPair.objects.values_list(
+                'tag', 'other', 'public_count', 'member_count', 'staff_count')),
+        )
+
+    def assertConsistent(self):
+        incremental = self.stats()
+        tagstats.rebuild()
+        self.assertEqual(incremental, self.stats())
+
+    def test_counts(self):
+        self.assertEqual(tagstats.tag_counts(['python', 'web', 'nope']),
+                         {'python': 1, 'web': 0, 'nope': 0})
+        self.assertEqual(tagstats.tag_counts(['python'], self.member), {'python': 2})
+        self.assertEqual(tagstats.tag_counts(['python'], self.staff), {'python': 3})
+        self.assertConsistent()
+
+    def test_related(self):
+        self.assertEqual(tagstats.related_tags(['python'], self.staff),
+                         [('django', 2), ('web', 2)])
+        self.assertEqual(tagstats.related_tags(['python']), [('django', 1)])
+        self.assertEqual(tagstats.related_tags(['python', 'web'], self.staff), [('django', 1)])
+
+    def test_incremental(self):
+        self.a.tags = 'python flask'
+        self.a.save()
+        link = Link.objects.get(id=self.b.id)
+        link.public = True
+        link.save()
+        self.c.delete()
+        self.make('d', 'web', family=True)
+        Tag.objects.add_tag(Link.objects.get(id=self.b.id), 'rust')
+        self.assertEqual(tagstats.tag_counts(['django', 'flask', 'rust']),
+                         {'django': 0, 'flask': 1, 'rust': 1})
+        self.assertFalse(TagStat.objects.filter(name='django').exists())
+        self.assertConsistent()
+
+    def test_bulk_import(self):
+        records = [
+            dict(Link(user=self.staff, url='http://example.com/i%s' % n, title='i',
+                      tags='python imported', public=True, date=self.a.date).to_dict())
+            for n in range(5)
+        ]
+        importer.import_links(io.StringIO(json.dumps(records)))
+        self.assertEqual(tagstats.tag_counts(['python', 'imported']),
+                         {'python': 6, 'imported': 5})
+        self.assertConsistent()
+
+    def test_no_queries_when_unchanged(self):
+        link = Link.objects.get(id=self.a.id)
+        link.title = 'renamed'
+        with self.assertNumQueries(0):
+            tagstats.link_saved(Link, link)
+
+    def test_new_tag_inserted_concurrently(self):
+        # another save created "rust" after this one looked it up
+        rust = TagStat.objects.create(name='rust', public_count=1, member_count=1, staff_count=1)
+        new = [
+            (('rust',), (0, 1, 1), TagStat(name='rust', member_count=1, staff_count=1)),
+            (('go',), (0, 0, 1), TagStat(name='go', staff_count=1)),
+        ]
+        ids_by_delta = defaultdict(list)
+        with transaction.atomic():
+            tagstats._create(TagStat, ['name'], new, ids_by_delta)
+        self.assertEqual(dict(ids_by_delta), {(0, 1, 1): [rust.id]})
+        self.assertEqual(TagStat.objects.get(name='go').staff_count, 1)
+
+    def test_cloud(self):
+        cloud = tagstats.tag_cloud(self.staff)
+        self.assertEqual([(t.name, t.count) for t in cloud],
+                         [('django', 2), ('python', 3), ('web', 2)])
+        with self.assertNumQueries(0):
+            tagstats.tag_cloud(self.staff)
+        self.make('e', 'rust')
+        self.assertIn('rust', [t.name for t in tagstats.tag_cloud(self.staff)])
+        self.assertEqual([t.name for t in tagstats.tag_cloud(None)], ['django', 'python'])
+
+    def test_views(self):
+        response = self.client.get('/tagcloud/')
+        self.assertContains(response, 'python')
+        self.assertNotContains(response, '>web<')
+        data = json.loads(self.client.get('/related/python/').content.decode('utf-8'))
+        self.assertEqual(data, [{'name': 'django', 'count': 1}])
+        self.assertEqual(self.client.get('/related/python/?limit=x').status_code, 400)
+        response = self.client.get('/python/')
+        self.assertEqual(len(response.context['links']), 1)
+        self.assertEqual(response.context['related_tags'], [('django', 1)])
+        with self.assertNumQueries(1):
+            response = self.client.get('/web/')
+        self.assertEqual(len(response.context['links']), 0)
+
+    def test_rebuild_command(self):
+        TagStat.objects.all().delete()
+        out = io.StringIO()
+        call_command('linkpile_tagstats_rebuild', stdout=out)
+        self.assertIn('3 tags', out.getvalue())
+        self.assertEqual(tagstats.tag_counts(['python'], self.staff), {'python': 3})
@@ -0,0 +1,99 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+test_templatetags
+------------
+
+Tests for `linkpile` list rendering.
+"""
+
+from django.contrib.auth.models import User
+from django.core.cache import cache
+from django.db import connection
+from django.test import TestCase
+from django.test.utils import CaptureQueriesContext
+
+from linkpile.models import Link
+from linkpile import fragments
+
+
+class TestLinkRendering(TestCase):
+
+    def setUp(self):
+        cache.clear()
+        self.user = User.objects.create(username='renderer')
+
+    def make_links(self, count):
+        for n in range(count):
+            Link(
+                user=self.user, url='http://example.com/%s' % n, title='Link %s' % n,
+                public=True, tags='tag%s common' % n,
+            ).save()
+
+    def index_queries(self, page_size):
+        with self.settings(LINKPILE_PAGE_SIZE=page_size):
+            self.client.get('/')  # warm the cached count
+            # but render every link again
+            cache.delete_many([
+                fragments.fragment_key(link, fclass)
+                for link in Link.objects.all()
+                for fclass in [fragments.STAFF, fragments.OTHERS]
+            ])
+            with CaptureQueriesContext(connection) as queries:
+                response = self.client.get('/')
+        self.assertEqual(len(response.context['links']), page_size)
+        return len(queries)
+
+    def test_constant_queries(self):
+        self.make_links(30)
+        self.assertEqual(self.index_queries(3), self.index_queries(30))
+
+    def test_tags_rendered(self):
+        self.make_links(2)
+        links = Link.objects.order_by('id')
+        html = ''.join(fragments.render_links(links))
+        self.assertIn('href="/tag0/">tag0</a>', html)
+        self.assertIn('href="/tag1/">tag1</a>', html)
+        self.assertIn('href="/common/">common</a>', html)
+        self.assertNotIn('href="%s"' % links[0].edit_url(), html)
+        staff = User.objects.create(username='staff', is_staff=True)
+        html = ''.join(fragments.render_links(links, staff))
+        self.assertIn('href="%s"' % links[0].edit_url(), html)
+
+
+class TestFragmentCache(TestCase):
+
+    def setUp(self):
+        cache.clear()
+        self.user = User.objects.create(username='cached')
+        self.link = Link(user=self.user, url='http://example.com/', title='Old', tags='one')
+        self.link.save()
+
+    def render(self):
+        return fragments.render_links(Link.objects.filter(id=self.link.id))[0]
+
+    def test_cached(self):
+        self.render()
+        links = list(Link.objects.filter(id=self.link.id))
+        with self.assertNumQueries(0):
+            fragments.render_links(links)
+
+    def test_save_invalidates(self):
+        self.assertIn('Old', self.render())
+        self.link.title = 'New'
+        self.link.save()
+        self.assertIn('New', self.render())
+
+    def test_tag_change_invalidates(self):
+        from tagging.models import Tag
+        self.assertIn('>one</a>', self.render())
+        Tag.objects.add_tag(self.link, 'two')
+        self.assertIn('>two</a>', self.render())
+
+    def test_delete(self):
+        self.render()
+        key = fragments.fragment_key(self.link, fragments.OTHERS)
+        self.assertIsNotNone(cache.get(key))
+        self.link.delete()
+        self.assertIsNone(cache.get(key))
@@ -0,0 +1,122 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+test_visibility
+------------
+
+Tests for `linkpile` permission filtering.
+"""
+
+from importlib import import_module
+from itertools import product
+
+from django.apps import apps
+from django.contrib.auth.models import AnonymousUser, User
+from django.db.models import Q
+from django.test import TestCase
+
+from linkpile.models import Link, VIEWER_CLASSES, filter_visible, viewer_class
+
+
+def old_can_view(link, user, family, friends):
+    """Link.can_view before the visibility column.
+    """
+    if not family and friends:
+        return False
+    if link.public: return True
+    if (link.friends and link.family) and ((user in friends) or (user in family)):
+        return True
+    if (link.friends and not link.family) and (user in friends) and (user not in family):
+        return True
+    if (link.family and not link.friends) and (user in family) and (user not in friends):
+        return True
+    if user.is_staff:
+        return True
+    return False
+
+def old_filter_visible(links, user):
+    """filter_by_user before the visibility column.
+    """
+    if user.is_authenticated and user.is_staff:
+        return links
+    if user.is_authenticated:
+        return links.filter(Q(public=1) | Q(friends=1) | Q(family=1))
+    return links.filter(public=1)
+
+
+class TestVisibility(TestCase):
+
+    def setUp(self):
+        self.owner = User.objects.create(username='owner', is_staff=True)
+        self.member = User.objects.create(username='member')
+        self.friend = User.objects.create(username='friend')
+        self.relative = User.objects.create(username='relative')
+        self.users = [AnonymousUser(), self.member, self.friend, self.relative, self.owner]
+        self.links = []
+        for public,friends,family in product([False, True], repeat=3):
+            link = Link(
+                user=self.owner, url='http://example.com/%s%s%s' % (public, friends, family),
+                title='link', public=public, friends=friends, family=family,
+            )
+            link.save()
+            self.links.append(link)
+
+    def ids(self, links):
+        return sorted(links.values_list('id', flat=True))
+
+    def test_visibility_column(self):
+        self.assertEqual(
+            sorted(Link.objects.values_list('visibility', flat=True)), list(range(8))
+        )
+        link = self.links[0]
+        link.public = True
+        link.save()
+        self.assertEqual(Link.objects.get(id=link.id).visibility, 1)
+
+    def test_backfill(self):
+        Link.objects.update(visibility=0)
+        migration = import_module('linkpile.migrations.0007_link_visibility')
+        migration.backfill_visibility(apps, None)
+        self.assertEqual(
+            sorted(Link.objects.values_list('visibility', flat=True)), list(range(8))
+        )
+
+    def test_matches_filter_by_user(self):
+        for user in self.users:
+            self.assertEqual(
+                self.ids(Link.objects.visible_to(user)),
+                self.ids(old_filter_visible(Link.objects.all(), user)),
+            )
+            self.assertEqual(
+                self.ids(Link.objects.visible_to(viewer_class(user))),
+                self.ids(filter_visible(Link.objects.all(), user)),
+            )
+
+    def test_matches_visible_to_class(self):
+        for vclass in VIEWER_CLASSES:
+            visible = set(Link.objects.visible_to(vclass).values_list('id', flat=True))
+            for link in self.links:
+                self.assertEqual(link.id in visible, link.visible_to_class(vclass))
+
+    def test_matches_can_view(self):
+        groups = [
+            ([], []),
+            ([self.relative], [self.friend]),
+            ([self.relative, self.member], [self.friend, self.member]),
+            ([], [self.friend]),
+        ]
+        for link in self.links:
+            for user in self.users[1:]:
+                for family,friends in groups:
+                    self.assertEqual(
+                        link.can_view(user, family, friends),
+                        old_can_view(link, user, family, friends),
+                    )
+
+    def test_single_predicate(self):
+        where = str(Link.objects.visible_to(None).query).split(' WHERE ')[1]
+        self.assertIn('"visibility" IN (1, 3, 5, 7)', where)
+        self.assertNotIn('"public"', where)
+        self.assertEqual(str(Link.objects.visible_to(self.owner).query),
+                         str(Link.objects.all().query))